@@ -0,0 +1,128 @@
+"""Deterministic synthetic catalogue for the benchmarks.
+
+    python -m benchmarks.generate_data --authors 10000 --books 1000000 --seed 42 data/bench.sqlite
+
+The same counts and seed always produce the same database, so timings taken on different
+commits are measured against identical data.
+"""
+import os
+import random
+import sqlite3
+import time
+
+import click
+from flask import Flask
+from flask_migrate import Migrate, upgrade
+
+from data_models import db
+from helpers.author_names import normalize_author_name
+from helpers.search_index import include_in_migrations, init_search_index
+
+MIGRATIONS_DIRECTORY = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'migrations')
+
+FIRST_NAMES = ['Ada', 'Agatha', 'Albert', 'Alice', 'Anna', 'Boris', 'Carlos', 'Chimamanda', 'Clara', 'Daniel',
+               'Elena', 'Emile', 'Fatima', 'Frida', 'George', 'Haruki', 'Ines', 'Isabel', 'Jane', 'Jorge',
+               'Karl', 'Leo', 'Lucia', 'Mary', 'Miguel', 'Nadia', 'Orhan', 'Paulo', 'Rosa', 'Toni', 'Umberto',
+               'Virginia', 'Wole', 'Yuki', 'Zadie']
+LAST_NAMES = ['Achebe', 'Allende', 'Austen', 'Borges', 'Bronte', 'Calvino', 'Christie', 'Coelho', 'Eco',
+              'Ferrante', 'Garcia', 'Hugo', 'Ishiguro', 'Kafka', 'Lispector', 'Mann', 'Morrison', 'Murakami',
+              'Nabokov', 'Orwell', 'Pamuk', 'Pessoa', 'Rowling', 'Saramago', 'Shelley', 'Smith', 'Tolkien',
+              'Tolstoy', 'Twain', 'Woolf', 'Yoshimoto', 'Zola']
+TITLE_WORDS = ['Shadow', 'River', 'Garden', 'Night', 'Empire', 'Memory', 'Silence', 'Winter', 'Storm', 'Letters',
+               'City', 'Island', 'Mirror', 'Journey', 'Secret', 'Fire', 'Glass', 'House', 'Ocean', 'Song',
+               'Stone', 'Summer', 'Light', 'Road', 'Forest', 'Dream', 'Clock', 'Harbour', 'Mountain', 'Library',
+               'Wolf', 'Crown', 'Lantern', 'Desert', 'Feather', 'Bridge', 'Orchard', 'Tide', 'Ember', 'Atlas']
+TITLE_PATTERNS = ['The {0} of {1}', '{0} and {1}', 'A {0} in the {1}', 'The Last {0}', '{0}s of the {1}',
+                  'Beyond the {0}', 'The {0} {1}']
+
+CHUNK_SIZE = 50000
+
+
+def generate_catalogue(path, authors=1000, books=100000, seed=42, progress=None):
+    """Create a fresh, fully migrated library database filled with synthetic authors and books.
+
+    Args:
+        path (str): SQLite file to create, it is replaced if it exists.
+        authors (int): Number of authors.
+        books (int): Number of books, spread unevenly over the authors.
+        seed (int): Seed of the random generator, the same seed gives the same catalogue.
+        progress (callable): Called with the number of books written so far after each chunk.
+    """
+    for suffix in ('', '-wal', '-shm'):
+        if os.path.exists(path + suffix):
+            os.remove(path + suffix)
+
+    # Same schema as the application, straight from the migrations
+    app = Flask(__name__)
+    app.config['SQLALCHEMY_DATABASE_URI'] = f'sqlite:///{os.path.abspath(path)}'
+    db.init_app(app)
+    Migrate(app, db, directory=MIGRATIONS_DIRECTORY, render_as_batch=True, include_object=include_in_migrations)
+    with app.app_context():
+        upgrade(directory=MIGRATIONS_DIRECTORY)
+        db.engine.dispose()
+
+    randomizer = random.Random(seed)
+    connection = sqlite3.connect(path)
+    # Nothing else is reading the file while it is generated
+    connection.execute('PRAGMA journal_mode = OFF')
+    connection.execute('PRAGMA synchronous = OFF')
+    with connection:
+        connection.executemany('INSERT INTO author (id, name, name_key, birth_date, date_of_death) '
+                               'VALUES (?, ?, ?, ?, ?)',
+                               (_author_row(randomizer, author_id) for author_id in range(1, authors + 1)))
+
+    written = 0
+    while written < books:
+        size = min(CHUNK_SIZE, books - written)
+        rows = [_book_row(randomizer, book_id, authors) for book_id in range(written + 1, written + size + 1)]
+        with connection:
+            connection.executemany('INSERT INTO book (id, isbn, title, publication_year, author_id, cover, rating, '
+                                   'additional_info) VALUES (?, ?, ?, ?, ?, ?, ?, ?)', rows)
+        written += size
+        if progress:
+            progress(written)
+    connection.execute('ANALYZE')
+    connection.close()
+
+    with app.app_context():
+        init_search_index()
+        db.engine.dispose()
+
+
+def _author_row(randomizer, author_id):
+    name = f'{randomizer.choice(FIRST_NAMES)} {randomizer.choice(LAST_NAMES)} {author_id}'
+    born = randomizer.randint(1800, 1990)
+    birth_date = f'{born}-{randomizer.randint(1, 12):02d}-{randomizer.randint(1, 28):02d}'
+    date_of_death = None
+    if born < 1940 and randomizer.random() < 0.8:
+        date_of_death = f'{born + randomizer.randint(30, 95)}-{randomizer.randint(1, 12):02d}-01'
+    return author_id, name, normalize_author_name(name), birth_date, date_of_death
+
+
+def _book_row(randomizer, book_id, authors):
+    # A few prolific authors and a long tail, like a real catalogue
+    author_id = min(int(randomizer.paretovariate(1.2)), authors) if randomizer.random() < 0.3 \
+        else randomizer.randint(1, authors)
+    words = randomizer.sample(TITLE_WORDS, 2)
+    title = f'{randomizer.choice(TITLE_PATTERNS).format(*words)} {book_id}'
+    isbn = f'978{book_id:010d}' if randomizer.random() < 0.9 else ''
+    cover = f'https://covers.example.org/{book_id}.jpg' if randomizer.random() < 0.7 else None
+    rating = round(randomizer.uniform(1, 5), 1) if randomizer.random() < 0.8 else None
+    additional_info = f'https://books.example.org/{book_id}' if randomizer.random() < 0.5 else None
+    return book_id, isbn, title, randomizer.randint(1800, 2023), author_id, cover, rating, additional_info
+
+
+@click.command()
+@click.argument('path', default='data/bench.sqlite')
+@click.option('--authors', default=1000, show_default=True)
+@click.option('--books', default=100000, show_default=True)
+@click.option('--seed', default=42, show_default=True)
+def main(path, authors, books, seed):
+    """Write a synthetic catalogue to PATH."""
+    started = time.perf_counter()
+    generate_catalogue(path, authors, books, seed, progress=lambda written: click.echo(f'{written} books written'))
+    click.echo(f'Generated {authors} authors and {books} books in {time.perf_counter() - started:.1f}s.')
+
+
+if __name__ == '__main__':
+    main()
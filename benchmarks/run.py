@@ -0,0 +1,368 @@
+"""Micro and route benchmarks of the library app, with machine-readable results.
+
+    python -m benchmarks.run --books 100000 --output benchmarks/results/after.json
+    python -m benchmarks.run --books 100000 --compare benchmarks/results/before.json
+
+Every run works on a copy of a generated catalogue (see generate_data.py, cached in
+benchmarks/data/) and answers external lookups from the local stub APIs (stub_api.py), so
+runs on different commits are comparable. Results hold the min, median, mean and p95 time
+of every benchmark, together with the commit and environment they were measured on.
+"""
+import json
+import os
+import platform
+import shutil
+import sqlite3
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from urllib.parse import parse_qs, urlsplit
+
+import click
+from alembic.script import ScriptDirectory
+
+from benchmarks.generate_data import MIGRATIONS_DIRECTORY, generate_catalogue
+from benchmarks.stub_api import start_stub_server
+
+BENCHMARK_DIRECTORY = os.path.dirname(os.path.abspath(__file__))
+PROJECT_DIRECTORY = os.path.dirname(BENCHMARK_DIRECTORY)
+DATA_DIRECTORY = os.path.join(BENCHMARK_DIRECTORY, 'data')
+
+SEARCH_TERMS = ['garden', 'shadow river', 'the last wolf', 'tolkien']
+# Misspelled searches, answered by the fuzzy index
+FUZZY_TERMS = ['gardn', 'shadw rivr', 'the lst wolf', 'tolkein']
+# Partly typed titles and author names, completed by the suggest index
+SUGGEST_PREFIXES = ['g', 'sha', 'the last', 'tolk']
+
+# Run in a new interpreter by startup_benchmarks(), prints the import and first request times
+STARTUP_SCRIPT = '''
+import json, time
+started = time.perf_counter()
+from app import app
+imported = time.perf_counter()
+app.config['ENFORCE_QUERY_BUDGETS'] = False
+status = app.test_client().get('/?sort=title').status_code
+print(json.dumps({'import': imported - started, 'first_request': time.perf_counter() - imported, 'status': status}))
+'''
+
+
+def measure(function, repeat, warmup=1):
+    """Time repeat calls of function after warmup untimed calls.
+
+    Returns:
+        A dict with the runs and the min, median, mean, p95 and standard deviation in seconds.
+    """
+    for _ in range(warmup):
+        function()
+    timings = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        function()
+        timings.append(time.perf_counter() - started)
+    return summarize(timings)
+
+
+def summarize(timings):
+    """Return the runs and the min, median, mean, p95 and standard deviation of a list of timings."""
+    timings = sorted(timings)
+    return {
+        'runs': len(timings),
+        'min': timings[0],
+        'median': statistics.median(timings),
+        'mean': statistics.fmean(timings),
+        'p95': timings[min(len(timings) - 1, int(len(timings) * 0.95))],
+        'stdev': statistics.stdev(timings) if len(timings) > 1 else 0.0,
+    }
+
+
+def micro_benchmarks(app, repeat):
+    """Search, sort, render and serialization code called directly, without the HTTP layer."""
+    from views.api import BOOK_FIELDS, dumps
+    from data_models import db, Book
+    from helpers.export import iter_catalogue_rows, iter_csv, iter_jsonl
+    from helpers.fuzzy_index import fuzzy_search
+    from helpers.helper_functions import SORT_OPTIONS, books_page_query, format_cursor, get_books_page, \
+        search_books
+    from helpers.page_cache import card_cache, render_book_grid
+    from helpers.suggest_index import suggest
+
+    results = {}
+    with app.test_request_context():
+        for term in SEARCH_TERMS:
+            results[f'search.{term}'] = measure(lambda: search_books(term)[0].limit(50).all(), repeat)
+            results[f'search_page.{term}'] = measure(lambda: get_books_page(term), repeat)
+        for term in FUZZY_TERMS:
+            results[f'fuzzy.{term}'] = measure(lambda: fuzzy_search(term), repeat)
+            results[f'fuzzy_page.{term}'] = measure(lambda: get_books_page(term, fuzzy=True), repeat)
+        for prefix in SUGGEST_PREFIXES:
+            results[f'suggest.{prefix}'] = measure(lambda: suggest(prefix), repeat)
+
+        book_count = db.session.query(db.func.count(Book.id)).scalar()
+        for sort_by in SORT_OPTIONS:
+            results[f'sort.{sort_by}.first_page'] = measure(lambda: get_books_page(None, sort_by), repeat)
+            # A page from the middle of the catalogue costs the same as the first one with keyset paging
+            book, _, key = books_page_query(None, sort_by, None, 1).offset(book_count // 2).first()
+            cursor = format_cursor(key, book.id)
+            results[f'sort.{sort_by}.middle_page'] = measure(lambda: get_books_page(None, sort_by, cursor), repeat)
+
+        page, _ = get_books_page(None, 'title', limit=200)
+        payload = {'data': [{name: read(book, author) for name, read in BOOK_FIELDS.items()}
+                            for book, author in page]}
+        results['serialize.api_page_200'] = measure(lambda: dumps(payload), repeat)
+        results['serialize.stdlib_json_page_200'] = measure(
+            lambda: json.dumps(payload, separators=(',', ':'), ensure_ascii=False), repeat)
+
+        rows = [row for _, row in zip(range(5000), iter_catalogue_rows())]
+        results['serialize.csv_5000'] = measure(lambda: ''.join(iter_csv(rows)), repeat)
+        results['serialize.jsonl_5000'] = measure(lambda: ''.join(iter_jsonl(rows)), repeat)
+
+        def render_cold():
+            card_cache.clear()
+            render_book_grid(None, lambda: (page[:50], None))
+
+        results['render.book_grid_50_cold'] = measure(render_cold, repeat)
+        results['render.book_grid_50_cards_cached'] = measure(
+            lambda: render_book_grid(None, lambda: (page[:50], None)), repeat)
+    return results
+
+
+def route_benchmarks(app, repeat):
+    """End-to-end requests through Flask's test client."""
+    from helpers.page_cache import card_cache, grid_cache
+    from helpers.response_cache import get_response_cache
+
+    client = app.test_client()
+    results = {}
+
+    def home_uncached():
+        grid_cache.clear()
+        card_cache.clear()
+        _check(client.get('/?sort=title'))
+
+    results['route.home'] = measure(lambda: _check(client.get('/?sort=title')), repeat)
+    results['route.home_uncached'] = measure(home_uncached, repeat)
+    results['route.home_rating_uncached'] = measure(
+        lambda: (grid_cache.clear(), _check(client.get('/?sort=rating'))), repeat)
+    etag = client.get('/?sort=title').headers.get('ETag')
+    results['route.home_not_modified'] = measure(
+        lambda: _check(client.get('/?sort=title', headers={'If-None-Match': etag}), 304), repeat)
+
+    for term in SEARCH_TERMS[:2]:
+        results[f'route.search_query.{term}'] = measure(
+            lambda: _check(client.post('/', data={'search_query': term})), repeat)
+    results['route.suggest'] = measure(lambda: _check(client.get('/api/v1/suggest?q=sha')), repeat)
+
+    book_ids = iter(range(1, 10 ** 9))
+    results['route.book_details'] = measure(lambda: _check(client.get(f'/book/{next(book_ids)}')), repeat)
+    results['route.api_books'] = measure(lambda: _check(client.get('/api/v1/books?sort=rating&limit=50')), repeat)
+    results['route.stats'] = measure(lambda: _check(client.get('/stats')), repeat)
+
+    # Every run deletes another book, from the end of the catalogue so the pages above are unaffected
+    from data_models import db, Author, Book
+    with app.app_context():
+        last_id = db.session.query(db.func.max(Book.id)).scalar()
+    delete_ids = iter(range(last_id, 0, -1))
+    results['route.delete_book'] = measure(
+        lambda: _check(client.post(f'/book/{next(delete_ids)}/delete'), 302), repeat)
+    # A page of books ticked on the home page, then whole authors (marked as deleted, purged by the job workers)
+    results['route.delete_books'] = measure(
+        lambda: _check(client.post('/books/delete', data={'book_ids': [next(delete_ids) for _ in range(50)]}), 302),
+        repeat)
+    with app.app_context():
+        last_author_id = db.session.query(db.func.max(Author.id)).scalar()
+    delete_author_ids = iter(range(last_author_id, 0, -1))
+    results['route.delete_author'] = measure(
+        lambda: _check(client.post(f'/author/{next(delete_author_ids)}/delete'), 302), repeat)
+
+    # External lookups against the stub APIs, with a cold response cache every time
+    queries = (f'benchmark query {number}' for number in range(10 ** 9))
+
+    def queue_search():
+        response = _check(client.post('/search', data={'search_query': next(queries)}), 302)
+        return parse_qs(urlsplit(response.location).query)['job'][0]
+
+    def wait_for_job(job_id):
+        while _check(client.get(f'/jobs/{job_id}')).json['state'] in ('queued', 'running'):
+            time.sleep(0.001)
+
+    def external_search():
+        get_response_cache().clear()
+        # Until the background lookup has finished, as a user waiting for the result
+        wait_for_job(queue_search())
+
+    results['route.external_search'] = measure(external_search, repeat)
+    # The request itself, which only queues the lookup
+    job_ids = []
+    results['route.external_search_queue'] = measure(lambda: job_ids.append(queue_search()), repeat)
+    wait_for_job(job_ids[-1])
+    return results
+
+
+def startup_benchmarks(work_directory, repeat):
+    """Cold starts: importing the app (creating it) and its first request, each run in a new interpreter.
+
+    The warm runs share a template bytecode cache filled by the warmup run, as after a deploy
+    that ran `flask precompile-templates`, the cold runs start from an empty one every time.
+    """
+    def start(template_cache_directory):
+        environment = dict(os.environ, TEMPLATE_CACHE_DIRECTORY=template_cache_directory, JOB_WORKERS='0')
+        output = subprocess.run([sys.executable, '-c', STARTUP_SCRIPT], cwd=PROJECT_DIRECTORY, env=environment,
+                                capture_output=True, text=True, check=True).stdout
+        timings = json.loads(output.splitlines()[-1])
+        if timings['status'] != 200:
+            raise RuntimeError(f"GET / answered {timings['status']} in a new process")
+        return timings
+
+    template_cache = os.path.join(work_directory, 'template_cache')
+    # Also saves the fuzzy index, which every later process loads instead of building it
+    start(template_cache)
+    warm = [start(template_cache) for _ in range(repeat)]
+    cold = []
+    for _ in range(repeat):
+        shutil.rmtree(template_cache, ignore_errors=True)
+        cold.append(start(template_cache))
+
+    return {
+        'startup.import_app': summarize([timings['import'] for timings in warm]),
+        'startup.first_request.home': summarize([timings['first_request'] for timings in warm]),
+        'startup.first_request.home_cold_template_cache': summarize([timings['first_request'] for timings in cold]),
+    }
+
+
+def run_benchmarks(authors, books, seed, repeat, groups):
+    """Prepare the data, the stub APIs and the app, then run the benchmark groups."""
+    os.makedirs(DATA_DIRECTORY, exist_ok=True)
+    # Catalogues generated before a schema migration are not reused
+    schema = ScriptDirectory(MIGRATIONS_DIRECTORY).get_current_head()
+    source = os.path.join(DATA_DIRECTORY, f'catalogue-{authors}-{books}-{seed}-{schema}.sqlite')
+    if not os.path.exists(source):
+        click.echo(f'Generating {books} books by {authors} authors (seed {seed})...')
+        generate_catalogue(source, authors, books, seed)
+
+    work_directory = tempfile.mkdtemp(prefix='library-bench-')
+    database = os.path.join(work_directory, 'library.sqlite')
+    shutil.copyfile(source, database)
+    server, hapi_books_url, book_finder_url = start_stub_server()
+
+    # The app reads its settings when it is imported, so they are set first
+    os.environ.update({
+        'DATABASE': f'sqlite:///{database}',
+        'SECRETKEY': os.getenv('SECRETKEY', 'benchmark'),
+        'API_KEY': 'benchmark',
+        'HAPI_BOOKS_URL': hapi_books_url,
+        'BOOK_FINDER_URL': book_finder_url,
+        'HAPI_BOOKS_RATE': '100000',
+        'BOOK_FINDER_RATE': '100000',
+        'API_CACHE_PATH': os.path.join(work_directory, 'api_cache.sqlite'),
+        'FUZZY_INDEX_PATH': os.path.join(work_directory, 'fuzzy_index.json'),
+    })
+    try:
+        results = {}
+        if 'startup' in groups:
+            # Measured before this process imports the app, the first new one finds the database as generated
+            results.update(startup_benchmarks(work_directory, repeat))
+
+        from app import app
+        app.config['ENFORCE_QUERY_BUDGETS'] = False
+
+        if 'micro' in groups:
+            results.update(micro_benchmarks(app, repeat))
+        if 'routes' in groups:
+            results.update(route_benchmarks(app, repeat))
+    finally:
+        server.shutdown()
+        shutil.rmtree(work_directory, ignore_errors=True)
+
+    return {
+        'meta': {
+            'commit': _git('rev-parse', 'HEAD'),
+            'dirty': bool(_git('status', '--porcelain', '--untracked-files=no')),
+            'timestamp': time.strftime('%Y-%m-%dT%H:%M:%S%z'),
+            'python': platform.python_version(),
+            'sqlite': sqlite3.sqlite_version,
+            'platform': platform.platform(),
+            'authors': authors,
+            'books': books,
+            'seed': seed,
+            'repeat': repeat,
+        },
+        'results': results,
+    }
+
+
+def compare_results(baseline, current, threshold):
+    """Compare the median times of two result files.
+
+    Returns:
+        A list of (name, baseline median, current median, ratio, regressed) for the
+        benchmarks present in both, a ratio above 1 + threshold is a regression.
+    """
+    comparison = []
+    for name, result in current['results'].items():
+        if name not in baseline['results']:
+            continue
+        before, after = baseline['results'][name]['median'], result['median']
+        ratio = after / before if before else float('inf')
+        comparison.append((name, before, after, ratio, ratio > 1 + threshold))
+    return comparison
+
+
+def _check(response, status=200):
+    if response.status_code != status:
+        raise RuntimeError(f'{response.request.method} {response.request.path} answered {response.status_code}')
+    return response
+
+
+def _git(*arguments):
+    try:
+        return subprocess.run(['git', *arguments], cwd=BENCHMARK_DIRECTORY, capture_output=True, text=True,
+                              check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+@click.command()
+@click.option('--authors', default=1000, show_default=True)
+@click.option('--books', default=100000, show_default=True)
+@click.option('--seed', default=42, show_default=True)
+@click.option('--repeat', default=20, show_default=True, help='Timed runs of every benchmark.')
+@click.option('--group', 'groups', multiple=True, type=click.Choice(['micro', 'routes', 'startup']),
+              default=('micro', 'routes', 'startup'), show_default=True)
+@click.option('--output', type=click.Path(dir_okay=False), help='Write the results to this JSON file.')
+@click.option('--compare', 'baseline_path', type=click.Path(exists=True, dir_okay=False),
+              help='Results of an earlier run to compare with.')
+@click.option('--threshold', default=0.1, show_default=True, help='Slowdown counted as a regression (0.1 = 10%).')
+@click.option('--fail-on-regression', is_flag=True, help='Exit with status 1 if any benchmark regressed.')
+def main(authors, books, seed, repeat, groups, output, baseline_path, threshold, fail_on_regression):
+    """Run the benchmarks and print the median time of each one."""
+    report = run_benchmarks(authors, books, seed, repeat, groups)
+
+    for name, result in report['results'].items():
+        click.echo(f"{name:45} median {result['median'] * 1000:9.3f} ms   p95 {result['p95'] * 1000:9.3f} ms")
+
+    if output:
+        os.makedirs(os.path.dirname(os.path.abspath(output)), exist_ok=True)
+        with open(output, 'w') as results_file:
+            json.dump(report, results_file, indent=2)
+        click.echo(f'Results written to {output}')
+
+    if baseline_path:
+        with open(baseline_path) as baseline_file:
+            baseline = json.load(baseline_file)
+        if (baseline['meta']['authors'], baseline['meta']['books'], baseline['meta']['seed']) != (authors, books, seed):
+            click.echo('Warning: the baseline was measured on a different catalogue.', err=True)
+
+        regressions = 0
+        click.echo(f"\nCompared with {baseline_path} (commit {baseline['meta'].get('commit')}):")
+        for name, before, after, ratio, regressed in compare_results(baseline, report, threshold):
+            regressions += regressed
+            click.echo(f"{'SLOWER' if regressed else '      '} {name:45} {before * 1000:9.3f} ms -> "
+                       f"{after * 1000:9.3f} ms  ({ratio:.2f}x)")
+        if regressions and fail_on_regression:
+            raise SystemExit(1)
+
+
+if __name__ == '__main__':
+    main()
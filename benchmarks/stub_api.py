@@ -0,0 +1,100 @@
+"""Local stand-in for the HAPI Books and Book Finder APIs.
+
+    python -m benchmarks.stub_api --port 8765 --latency 0.05
+
+then run the app with HAPI_BOOKS_URL=http://127.0.0.1:8765/hapi and
+BOOK_FINDER_URL=http://127.0.0.1:8765/book-finder. Answers are derived from the query,
+so repeated runs get identical responses and no RapidAPI quota is used.
+"""
+import hashlib
+import json
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, unquote_plus, urlsplit
+
+import click
+
+HAPI_PREFIX = '/hapi'
+BOOK_FINDER_PREFIX = '/book-finder'
+
+# Every search finds these editions of one book, like the real API often does
+EDITIONS = ('', 'Illustrated Edition', 'Anniversary Edition', 'Abridged', 'Collected Works')
+
+
+class StubAPIHandler(BaseHTTPRequestHandler):
+
+    def do_GET(self):
+        # Seconds every answer is delayed, to mimic the latency of the real APIs
+        time.sleep(self.server.latency)
+        url = urlsplit(self.path)
+
+        if url.path.startswith(f'{HAPI_PREFIX}/search/'):
+            search = unquote_plus(url.path[len(f'{HAPI_PREFIX}/search/'):])
+            self._send_json([_hapi_book(search, edition) for edition in EDITIONS] if search.strip() else [])
+        elif url.path == f'{BOOK_FINDER_PREFIX}/api/search':
+            query = parse_qs(url.query)
+            title = query.get('title', [''])[0]
+            self._send_json({'results': [{'published_works': [{'isbn': _fake_isbn(title)}]}]})
+        else:
+            self._send_json({'message': 'Not found'}, 404)
+
+    def log_message(self, format, *args):
+        # Keep benchmark output readable
+        pass
+
+    def _send_json(self, data, status=200):
+        body = json.dumps(data).encode('utf-8')
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+
+def start_stub_server(port=0, latency=0.0):
+    """Serve the stub APIs from a background thread.
+
+    Returns:
+        A tuple (server, hapi_books_url, book_finder_url), call server.shutdown() to stop it.
+    """
+    server = ThreadingHTTPServer(('127.0.0.1', port), StubAPIHandler)
+    server.latency = latency
+    threading.Thread(target=server.serve_forever, name='stub-api', daemon=True).start()
+    base_url = f'http://127.0.0.1:{server.server_address[1]}'
+    return server, f'{base_url}{HAPI_PREFIX}', f'{base_url}{BOOK_FINDER_PREFIX}'
+
+
+def _hapi_book(search, edition=''):
+    digest = int(hashlib.sha1(search.lower().encode('utf-8')).hexdigest(), 16)
+    return {
+        'name': f'{search.title()} ({edition})' if edition else search.title(),
+        'year': 1900 + digest % 124,
+        'authors': [f'Stub Author {digest % 997}'],
+        'cover': f'https://covers.example.org/stub/{digest % 100000}.jpg',
+        'url': f'https://books.example.org/stub/{digest % 100000}',
+    }
+
+
+def _fake_isbn(title):
+    digest = int(hashlib.sha1(title.lower().encode('utf-8')).hexdigest(), 16)
+    return f'979{digest % 10 ** 10:010d}'
+
+
+@click.command()
+@click.option('--port', default=8765, show_default=True)
+@click.option('--latency', default=0.0, show_default=True, help='Seconds added to every response.')
+def main(port, latency):
+    """Serve the stub HAPI Books and Book Finder APIs until interrupted."""
+    server, hapi_books_url, book_finder_url = start_stub_server(port, latency)
+    click.echo(f'HAPI_BOOKS_URL={hapi_books_url}')
+    click.echo(f'BOOK_FINDER_URL={book_finder_url}')
+    try:
+        while True:
+            time.sleep(3600)
+    except KeyboardInterrupt:
+        server.shutdown()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,47 @@
+"""URL rules of the library's pages and JSON API, grouped in blueprints.
+
+Only the rules are declared here: the views of a blueprint are imported from its module in
+views/ by the first request one of them handles (see LazyBlueprint), so creating the app does
+not load the external HTTP stack or the bulk import code.
+"""
+from sqlalchemy.exc import SQLAlchemyError
+
+from helpers.lazy_views import LazyBlueprint
+from my_custom_exceptions import BadRequest
+
+# Listing, searching, adding, updating and deleting books, with their import, export, statistics and covers
+catalogue = LazyBlueprint('catalogue', __name__, 'views.catalogue')
+catalogue.lazy_route('/', 'home', methods=['GET', 'POST'])
+catalogue.lazy_route('/add_book', 'add_book', methods=['GET', 'POST'])
+catalogue.lazy_route('/book/<int:book_id>', 'book_details')
+catalogue.lazy_route('/book/<int:book_id>/update', 'update_book', methods=['GET', 'POST'])
+catalogue.lazy_route('/book/<int:book_id>/delete', 'delete_book', methods=['POST'])
+catalogue.lazy_route('/books/delete', 'delete_books', methods=['POST'])
+catalogue.lazy_route('/import', 'import_books_upload', methods=['POST'])
+catalogue.lazy_route('/export', 'export_books')
+catalogue.lazy_route('/stats', 'catalogue_stats')
+catalogue.lazy_route('/covers/<int:book_id>', 'cover')
+
+authors = LazyBlueprint('authors', __name__, 'views.authors')
+authors.lazy_route('/add_author', 'add_author', methods=['GET', 'POST'])
+authors.lazy_route('/author/<int:author_id>/delete', 'delete_author', methods=['POST'])
+
+# Lookups and enrichment through the HAPI Books and Book Finder APIs
+external_search = LazyBlueprint('external_search', __name__, 'views.external_search')
+external_search.lazy_route('/search', 'search', methods=['GET', 'POST'])
+external_search.lazy_route('/search/add_book', 'add_searched_data', methods=['POST'])
+external_search.lazy_route('/enrichment', 'start_book_enrichment', methods=['POST'])
+external_search.lazy_route('/enrichment/status', 'book_enrichment_status')
+
+# The JSON API, its errors are answered in JSON too
+api = LazyBlueprint('api_v1', __name__, 'views.api', url_prefix='/api/v1')
+api.lazy_route('/books', 'books')
+api.lazy_route('/books/<int:book_id>', 'book')
+api.lazy_route('/authors', 'authors')
+api.lazy_route('/stats', 'stats')
+api.lazy_route('/suggest', 'suggestions')
+api.lazy_errorhandler(BadRequest, 'bad_request')
+api.lazy_errorhandler(404, 'not_found')
+api.lazy_errorhandler(SQLAlchemyError, 'database_error')
+
+BLUEPRINTS = (catalogue, authors, external_search, api)
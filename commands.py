@@ -0,0 +1,186 @@
+import sys
+import time
+
+import click
+from flask import current_app
+from flask.cli import with_appcontext
+
+from helpers.author_merge import merge_duplicate_authors
+from helpers.bulk_import import DEFAULT_CHUNK_SIZE, guess_format, import_books, iter_rows
+from helpers.catalogue_stats import rebuild_catalogue_stats
+from helpers.cover_cache import Image, queue_missing_covers
+from helpers.enrichment import reset_checkpoint, run_enrichment
+from helpers.export import iter_export
+from helpers.fuzzy_index import rebuild_fuzzy_index
+from helpers.job_queue import JobQueue
+from helpers.query_plans import check_query_plans
+from helpers.response_cache import get_response_cache
+from helpers.search_index import rebuild_search_index
+from helpers.soft_delete import PURGE_CHUNK_SIZE, purge_deleted
+from helpers.template_cache import precompile_templates
+
+# CLI commands of the library, added to the apps built by the flask command (see init_commands())
+_commands = []
+
+
+def command(name):
+    """Register a CLI command (run inside an app context), added to apps by init_commands()."""
+    def decorator(function):
+        cli_command = click.command(name)(with_appcontext(function))
+        _commands.append(cli_command)
+        return cli_command
+    return decorator
+
+
+def init_commands(app):
+    """Add every CLI command of the library to the app."""
+    for cli_command in _commands:
+        app.cli.add_command(cli_command)
+
+
+@command('rebuild-search-index')
+def rebuild_search_index_command():
+    """Re-index every book in the full-text search table."""
+    if rebuild_search_index():
+        click.echo('Search index rebuilt.')
+    else:
+        click.echo('Full-text search is not available on this database, searches use ILIKE matching.')
+
+
+@command('rebuild-fuzzy-index')
+def rebuild_fuzzy_index_command():
+    """Rebuild the trigram index behind typo-tolerant searches and save it."""
+    click.echo(f'Fuzzy search index rebuilt with {rebuild_fuzzy_index()} books.')
+
+
+@command('rebuild-stats')
+def rebuild_stats_command():
+    """Recompute the per-author and per-year statistics from the whole catalogue."""
+    authors, years = rebuild_catalogue_stats()
+    click.echo(f'Statistics rebuilt for {authors} authors and {years} publication years.')
+
+
+@command('purge-deleted')
+@click.option('--chunk-size', default=PURGE_CHUNK_SIZE, show_default=True, help='Rows deleted per transaction.')
+def purge_deleted_command(chunk_size):
+    """Remove the deleted books and authors from the database now, instead of waiting for the background purge."""
+    books, authors = purge_deleted(chunk_size)
+    click.echo(f'Purged {books} books and {authors} authors.')
+
+
+@command('merge-duplicate-authors')
+@click.option('--dry-run', is_flag=True, help='List the duplicates without merging them.')
+@click.option('--chunk-size', default=500, show_default=True, help='Duplicate groups merged per transaction.')
+def merge_duplicate_authors_command(dry_run, chunk_size):
+    """Merge authors whose names only differ in case, accents, punctuation or spacing."""
+    groups, removed, moved = merge_duplicate_authors(chunk_size, dry_run)
+    if dry_run:
+        for group in groups:
+            click.echo(' = '.join(f'{name} (#{author_id})' for author_id, name in group))
+        click.echo(f'{removed} duplicate authors in {len(groups)} groups.')
+    else:
+        click.echo(f'Merged {removed} duplicate authors into {len(groups)} authors, {moved} books moved.')
+
+
+@command('clear-api-cache')
+def clear_api_cache_command():
+    """Drop every cached HAPI Books and Book Finder response."""
+    get_response_cache().clear()
+    click.echo('API response cache cleared.')
+
+
+@command('import-books')
+@click.argument('path', type=click.Path(exists=True, dir_okay=False))
+@click.option('--format', 'file_format', type=click.Choice(['csv', 'jsonl']),
+              help='File format, guessed from the file extension by default.')
+@click.option('--chunk-size', default=DEFAULT_CHUNK_SIZE, show_default=True, help='Rows per transaction.')
+def import_books_command(path, file_format, chunk_size):
+    """Bulk import books from a CSV (with a header row) or JSON Lines file."""
+    def show_progress(report):
+        click.echo(f'{report.imported} rows imported, {len(report.errors)} failed '
+                   f'({report.rows_per_second:.0f} rows/s)')
+
+    with open(path, encoding='utf-8-sig', newline='') as source:
+        report = import_books(iter_rows(source, file_format or guess_format(path)), chunk_size, show_progress)
+
+    for line_number, message in report.errors:
+        click.echo(f'line {line_number}: {message}', err=True)
+    click.echo(f'Imported {report.imported} books in {report.elapsed:.1f}s ({report.rows_per_second:.0f} rows/s), '
+               f'{len(report.errors)} rows failed.')
+
+
+@command('export-books')
+@click.argument('output', default='-')
+@click.option('--format', 'file_format', type=click.Choice(['csv', 'jsonl']), default='csv', show_default=True)
+@click.option('--gzip', 'compress', is_flag=True, help='Gzip the output.')
+def export_books_command(output, file_format, compress):
+    """Stream the whole catalogue to OUTPUT (a file path, or - for stdout)."""
+    chunks = iter_export(file_format, compress)
+    if output == '-':
+        for chunk in chunks:
+            sys.stdout.buffer.write(chunk)
+        sys.stdout.buffer.flush()
+        return
+    with open(output, 'wb') as destination:
+        for chunk in chunks:
+            destination.write(chunk)
+
+
+@command('enrich-books')
+@click.option('--workers', default=2, show_default=True, help='Concurrent external lookups (8 at most).')
+@click.option('--batch-size', default=20, show_default=True, help='Books written back per commit (200 at most).')
+@click.option('--limit', type=int, help='Stop after this many books.')
+@click.option('--reset', is_flag=True, help='Forget the checkpoint and start from the first book.')
+def enrich_books_command(workers, batch_size, limit, reset):
+    """Fill in missing ISBNs, covers and additional info from the external APIs."""
+    if reset:
+        reset_checkpoint()
+    status = run_enrichment(workers=workers, batch_size=batch_size, limit=limit)
+    click.echo(f"Processed {status['processed']} books: {status['enriched']} enriched, {status['failed']} failed.")
+    if status['checkpoint'] or status['failed_book_ids']:
+        click.echo(f"The next run resumes after book {status['checkpoint']} and retries "
+                   f"{len(status['failed_book_ids'])} failed books first.")
+
+
+@command('prefetch-covers')
+def prefetch_covers_command():
+    """Queue the download of every book cover that is not in the thumbnail cache yet."""
+    if Image is None:
+        raise click.ClickException('Pillow is not installed, covers cannot be resized: pip install -r requirements.txt')
+    click.echo(f'Queued {queue_missing_covers()} cover downloads, the job workers fetch them.')
+
+
+@command('run-jobs')
+@click.option('--workers', default=2, show_default=True, help='Jobs run at the same time.')
+def run_jobs_command(workers):
+    """Run queued background jobs until interrupted (for web processes started with JOB_WORKERS=0)."""
+    app = current_app._get_current_object()
+    queue = JobQueue(app, workers, app.extensions['job_queue'].handler_modules)
+    queue.start()
+    click.echo(f'Running jobs with {workers} workers, press Ctrl+C to stop.')
+    try:
+        while True:
+            time.sleep(1)
+    except KeyboardInterrupt:
+        click.echo('Stopping once the running jobs have finished...')
+        queue.stop()
+
+
+@command('check-query-plans')
+def check_query_plans_command():
+    """Check that the home, delete and lookup queries are served by the schema indexes."""
+    failures = 0
+    for description, passed, plan in check_query_plans():
+        click.echo(f"{'ok  ' if passed else 'FAIL'} {description}")
+        if not passed:
+            failures += 1
+            for line in plan:
+                click.echo(f'       {line}')
+    if failures:
+        raise SystemExit(1)
+
+
+@command('precompile-templates')
+def precompile_templates_command():
+    """Compile every template into the bytecode cache, so new processes render their first pages sooner."""
+    click.echo(f'Compiled {precompile_templates(current_app)} templates.')
@@ -1,13 +1,48 @@
+import os
+
 from flask_sqlalchemy import SQLAlchemy
+from sqlalchemy.ext.associationproxy import association_proxy
+from sqlalchemy.ext.orderinglist import ordering_list
+from sqlalchemy.orm import validates
+
+from helpers.author_names import normalize_author_name
+from helpers.read_replicas import RoutingSession
+
+# Reads made while handling a request go to a replica when DATABASE_REPLICAS is set
+db = SQLAlchemy(session_options={'class_': RoutingSession})
 
-db = SQLAlchemy()
+# Default loading strategy of Book.author ('select', 'joined', 'selectin', ...), routes that
+# always need the author ask for it explicitly with joinedload()
+BOOK_AUTHOR_LOADING = os.getenv('BOOK_AUTHOR_LOADING', 'select')
 
 
 class Author(db.Model):
+    __table_args__ = (
+        # Case-insensitive lookups and sorting by author name
+        db.Index('ix_author_name_nocase', db.text('name COLLATE NOCASE')),
+        # Lookups of an author whatever the spelling of the name, see normalize_author_name()
+        db.Index('ix_author_name_key', 'name_key'),
+        # Deleted authors waiting to be purged, the index holds nothing else
+        db.Index('ix_author_deleted_at', 'deleted_at', sqlite_where=db.text('deleted_at IS NOT NULL')),
+    )
+
     id = db.Column(db.Integer, primary_key=True)
     name = db.Column(db.String(100), nullable=False)
+    name_key = db.Column(db.String(100), nullable=False, server_default='')
     birth_date = db.Column(db.Date, nullable=True)
     date_of_death = db.Column(db.Date, nullable=True)
+    # Set when the author is deleted, the row is purged later (see helpers/soft_delete.py)
+    deleted_at = db.Column(db.DateTime, nullable=True)
+
+    # Books are removed with their author. passive_deletes avoids loading them first, the
+    # purger removes them with set-based DELETEs (see helpers/soft_delete.py).
+    books = db.relationship('Book', back_populates='author', cascade='all, delete-orphan', passive_deletes=True)
+
+    @validates('name')
+    def _set_name_key(self, key, name):
+        # Core inserts (bulk imports) bypass this and set name_key themselves
+        self.name_key = normalize_author_name(name)
+        return name
 
     def __repr__(self):
         return f"<Author {self.name}>"
@@ -17,6 +52,18 @@ class Author(db.Model):
 
 
 class Book(db.Model):
+    __table_args__ = (
+        db.Index('ix_book_author_id', 'author_id'),
+        # Sort keys of the home page, with the id tie-breaker used by the page cursors
+        db.Index('ix_book_title', 'title', 'id'),
+        db.Index('ix_book_publication_year', 'publication_year', 'id'),
+        db.Index('ix_book_rating', 'rating', 'id'),
+        # Books without an ISBN (NULL or empty) are left out, so only real ISBNs have to be unique. Deleted
+        # books are left out too, a book can be added again before its deleted copy is purged.
+        db.Index('ux_book_isbn', 'isbn', unique=True, sqlite_where=db.text("isbn != '' AND deleted_at IS NULL")),
+        db.Index('ix_book_deleted_at', 'deleted_at', sqlite_where=db.text('deleted_at IS NOT NULL')),
+    )
+
     id = db.Column(db.Integer, primary_key=True)
     isbn = db.Column(db.String(13), nullable=True)
     title = db.Column(db.String(200), nullable=False)
@@ -25,6 +72,21 @@ class Book(db.Model):
     cover = db.Column(db.String, nullable=True)
     rating = db.Column(db.Float, nullable=True)
     additional_info = db.Column(db.Text, nullable=True)
+    # Set when the book is deleted, the row is purged later (see helpers/soft_delete.py)
+    deleted_at = db.Column(db.DateTime, nullable=True)
+
+    author = db.relationship('Author', back_populates='books', lazy=BOOK_AUTHOR_LOADING)
+
+    # Authors after the first one (Book.author), in credit order
+    co_author_links = db.relationship('BookCoAuthor', order_by='BookCoAuthor.position',
+                                      collection_class=ordering_list('position', count_from=1),
+                                      cascade='all, delete-orphan', passive_deletes=True)
+    co_authors = association_proxy('co_author_links', 'author', creator=lambda author: BookCoAuthor(author=author))
+
+    @property
+    def authors(self):
+        """Every author of the book, the first one being Book.author."""
+        return [self.author, *self.co_authors]
 
     def __repr__(self):
         return f"<Book {self.title}>"
@@ -32,5 +94,119 @@ class Book(db.Model):
     def __str__(self):
         return self.title
 
+
+class BookCoAuthor(db.Model):
+    """Additional author of a book, Book.author stays the first (and usually only) one."""
+    __tablename__ = 'book_co_author'
+    __table_args__ = (
+        db.Index('ix_book_co_author_author_id', 'author_id'),
+    )
+
+    book_id = db.Column(db.Integer, db.ForeignKey('book.id', ondelete='CASCADE'), primary_key=True)
+    author_id = db.Column(db.Integer, db.ForeignKey('author.id', ondelete='CASCADE'), primary_key=True)
+    position = db.Column(db.Integer, nullable=False)
+
+    author = db.relationship('Author')
+
+
+class CatalogueVersion(db.Model):
+    """Single row counter bumped by every transaction that changes what the book grid shows.
+
+    Cached pages and their ETags are keyed by this version, so a write anywhere (even from
+    another process) invalidates them.
+    """
+    __tablename__ = 'catalogue_version'
+
+    id = db.Column(db.Integer, primary_key=True)
+    version = db.Column(db.Integer, nullable=False, default=1)
+    updated_at = db.Column(db.DateTime, nullable=False)
+
+
+class CatalogueChange(db.Model):
+    """Books and authors changed by one flush of a catalogue version, the log of the catalogue's changes.
+
+    Processes keeping the catalogue in memory (the fuzzy and suggest indexes) apply the
+    changes of the versions they have not seen yet instead of rebuilding from the whole
+    catalogue. Only the last versions are kept, see helpers/page_cache.py.
+    """
+    __tablename__ = 'catalogue_change'
+
+    id = db.Column(db.Integer, primary_key=True)
+    version = db.Column(db.Integer, nullable=False, index=True)
+    # JSON lists of ids
+    book_ids = db.Column(db.Text, nullable=False)
+    author_ids = db.Column(db.Text, nullable=False)
+
+
+class AuthorStats(db.Model):
+    """Book counts and rating totals of one author, kept up to date by database triggers.
+
+    See helpers/catalogue_stats.py, the triggers follow every insert, update and delete of
+    books and co-author credits, whichever code (or process) makes it.
+    """
+    __tablename__ = 'author_stats'
+    __table_args__ = (
+        # Most prolific authors first
+        db.Index('ix_author_stats_book_count', 'book_count', 'author_id'),
+    )
+
+    author_id = db.Column(db.Integer, primary_key=True)
+    # Books the author is the first author of, and books they are credited on as a co-author
+    book_count = db.Column(db.Integer, nullable=False, default=0)
+    co_author_count = db.Column(db.Integer, nullable=False, default=0)
+    # Over the books the author is the first author of, rated_count of them having a rating
+    rated_count = db.Column(db.Integer, nullable=False, default=0)
+    rating_sum = db.Column(db.Float, nullable=False, default=0.0)
+
+    @property
+    def average_rating(self):
+        return self.rating_sum / self.rated_count if self.rated_count else None
+
+    def __repr__(self):
+        return f"<AuthorStats {self.author_id} {self.book_count}>"
+
+
+class YearStats(db.Model):
+    """Number of books published in a year, kept up to date by database triggers like AuthorStats."""
+    __tablename__ = 'year_stats'
+
+    publication_year = db.Column(db.Integer, primary_key=True, autoincrement=False)
+    book_count = db.Column(db.Integer, nullable=False, default=0)
+
+    def __repr__(self):
+        return f"<YearStats {self.publication_year} {self.book_count}>"
+
+
+class Job(db.Model):
+    """Unit of background work (external lookup, enrichment run, import...), see helpers/job_queue.py."""
+    __table_args__ = (
+        # Workers look for the oldest queued job that is due
+        db.Index('ix_job_state_run_after', 'state', 'run_after', 'id'),
+    )
+
+    id = db.Column(db.Integer, primary_key=True)
+    kind = db.Column(db.String(50), nullable=False)
+    # JSON documents: the handler's arguments, its last progress report and its return value
+    payload = db.Column(db.Text, nullable=False, default='{}')
+    progress = db.Column(db.Text, nullable=True)
+    result = db.Column(db.Text, nullable=True)
+    # queued, running, succeeded or failed
+    state = db.Column(db.String(20), nullable=False, default='queued')
+    # Upstream hosts the job calls (comma separated), jobs of one host are limited to a few at a time
+    host = db.Column(db.String(255), nullable=True)
+    attempts = db.Column(db.Integer, nullable=False, default=0)
+    max_attempts = db.Column(db.Integer, nullable=False, default=1)
+    error = db.Column(db.Text, nullable=True)
+    created_at = db.Column(db.DateTime, nullable=False)
+    run_after = db.Column(db.DateTime, nullable=False)
+    started_at = db.Column(db.DateTime, nullable=True)
+    # Refreshed while the job runs, a running job whose heartbeat stopped was lost with its process
+    heartbeat_at = db.Column(db.DateTime, nullable=True)
+    finished_at = db.Column(db.DateTime, nullable=True)
+
+    def __repr__(self):
+        return f"<Job {self.id} {self.kind} {self.state}>"
+
+
 # with app.app_context():
 #     db.create_all()
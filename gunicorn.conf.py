@@ -0,0 +1,32 @@
+"""Gunicorn settings for serving the library in production.
+
+    gunicorn -c gunicorn.conf.py wsgi:app
+
+Every setting can be overridden from the environment (or the gunicorn command line).
+"""
+import multiprocessing
+import os
+
+bind = os.getenv('BIND', '0.0.0.0:5002')
+
+# Several processes, each serving requests from a few threads. Most requests wait on SQLite
+# or the external APIs, where threads overlap well. Keep DB_POOL_SIZE at least WEB_THREADS.
+workers = int(os.getenv('WEB_CONCURRENCY', multiprocessing.cpu_count() * 2 + 1))
+worker_class = 'gthread'
+threads = int(os.getenv('WEB_THREADS', 4))
+
+# Above API_LOOKUP_TIMEOUT, so a slow external search ends with its own error page
+timeout = int(os.getenv('WEB_TIMEOUT', 60))
+graceful_timeout = 30
+keepalive = 5
+
+# Recycle workers now and then so a leak cannot grow for ever
+max_requests = int(os.getenv('WEB_MAX_REQUESTS', 1000))
+max_requests_jitter = 100
+
+# Create the app (search index, page cache checks) once in the master, before forking the
+# workers, instead of racing to do it in every worker
+preload_app = True
+
+accesslog = '-'
+errorlog = '-'
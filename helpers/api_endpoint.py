@@ -1,47 +1,95 @@
-import requests
+import asyncio
+import logging
 import os
-import time
-from my_custom_exceptions import APICallError
+
+import requests
 from dotenv import load_dotenv
 
+from helpers.http_client import READ_TIMEOUT, TIMEOUT, get_session
+from helpers.job_queue import enqueue, job_handler, report_progress
+from helpers.metrics import track_external_call
+from helpers.rate_limiter import get_rate_limiter
+from helpers.response_cache import MISS, get_response_cache, normalize_key
+from my_custom_exceptions import APICallError, PermanentJobError, RateLimitError
+
 load_dotenv()
 API_KEY = os.getenv("API_KEY")
 
+HAPI_BOOKS_HOST = "hapi-books.p.rapidapi.com"
+BOOK_FINDER_HOST = "book-finder1.p.rapidapi.com"
+
+# Base URLs can point at a local stub server, the RapidAPI host headers stay the same
+HAPI_BOOKS_URL = os.getenv("HAPI_BOOKS_URL", f"https://{HAPI_BOOKS_HOST}")
+BOOK_FINDER_URL = os.getenv("BOOK_FINDER_URL", f"https://{BOOK_FINDER_HOST}")
+
+# Seconds allowed for a whole lookup, including rate limit waits and retries
+LOOKUP_TIMEOUT = float(os.getenv("API_LOOKUP_TIMEOUT", 20))
+
+# Results of a HAPI Books search offered on the search page, and kept in the response cache
+SEARCH_RESULTS = int(os.getenv("API_SEARCH_RESULTS", 5))
+MAX_SEARCH_RESULTS = 20
+
+logger = logging.getLogger(__name__)
+
+
+async def search_hapi_books_async(search):
+    """Return the best HAPI Books match of search as a tuple, None if nothing matches."""
+    candidates = await search_hapi_candidates_async(search, limit=1)
+    return candidates[0] if candidates else None
+
+
+async def search_hapi_candidates_async(search, limit=SEARCH_RESULTS):
+    """Search HAPI Books and keep every match of the answer, not only the first one.
+
+    Returns:
+        Up to limit tuples (title, publication_year, authors, cover, additional_info), best
+        match first.
+    """
+    cache = get_response_cache()
+    cache_key = normalize_key('hapi-books-results', search)
+    cached = cache.get(cache_key)
+    if cached is not MISS:
+        return [tuple(book) for book in cached[:limit]]
 
-def search_hapi_books(search):
     try:
         search_query = search.replace(' ', '+')
-        url = f"https://hapi-books.p.rapidapi.com/search/{search_query}"
+        url = f"{HAPI_BOOKS_URL}/search/{search_query}"
 
         headers = {
             "X-RapidAPI-Key": API_KEY,
-            "X-RapidAPI-Host": "hapi-books.p.rapidapi.com"
+            "X-RapidAPI-Host": HAPI_BOOKS_HOST
         }
 
-        response = requests.get(url, headers=headers)
+        await get_rate_limiter(HAPI_BOOKS_HOST).acquire_async(timeout=READ_TIMEOUT)
+        with track_external_call(HAPI_BOOKS_HOST):
+            response = await asyncio.to_thread(get_session().get, url, headers=headers, timeout=TIMEOUT)
 
-        # Check if the response status code indicates success (2xx)
-        response.raise_for_status()
+            # Check if the response status code indicates success (2xx)
+            response.raise_for_status()
 
-        # Check if the response contains a list of results
-        if isinstance(response.json(), list):
-            result = response.json()[0]
-        else:
-            result = response.json()
+        # The response is a list of results (or a single result)
+        data = response.json()
+        results = data if isinstance(data, list) else [data]
 
-        if result:
-            title = result.get('name')
-            additional_info = result.get('url')
-            cover = result.get('cover')
-            authors = result.get('authors')
-            publication_year = result.get('year')
-            return title, publication_year, authors, cover, additional_info
+        books = []
+        for result in results[:MAX_SEARCH_RESULTS]:
+            if result:
+                books.append((result.get('name'), result.get('year'), result.get('authors'), result.get('cover'),
+                              result.get('url')))
+
+        # The whole list is cached, whatever limit asked for. Empty results are cached too (for a
+        # shorter time) so repeated misses cost no quota.
+        cache.set(cache_key, books)
+        return books[:limit]
+
+    except APICallError:
+        raise
 
     except requests.exceptions.RequestException as e:
         # Handle connection errors or other issues with the API call
         raise APICallError("Error occurred while searching for the book using HAPI Books API.") from e
 
-    except (ValueError, KeyError) as e:
+    except (ValueError, KeyError, AttributeError) as e:
         # Handle JSON parsing errors or missing keys in the response
         raise APICallError("Error occurred while parsing the response from HAPI Books API.") from e
 
@@ -50,47 +98,185 @@ def search_hapi_books(search):
         raise APICallError("An unexpected error occurred while searching for the book.") from e
 
 
-def get_isbn_code(book_title, authors):
+async def get_isbn_code_async(book_title, authors):
     if not isinstance(authors, list):
         authors_list = [authors]
         author_names = ", ".join(authors_list)
     else:
         author_names = ", ".join(authors)
 
-    url = "https://book-finder1.p.rapidapi.com/api/search"
+    url = f"{BOOK_FINDER_URL}/api/search"
 
     querystring = {"title": book_title, "author": author_names, "page": "1"}
 
     headers = {
         "X-RapidAPI-Key": API_KEY,
-        "X-RapidAPI-Host": "book-finder1.p.rapidapi.com"
+        "X-RapidAPI-Host": BOOK_FINDER_HOST
     }
 
-    # API limits one request per second
-    time.sleep(1)
+    cache = get_response_cache()
+    cache_key = normalize_key('book-finder', book_title, authors if isinstance(authors, list) else [authors])
+    cached = cache.get(cache_key)
+    if cached is not MISS:
+        return cached
 
     try:
-        response = requests.get(url, headers=headers, params=querystring)
-        response.raise_for_status()  # Check if the response status code indicates success (2xx)
+        # API limits one request per second, the shared limiter only waits when that budget is used up
+        await get_rate_limiter(BOOK_FINDER_HOST).acquire_async(timeout=READ_TIMEOUT)
+
+        with track_external_call(BOOK_FINDER_HOST):
+            response = await asyncio.to_thread(get_session().get, url, headers=headers, params=querystring,
+                                               timeout=TIMEOUT)
+            response.raise_for_status()  # Check if the response status code indicates success (2xx)
 
         result = response.json()
-        if "results" in result:
+        if result.get("results"):
             first_result = result["results"][0]
 
             # Extract the ISBN from the first result
             isbn_code = first_result.get('published_works', [])[0].get('isbn')
-            return isbn_code
         else:
-            return ""
+            isbn_code = ""
+
+        # Only answers from the API are cached, failed calls below are retried next time
+        cache.set(cache_key, isbn_code)
+        return isbn_code
 
     except requests.exceptions.RequestException as e:
-        print(e)
+        logger.warning("ISBN lookup failed: %s", e)
         return ""
 
     except Exception as e:
-        print(e)
+        logger.warning("ISBN lookup failed: %s", e)
         return ""
 
+
+async def lookup_book_async(search):
+    """Search a book on HAPI Books, then resolve its ISBN on Book Finder.
+
+    Returns:
+        A tuple (title, publication_year, authors, cover, additional_info, isbn).
+
+    Raises:
+        APICallError: If the search fails or finds nothing.
+    """
+    result = await search_hapi_books_async(search)
+    if not result:
+        raise APICallError("No books found matching your search.")
+
+    title, publication_year, authors, cover, additional_info = result
+    isbn = await get_isbn_code_async(title, authors)
+    return title, publication_year, authors, cover, additional_info, isbn
+
+
+async def resolve_isbns_async(books, resolved=None):
+    """Resolve the ISBNs of several search results in one pass.
+
+    The lookups run concurrently and share the Book Finder rate limiter, which spaces them
+    out in the order of the results, so the best matches are resolved first. Results with the
+    same title and authors (editions of one book) are looked up once.
+
+    Args:
+        books: (title, authors) pairs.
+        resolved: Optional callable receiving (index, isbn) as each book is resolved.
+
+    Returns:
+        The ISBN of every book, "" where none was found.
+    """
+    isbns = [""] * len(books)
+    indexes = {}
+    for index, (title, authors) in enumerate(books):
+        indexes.setdefault(normalize_key(title, authors if isinstance(authors, list) else [authors]), []).append(index)
+
+    async def resolve(positions):
+        title, authors = books[positions[0]]
+        isbn = await get_isbn_code_async(title, authors)
+        for index in positions:
+            isbns[index] = isbn
+            if resolved:
+                resolved(index, isbn)
+
+    await asyncio.gather(*(resolve(positions) for positions in indexes.values()))
+    return isbns
+
+
+async def lookup_books_async(searches):
+    """Run several lookups concurrently, they share the per-host rate limits.
+
+    Returns:
+        One entry per search, either the lookup result or the APICallError it raised.
+    """
+    return await asyncio.gather(*(lookup_book_async(search) for search in searches), return_exceptions=True)
+
+
+def _run(coroutine, timeout=LOOKUP_TIMEOUT):
+    """Run a lookup coroutine from synchronous code (route handlers, CLI commands)."""
+    async def with_timeout():
+        try:
+            return await asyncio.wait_for(coroutine, timeout)
+        except asyncio.TimeoutError as e:
+            raise APICallError("The book lookup took too long, please try again later.") from e
+
+    return asyncio.run(with_timeout())
+
+
+def search_hapi_books(search):
+    return _run(search_hapi_books_async(search))
+
+
+def get_isbn_code(book_title, authors):
+    return _run(get_isbn_code_async(book_title, authors))
+
+
+def lookup_book(search, timeout=LOOKUP_TIMEOUT):
+    return _run(lookup_book_async(search), timeout)
+
+
+def lookup_books(searches, timeout=LOOKUP_TIMEOUT):
+    return _run(lookup_books_async(searches), timeout)
+
+
+def queue_lookup(search):
+    """Queue a lookup_book_job() for the background workers and return its job id."""
+    return enqueue('lookup_book', search=search)
+
+
+@job_handler('lookup_book', hosts=(HAPI_BOOKS_HOST, BOOK_FINDER_HOST))
+def lookup_book_job(search, limit=SEARCH_RESULTS):
+    """Background search queued by the search page: the top HAPI Books results and their ISBNs.
+
+    The results are saved as the job's progress as soon as they are known, then again as
+    their ISBNs come in, so the page can show them while the ISBNs are resolved.
+
+    Returns:
+        A dict with the search and its books (dicts with an 'isbn', None until resolved).
+
+    Raises:
+        PermanentJobError: If nothing matches the search, retrying would not change that.
+    """
+    try:
+        candidates = _run(search_hapi_candidates_async(search, limit))
+    except APICallError as e:
+        # Rate limits, timeouts and upstream errors are worth another attempt
+        if isinstance(e, RateLimitError) or e.__cause__ is not None:
+            raise
+        raise PermanentJobError(str(e)) from e
+    if not candidates:
+        raise PermanentJobError("No books found matching your search.")
+
+    books = [{'title': title, 'publication_year': publication_year, 'authors': authors, 'cover': cover,
+              'additional_info': additional_info, 'isbn': None}
+             for title, publication_year, authors, cover, additional_info in candidates]
+    report_progress(search=search, books=books)
+
+    def resolved(index, isbn):
+        books[index]['isbn'] = isbn
+        report_progress(search=search, books=books)
+
+    _run(resolve_isbns_async([(book['title'], book['authors']) for book in books], resolved))
+    return {'search': search, 'books': books}
+
+
 # (search_hapi_books('the little mermaid'))
 # title, publication_year, authors, cover, additional_info = search_hapi_books('the little mermaid')
 # print(title)
@@ -0,0 +1,116 @@
+from itertools import islice
+
+from sqlalchemy import and_, bindparam, delete, exists, func, select, update
+
+from data_models import db, Author, Book, BookCoAuthor
+from helpers.catalogue_events import notify_catalogue_change
+
+DEFAULT_CHUNK_SIZE = 500
+
+author_table = Author.__table__
+book_table = Book.__table__
+co_author_table = BookCoAuthor.__table__
+
+
+def find_duplicate_authors():
+    """Group the authors whose names normalize to the same key.
+
+    Returns:
+        A list of lists of (id, name), one per key shared by several authors, oldest author first.
+    """
+    shared_keys = select(Author.name_key).group_by(Author.name_key).having(func.count() > 1)
+    rows = db.session.execute(select(Author.name_key, Author.id, Author.name)
+                              .where(Author.name_key.in_(shared_keys), Author.name_key != '')
+                              .order_by(Author.name_key, Author.id))
+    groups = {}
+    for key, author_id, name in rows:
+        groups.setdefault(key, []).append((author_id, name))
+    return list(groups.values())
+
+
+def merge_duplicate_authors(chunk_size=DEFAULT_CHUNK_SIZE, dry_run=False, progress=None):
+    """Collapse every group of duplicate authors into its oldest author.
+
+    Books and co-author credits of the duplicates are moved with set-based statements and
+    the duplicates deleted, chunk_size groups per transaction. Birth and death dates the
+    kept author lacks are taken from its duplicates.
+
+    Args:
+        chunk_size (int): Number of duplicate groups merged per transaction.
+        dry_run (bool): Only find the duplicates, change nothing.
+        progress: Optional callable receiving the number of groups merged so far.
+
+    Returns:
+        A tuple (groups, authors removed, books moved), groups as returned by find_duplicate_authors().
+    """
+    groups = find_duplicate_authors()
+    if dry_run:
+        return groups, sum(len(group) - 1 for group in groups), 0
+
+    removed = moved = merged = 0
+    pending = iter(groups)
+    while True:
+        chunk = list(islice(pending, chunk_size))
+        if not chunk:
+            break
+        chunk_removed, chunk_moved = _merge_chunk(chunk)
+        removed += chunk_removed
+        moved += chunk_moved
+        merged += len(chunk)
+        if progress:
+            progress(merged)
+    return groups, removed, moved
+
+
+def _merge_chunk(groups):
+    # Duplicate author id -> id of the author it is merged into
+    survivor_of = {}
+    for group in groups:
+        survivor_id = group[0][0]
+        for duplicate_id, _ in group[1:]:
+            survivor_of[duplicate_id] = survivor_id
+    moves = [{'duplicate_id': duplicate_id, 'survivor_id': survivor_id}
+             for duplicate_id, survivor_id in survivor_of.items()]
+
+    try:
+        _fill_missing_dates(survivor_of)
+
+        moved = db.session.execute(update(book_table).where(book_table.c.author_id == bindparam('duplicate_id'))
+                                   .values(author_id=bindparam('survivor_id')), moves).rowcount
+        # A book may credit both the survivor and a duplicate, those credits are left to the
+        # clean-up below instead of failing on the primary key
+        db.session.execute(update(co_author_table).prefix_with('OR IGNORE', dialect='sqlite')
+                           .where(co_author_table.c.author_id == bindparam('duplicate_id'))
+                           .values(author_id=bindparam('survivor_id')), moves)
+        db.session.execute(delete(co_author_table).where(co_author_table.c.author_id.in_(survivor_of)))
+        # Credits of the book's own first author, after a duplicate was merged into it
+        db.session.execute(delete(co_author_table).where(
+            co_author_table.c.author_id.in_(set(survivor_of.values())),
+            exists().where(and_(book_table.c.id == co_author_table.c.book_id,
+                                book_table.c.author_id == co_author_table.c.author_id))))
+        db.session.execute(delete(author_table).where(author_table.c.id.in_(survivor_of)))
+
+        notify_catalogue_change(db.session, author_ids=set(survivor_of.values()) | set(survivor_of))
+        db.session.commit()
+    except Exception:
+        db.session.rollback()
+        raise
+    return len(survivor_of), moved
+
+
+def _fill_missing_dates(survivor_of):
+    ids = set(survivor_of) | set(survivor_of.values())
+    dates = {author_id: (birth_date, date_of_death) for author_id, birth_date, date_of_death in db.session.execute(
+        select(author_table.c.id, author_table.c.birth_date, author_table.c.date_of_death)
+        .where(author_table.c.id.in_(ids)))}
+
+    updates = {}
+    for duplicate_id, survivor_id in sorted(survivor_of.items()):
+        birth_date, date_of_death = updates.get(survivor_id, dates[survivor_id])
+        updates[survivor_id] = (birth_date or dates[duplicate_id][0], date_of_death or dates[duplicate_id][1])
+    changed = [{'survivor_id': survivor_id, 'new_birth_date': birth_date, 'new_date_of_death': date_of_death}
+               for survivor_id, (birth_date, date_of_death) in updates.items()
+               if (birth_date, date_of_death) != dates[survivor_id]]
+    if changed:
+        db.session.execute(update(author_table).where(author_table.c.id == bindparam('survivor_id')).values(
+            birth_date=bindparam('new_birth_date'), date_of_death=bindparam('new_date_of_death')), changed)
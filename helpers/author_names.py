@@ -0,0 +1,61 @@
+import ast
+import re
+import unicodedata
+
+# Separators between the authors of a single form or import field ("A; B", "A & B"). Commas
+# are left alone, they also separate the parts of "Tolkien, J. R. R.".
+_AUTHOR_SEPARATORS = re.compile(r'\s*(?:;|&|\band\b)\s*', re.IGNORECASE)
+
+
+def normalize_author_name(name):
+    """Key under which spellings of the same author name collide.
+
+    Case, accents, punctuation and whitespace are folded and runs of initials are joined,
+    so "J.R.R. Tolkien", "J. R. R. Tolkien" and "j r r  tolkien" all give "jrr tolkien".
+    """
+    name = ''.join(char for char in unicodedata.normalize('NFKD', name or '') if not unicodedata.combining(char))
+    words = re.findall(r'[^\W_]+', name.casefold())
+    key = []
+    initials = False
+    for word in words:
+        if len(word) == 1 and initials:
+            key[-1] += word
+        else:
+            key.append(word)
+            initials = len(word) == 1
+    return ' '.join(key)[:100]
+
+
+def split_author_names(values):
+    """Turn the author field(s) of a form or an import record into a list of names.
+
+    Args:
+        values: A name, a list of names, or the str() of a list ("['A', 'B']") as older
+            search forms posted it.
+
+    Returns:
+        The names in their original order, without blanks and without repeated spellings
+        of the same name.
+    """
+    if isinstance(values, str):
+        values = [values]
+    names = []
+    for value in values or ():
+        value = (value or '').strip()
+        if value.startswith('[') and value.endswith(']'):
+            try:
+                parsed = ast.literal_eval(value)
+            except (ValueError, SyntaxError):
+                parsed = None
+            if isinstance(parsed, (list, tuple)):
+                names.extend(str(item).strip() for item in parsed)
+                continue
+        names.extend(_AUTHOR_SEPARATORS.split(value))
+
+    unique_names = {}
+    for name in names:
+        key = normalize_author_name(name)
+        if key and key not in unique_names:
+            unique_names[key] = name.strip()
+    return list(unique_names.values())
+
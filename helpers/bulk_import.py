@@ -0,0 +1,297 @@
+import csv
+import json
+import os
+import shutil
+import tempfile
+import time
+from itertools import islice
+
+from sqlalchemy import insert, select
+from sqlalchemy.exc import IntegrityError
+
+from data_models import db, Author, Book, BookCoAuthor
+from helpers.author_names import normalize_author_name, split_author_names
+from helpers.catalogue_events import notify_catalogue_change
+from helpers.job_queue import enqueue, job_handler, report_progress
+
+DEFAULT_CHUNK_SIZE = 1000
+FORMATS = ('csv', 'jsonl')
+
+# Uploads wait here for their background import
+DEFAULT_UPLOAD_DIRECTORY = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))),
+                                        'data', 'imports')
+UPLOAD_DIRECTORY = os.getenv('IMPORT_UPLOAD_DIRECTORY', DEFAULT_UPLOAD_DIRECTORY)
+
+# Core tables rather than the ORM entities: ORM bulk inserts split rows into one statement per
+# distinct set of NULL columns, Core sends the whole chunk as a single executemany
+author_table = Author.__table__
+book_table = Book.__table__
+co_author_table = BookCoAuthor.__table__
+
+
+class ImportReport:
+    """Outcome of a bulk import: how many rows went in, which ones failed and how fast it ran."""
+
+    def __init__(self):
+        self.imported = 0
+        self.errors = []
+        self.started = time.perf_counter()
+        self.elapsed = 0.0
+
+    @property
+    def rows_per_second(self):
+        return self.imported / self.elapsed if self.elapsed else 0.0
+
+    def add_error(self, line_number, message):
+        self.errors.append((line_number, message))
+
+    def to_dict(self, max_errors=100):
+        return {
+            'imported': self.imported,
+            'failed': len(self.errors),
+            'seconds': round(self.elapsed, 3),
+            'rows_per_second': round(self.rows_per_second, 1),
+            'errors': [{'line': line, 'error': message} for line, message in self.errors[:max_errors]],
+        }
+
+
+def guess_format(filename, mimetype=None):
+    """Pick the import format from a file name or content type, CSV unless it looks like JSON Lines."""
+    if (filename or '').lower().endswith(('.jsonl', '.ndjson')) or mimetype in ('application/x-ndjson',
+                                                                               'application/jsonl'):
+        return 'jsonl'
+    return 'csv'
+
+
+def iter_rows(stream, file_format):
+    """Lazily parse a text stream of CSV (with a header row) or JSON Lines records.
+
+    Yields:
+        (line_number, record) tuples, record being a dict or None for unparsable JSON lines.
+    """
+    if file_format == 'csv':
+        reader = csv.DictReader(stream)
+        for record in reader:
+            yield reader.line_num, record
+    elif file_format == 'jsonl':
+        for line_number, line in enumerate(stream, 1):
+            if not line.strip():
+                continue
+            try:
+                yield line_number, json.loads(line)
+            except ValueError:
+                yield line_number, None
+    else:
+        raise ValueError(f'Unsupported import format "{file_format}", use csv or jsonl.')
+
+
+def parse_book_row(record):
+    """Validate an import record and return (book values, author names).
+
+    The author column holds one name, several separated by ";" or "&", or (in JSON Lines)
+    a list of names. The first one becomes Book.author, the others co-authors.
+
+    Raises:
+        ValueError: With a message explaining what is wrong with the record.
+    """
+    if not isinstance(record, dict):
+        raise ValueError('Row is not a valid record.')
+
+    title = (record.get('title') or '').strip()
+    author_names = split_author_names(record.get('author') or record.get('authors') or [])
+    if not title or not author_names:
+        raise ValueError('Title and author are required.')
+
+    publication_year = str(record.get('publication_year') or '').strip()
+    if not publication_year.isdigit() or len(publication_year) != 4:
+        raise ValueError('Invalid publication year format.')
+
+    rating = record.get('rating')
+    if rating in (None, ''):
+        rating = None
+    else:
+        try:
+            rating = float(rating)
+        except (TypeError, ValueError):
+            raise ValueError('Rating must be numeric.') from None
+
+    values = {
+        'isbn': str(record.get('isbn') or '').strip(),
+        'title': title,
+        'publication_year': int(publication_year),
+        'cover': record.get('cover') or None,
+        'rating': rating,
+        'additional_info': record.get('additional_info') or None,
+    }
+    return values, author_names
+
+
+def import_books(rows, chunk_size=DEFAULT_CHUNK_SIZE, progress=None):
+    """Insert books in chunked transactions, creating missing authors on the way.
+
+    Each chunk is validated, its new authors are inserted in one statement and its books in
+    one executemany, then the chunk is committed. Invalid rows are reported and skipped,
+    they never abort the rest of the import.
+
+    Args:
+        rows: Iterable of (line_number, record) as produced by iter_rows().
+        chunk_size (int): Number of rows per transaction.
+        progress: Optional callable receiving the report after every chunk.
+
+    Returns:
+        An ImportReport.
+    """
+    report = ImportReport()
+    # Normalized name -> id map of every author (the oldest of unmerged duplicates), so authors
+    # are resolved without a query per row
+    author_ids = dict(db.session.execute(select(Author.name_key, Author.id).order_by(Author.id.desc())).all())
+    seen_isbns = set()
+
+    rows = iter(rows)
+    while True:
+        chunk = list(islice(rows, chunk_size))
+        if not chunk:
+            break
+
+        parsed = []
+        for line_number, record in chunk:
+            try:
+                values, author_names = parse_book_row(record)
+            except ValueError as e:
+                report.add_error(line_number, str(e))
+                continue
+            if values['isbn'] and values['isbn'] in seen_isbns:
+                report.add_error(line_number, f'Duplicate ISBN {values["isbn"]}.')
+                continue
+            seen_isbns.add(values['isbn'])
+            parsed.append((line_number, values, author_names))
+
+        parsed = _skip_existing_isbns(parsed, report)
+        _insert_chunk(parsed, author_ids, report)
+
+        report.elapsed = time.perf_counter() - report.started
+        if progress:
+            progress(report)
+
+    report.elapsed = time.perf_counter() - report.started
+    return report
+
+
+def queue_import(stream, file_format, chunk_size=DEFAULT_CHUNK_SIZE):
+    """Save an uploaded file to UPLOAD_DIRECTORY and queue its import for the background workers.
+
+    Returns:
+        The id of the import job.
+    """
+    os.makedirs(UPLOAD_DIRECTORY, exist_ok=True)
+    descriptor, path = tempfile.mkstemp(suffix=f'.{file_format}', dir=UPLOAD_DIRECTORY)
+    with os.fdopen(descriptor, 'wb') as destination:
+        shutil.copyfileobj(stream, destination, 1024 * 1024)
+    return enqueue('import_books', path=path, file_format=file_format, chunk_size=chunk_size)
+
+
+@job_handler('import_books', max_attempts=1)
+def import_books_job(path, file_format, chunk_size=DEFAULT_CHUNK_SIZE):
+    """Import a file saved by queue_import(), then remove it.
+
+    Imports are not retried: the books without an ISBN of the chunks committed by the failed
+    attempt would be added twice.
+
+    Returns:
+        The import report, as a dict.
+    """
+    def save_progress(report):
+        report_progress(**report.to_dict(max_errors=0))
+
+    try:
+        with open(path, encoding='utf-8-sig', newline='') as source:
+            report = import_books(iter_rows(source, file_format), chunk_size, save_progress)
+    finally:
+        try:
+            os.remove(path)
+        except OSError:
+            pass
+    return report.to_dict()
+
+
+def _skip_existing_isbns(parsed, report):
+    isbns = [values['isbn'] for _, values, _ in parsed if values['isbn']]
+    if not isbns:
+        return parsed
+    existing = set(db.session.scalars(select(Book.isbn).where(Book.isbn.in_(isbns), Book.isbn != '')))
+    remaining = []
+    for line_number, values, author_names in parsed:
+        if values['isbn'] in existing:
+            report.add_error(line_number, f'A book with ISBN {values["isbn"]} is already in the library.')
+        else:
+            remaining.append((line_number, values, author_names))
+    return remaining
+
+
+def _insert_chunk(parsed, author_ids, report):
+    if not parsed:
+        return
+
+    new_names = {}
+    for _, _, author_names in parsed:
+        for name in author_names:
+            key = normalize_author_name(name)
+            if key not in author_ids:
+                new_names.setdefault(key, name)
+
+    try:
+        if new_names:
+            created = db.session.execute(
+                insert(author_table).returning(author_table.c.id, author_table.c.name_key),
+                [{'name': name, 'name_key': key} for key, name in new_names.items()])
+            new_ids = {key: author_id for author_id, key in created}
+        else:
+            new_ids = {}
+
+        def author_id_of(name):
+            key = normalize_author_name(name)
+            return author_ids.get(key) or new_ids[key]
+
+        books = [dict(values, author_id=author_id_of(names[0])) for _, values, names in parsed]
+        book_ids = db.session.scalars(insert(book_table).returning(book_table.c.id, sort_by_parameter_order=True),
+                                      books).all()
+        co_authors = [{'book_id': book_id, 'author_id': author_id_of(name), 'position': position}
+                      for book_id, (_, _, names) in zip(book_ids, parsed)
+                      for position, name in enumerate(names[1:], 1)]
+        if co_authors:
+            db.session.execute(insert(co_author_table), co_authors)
+        notify_catalogue_change(db.session, book_ids)
+        db.session.commit()
+    except IntegrityError:
+        # Something in the chunk clashed with a concurrent write, retry it row by row
+        db.session.rollback()
+        _insert_rows(parsed, author_ids, report)
+        return
+
+    author_ids.update(new_ids)
+    report.imported += len(parsed)
+
+
+def _insert_rows(parsed, author_ids, report):
+    for line_number, values, author_names in parsed:
+        try:
+            row_author_ids = {}
+            for name in author_names:
+                key = normalize_author_name(name)
+                row_author_ids[key] = author_ids.get(key) or db.session.scalar(
+                    insert(author_table).returning(author_table.c.id), {'name': name, 'name_key': key})
+            first_author_id, *co_author_ids = row_author_ids.values()
+            book_id = db.session.scalar(insert(book_table).returning(book_table.c.id),
+                                        dict(values, author_id=first_author_id))
+            if co_author_ids:
+                db.session.execute(insert(co_author_table), [
+                    {'book_id': book_id, 'author_id': author_id, 'position': position}
+                    for position, author_id in enumerate(co_author_ids, 1)])
+            notify_catalogue_change(db.session, [book_id])
+            db.session.commit()
+        except IntegrityError as e:
+            db.session.rollback()
+            report.add_error(line_number, f'Database rejected the row: {e.orig}')
+            continue
+        author_ids.update(row_author_ids)
+        report.imported += 1
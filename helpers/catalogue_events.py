@@ -0,0 +1,67 @@
+from blinker import Namespace
+from sqlalchemy import event, inspect
+from sqlalchemy.orm import Session, scoped_session
+
+from data_models import Author, Book, BookCoAuthor
+
+_signals = Namespace()
+
+# Sent inside the writing transaction, receivers may run SQL on the session's connection
+# (sender: the session, with book_ids and author_ids keyword arguments)
+catalogue_flushed = _signals.signal('catalogue-flushed')
+
+# Sent once the transaction is committed, for in-process caches and indexes
+# (sender: the session, with the book_ids and author_ids of the whole transaction)
+catalogue_committed = _signals.signal('catalogue-committed')
+
+
+def notify_catalogue_change(session, book_ids=(), author_ids=()):
+    """Report books and authors written with Core statements (bulk inserts, updates or deletes).
+
+    ORM changes are reported automatically when the session flushes, Core statements
+    bypass the ORM and must be reported by the code that runs them, before the commit.
+    """
+    if isinstance(session, scoped_session):
+        # Receivers get the same Session object whether the change came from a flush or db.session
+        session = session()
+    book_ids, author_ids = set(book_ids), set(author_ids)
+    if not (book_ids or author_ids):
+        return
+    pending = session.info.setdefault('catalogue_changes', (set(), set()))
+    pending[0].update(book_ids)
+    pending[1].update(author_ids)
+    catalogue_flushed.send(session, book_ids=book_ids, author_ids=author_ids)
+
+
+@event.listens_for(Session, 'after_flush')
+def _collect_orm_changes(session, flush_context):
+    book_ids = set()
+    author_ids = set()
+
+    for instance in session.new | session.dirty | session.deleted:
+        if isinstance(instance, Book):
+            book_ids.add(instance.id)
+        elif isinstance(instance, BookCoAuthor):
+            # The co-authors' names are indexed with the book
+            book_ids.add(instance.book_id)
+    for instance in session.dirty:
+        # A new author has no books yet, only renames change what is shown for existing books
+        if isinstance(instance, Author) and inspect(instance).attrs.name.history.has_changes():
+            author_ids.add(instance.id)
+    for instance in session.deleted:
+        if isinstance(instance, Author):
+            author_ids.add(instance.id)
+
+    notify_catalogue_change(session, book_ids, author_ids)
+
+
+@event.listens_for(Session, 'after_commit')
+def _send_committed(session):
+    changes = session.info.pop('catalogue_changes', None)
+    if changes:
+        catalogue_committed.send(session, book_ids=changes[0], author_ids=changes[1])
+
+
+@event.listens_for(Session, 'after_rollback')
+def _discard_changes(session):
+    session.info.pop('catalogue_changes', None)
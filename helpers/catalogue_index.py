@@ -0,0 +1,182 @@
+import threading
+import time
+from itertools import groupby
+
+from flask import current_app
+from sqlalchemy import or_, select
+from sqlalchemy.orm import aliased
+
+from data_models import db, Author, Book, BookCoAuthor
+from helpers.page_cache import get_catalogue_changes, get_catalogue_version
+
+# Versions and changed books and authors applied from the change log at most, past this a rebuild is cheaper
+MAX_LOGGED_VERSIONS = 1000
+MAX_LOGGED_CHANGES = 5000
+
+
+class CatalogueIndex:
+    """Process-wide in-memory index of book titles and author names, kept in step with the catalogue.
+
+    Commits made by this process are applied incrementally (only the changed books are read
+    back) before the next lookup. When the catalogue version shows that other processes wrote
+    as well (checked at most every sync_interval seconds), a background thread reads the books
+    and authors they changed from the catalogue change log and applies them the same way, while
+    the current index keeps serving. Only when the log cannot tell (this process is too far
+    behind) is the index rebuilt, in that thread too.
+
+    Subclasses build the index itself in create_index(). It must have a version attribute and
+    add_book(book_id, title, author_names) and remove_book(book_id) methods, author_names
+    being the first author's name followed by the co-authors' ones.
+
+    Args:
+        name (str): Name of the index, in the name of its rebuild thread.
+        sync_interval (float): Seconds between checks of the catalogue version.
+    """
+
+    def __init__(self, name, sync_interval=0.0):
+        self.name = name
+        self.sync_interval = sync_interval
+        self.index = None
+        self._lock = threading.Lock()
+        self._pending_books = set()
+        self._pending_authors = set()
+        # Catalogue versions committed by this process, already applied from its own commits
+        self._pending_versions = set()
+        self._own_versions = set()
+        self._catching_up = False
+        self._checked_at = 0.0
+
+    def create_index(self, rows, version):
+        """Return a new index of the (book id, title, author names) rows, at the given catalogue version."""
+        raise NotImplementedError
+
+    def build(self):
+        """Build the index from the whole catalogue and start serving it."""
+        index = self._build(get_catalogue_version()[0])
+        self._replace(index)
+        return index
+
+    def lookup(self, function):
+        """Return function(index) once the index is up to date, None if it has not been built."""
+        if self.index is None:
+            return None
+        self._sync()
+        with self._lock:
+            return function(self.index)
+
+    def note_commit(self, book_ids, author_ids, version=None):
+        """Queue the books and authors changed by a commit of this process, and the catalogue version it made."""
+        if self.index is None:
+            return
+        with self._lock:
+            self._pending_books.update(book_ids)
+            self._pending_authors.update(author_ids)
+            if version:
+                self._pending_versions.add(version)
+
+    def _applied(self):
+        """Called after changed books have been applied to the index."""
+
+    def _rebuilt(self, index):
+        """Called in the rebuild thread once a rebuilt index is served."""
+
+    def _sync(self):
+        with self._lock:
+            book_ids, author_ids = self._pending_books, self._pending_authors
+            self._pending_books, self._pending_authors = set(), set()
+            # Applied right below, they are not read back from the change log
+            self._own_versions.update(self._pending_versions)
+            self._pending_versions = set()
+
+        if book_ids or author_ids:
+            self._apply(book_ids, author_ids)
+            self._applied()
+        if time.monotonic() - self._checked_at >= self.sync_interval:
+            self._checked_at = time.monotonic()
+            version = get_catalogue_version()[0]
+            if version > self.index.version:
+                self._catch_up_in_background(version)
+
+    def _apply_logged_changes(self, version):
+        """Catch up with the given catalogue version, False if the change log cannot tell all the changes."""
+        with self._lock:
+            own_versions = self._own_versions | self._pending_versions
+            missing = [number for number in range(self.index.version + 1, version + 1) if number not in own_versions]
+        if len(missing) > MAX_LOGGED_VERSIONS:
+            return False
+        if missing:
+            changes = get_catalogue_changes(missing)
+            if changes is None or len(changes[0]) + len(changes[1]) > MAX_LOGGED_CHANGES:
+                return False
+            self._apply(*changes, version)
+            self._applied()
+        with self._lock:
+            self.index.version = max(self.index.version, version)
+            self._own_versions = {number for number in self._own_versions if number > self.index.version}
+        return True
+
+    def _replace(self, index):
+        with self._lock:
+            self.index = index
+
+    def _apply(self, book_ids, author_ids, version=0):
+        criteria = []
+        if book_ids:
+            criteria.append(Book.id.in_(book_ids))
+        if author_ids:
+            # Renamed authors change the names indexed with their books, and with the books they co-wrote
+            criteria.append(Book.author_id.in_(author_ids))
+            criteria.append(Book.id.in_(select(BookCoAuthor.book_id).where(BookCoAuthor.author_id.in_(author_ids))))
+        rows = []
+        if criteria:
+            # The primary holds the rows just committed, even when reads go to a replica
+            with db.engine.connect() as connection:
+                rows = list(_book_rows(connection, or_(*criteria)))
+        with self._lock:
+            found = set()
+            for book_id, title, author_names in rows:
+                self.index.add_book(book_id, title, author_names)
+                found.add(book_id)
+            for book_id in set(book_ids) - found:
+                self.index.remove_book(book_id)
+            self.index.version = max(self.index.version, version)
+
+    def _catch_up_in_background(self, version):
+        with self._lock:
+            if self._catching_up:
+                return
+            self._catching_up = True
+        app = current_app._get_current_object()
+
+        def catch_up():
+            with app.app_context():
+                try:
+                    if not self._apply_logged_changes(version):
+                        index = self._build(get_catalogue_version()[0])
+                        self._replace(index)
+                        self._rebuilt(index)
+                except Exception as e:
+                    app.logger.exception(e)
+                finally:
+                    self._catching_up = False
+
+        threading.Thread(target=catch_up, name=f'{self.name}-sync', daemon=True).start()
+
+    def _build(self, version):
+        with db.engine.connect() as connection:
+            return self.create_index(_book_rows(connection), version)
+
+
+def _book_rows(connection, *criteria):
+    """Yield (book id, title, author names) of the books matching criteria, the first author's name first."""
+    co_author = aliased(Author)
+    # One row per co-author (or a single one without), in book order so that they follow each other.
+    # Queries of engine connections are not filtered like the session's, deleted books are left out here
+    statement = (select(Book.id, Book.title, Author.name, co_author.name)
+                 .join(Author, Author.id == Book.author_id)
+                 .outerjoin(BookCoAuthor, BookCoAuthor.book_id == Book.id)
+                 .outerjoin(co_author, co_author.id == BookCoAuthor.author_id)
+                 .where(Book.deleted_at.is_(None), *criteria)
+                 .order_by(Book.id, BookCoAuthor.position).execution_options(yield_per=5000))
+    for (book_id, title, author_name), rows in groupby(connection.execute(statement), key=lambda row: row[:3]):
+        yield book_id, title, (author_name, *(row[3] for row in rows if row[3] is not None))
@@ -0,0 +1,193 @@
+from sqlalchemy import func, select, text
+
+from data_models import db, Author, AuthorStats, YearStats
+
+DEFAULT_TOP_AUTHORS = 10
+
+# Trigger name -> statement creating it. The triggers keep author_stats and year_stats in step
+# with every write to book and book_co_author in the same transaction, including the Core
+# statements of bulk imports, merges and purges and the writes of other processes. Deleted books
+# (deleted_at set) are not counted. A book moving between authors or years, or being deleted, is
+# a decrement of what it counted for and an increment of what it counts for now.
+STATS_TRIGGERS = {
+    'book_stats_insert': """
+        CREATE TRIGGER book_stats_insert AFTER INSERT ON book WHEN NEW.deleted_at IS NULL BEGIN
+            INSERT INTO author_stats (author_id, book_count, co_author_count, rated_count, rating_sum)
+            VALUES (NEW.author_id, 1, 0, NEW.rating IS NOT NULL, coalesce(NEW.rating, 0))
+            ON CONFLICT (author_id) DO UPDATE SET book_count = book_count + 1,
+                rated_count = rated_count + excluded.rated_count, rating_sum = rating_sum + excluded.rating_sum;
+            INSERT INTO year_stats (publication_year, book_count) VALUES (NEW.publication_year, 1)
+            ON CONFLICT (publication_year) DO UPDATE SET book_count = book_count + 1;
+        END
+    """,
+    'book_stats_delete': """
+        CREATE TRIGGER book_stats_delete AFTER DELETE ON book WHEN OLD.deleted_at IS NULL BEGIN
+            UPDATE author_stats SET book_count = book_count - 1, rated_count = rated_count - (OLD.rating IS NOT NULL),
+                rating_sum = CASE WHEN rated_count = (OLD.rating IS NOT NULL) THEN 0.0
+                                  ELSE rating_sum - coalesce(OLD.rating, 0) END
+            WHERE author_id = OLD.author_id;
+            UPDATE year_stats SET book_count = book_count - 1 WHERE publication_year = OLD.publication_year;
+            DELETE FROM year_stats WHERE publication_year = OLD.publication_year AND book_count <= 0;
+        END
+    """,
+    'book_stats_update': """
+        CREATE TRIGGER book_stats_update AFTER UPDATE OF author_id, rating, publication_year, deleted_at ON book
+        WHEN OLD.author_id IS NOT NEW.author_id OR OLD.rating IS NOT NEW.rating
+            OR OLD.publication_year IS NOT NEW.publication_year OR (OLD.deleted_at IS NULL) != (NEW.deleted_at IS NULL)
+        BEGIN
+            UPDATE author_stats SET book_count = book_count - 1, rated_count = rated_count - (OLD.rating IS NOT NULL),
+                rating_sum = CASE WHEN rated_count = (OLD.rating IS NOT NULL) THEN 0.0
+                                  ELSE rating_sum - coalesce(OLD.rating, 0) END
+            WHERE author_id = OLD.author_id AND OLD.deleted_at IS NULL;
+            INSERT INTO author_stats (author_id, book_count, co_author_count, rated_count, rating_sum)
+            SELECT NEW.author_id, 1, 0, NEW.rating IS NOT NULL, coalesce(NEW.rating, 0) WHERE NEW.deleted_at IS NULL
+            ON CONFLICT (author_id) DO UPDATE SET book_count = book_count + 1,
+                rated_count = rated_count + excluded.rated_count, rating_sum = rating_sum + excluded.rating_sum;
+            UPDATE year_stats SET book_count = book_count - 1
+            WHERE publication_year = OLD.publication_year AND OLD.deleted_at IS NULL;
+            INSERT INTO year_stats (publication_year, book_count)
+            SELECT NEW.publication_year, 1 WHERE NEW.deleted_at IS NULL
+            ON CONFLICT (publication_year) DO UPDATE SET book_count = book_count + 1;
+            DELETE FROM year_stats WHERE publication_year = OLD.publication_year AND book_count <= 0;
+        END
+    """,
+    'book_co_author_stats_insert': """
+        CREATE TRIGGER book_co_author_stats_insert AFTER INSERT ON book_co_author BEGIN
+            INSERT INTO author_stats (author_id, book_count, co_author_count, rated_count, rating_sum)
+            VALUES (NEW.author_id, 0, 1, 0, 0.0)
+            ON CONFLICT (author_id) DO UPDATE SET co_author_count = co_author_count + 1;
+        END
+    """,
+    'book_co_author_stats_delete': """
+        CREATE TRIGGER book_co_author_stats_delete AFTER DELETE ON book_co_author BEGIN
+            UPDATE author_stats SET co_author_count = co_author_count - 1 WHERE author_id = OLD.author_id;
+        END
+    """,
+    'book_co_author_stats_update': """
+        CREATE TRIGGER book_co_author_stats_update AFTER UPDATE OF author_id ON book_co_author
+        WHEN OLD.author_id IS NOT NEW.author_id
+        BEGIN
+            UPDATE author_stats SET co_author_count = co_author_count - 1 WHERE author_id = OLD.author_id;
+            INSERT INTO author_stats (author_id, book_count, co_author_count, rated_count, rating_sum)
+            VALUES (NEW.author_id, 0, 1, 0, 0.0)
+            ON CONFLICT (author_id) DO UPDATE SET co_author_count = co_author_count + 1;
+        END
+    """,
+    'author_stats_delete': """
+        CREATE TRIGGER author_stats_delete AFTER DELETE ON author BEGIN
+            DELETE FROM author_stats WHERE author_id = OLD.id;
+        END
+    """,
+}
+
+
+def create_stats_triggers(connection):
+    """Create the triggers maintaining the stats tables (they must not exist yet)."""
+    for statement in STATS_TRIGGERS.values():
+        connection.execute(text(statement))
+
+
+def drop_stats_triggers(connection):
+    for name in STATS_TRIGGERS:
+        connection.execute(text(f'DROP TRIGGER IF EXISTS {name}'))
+
+
+def rebuild_catalogue_stats(connection=None):
+    """Recompute the stats tables from the whole catalogue, in one transaction.
+
+    The triggers keep them exact, this is for a database written while they did not exist and
+    to reset the rating sums (adding and subtracting floating point ratings drifts slowly).
+
+    Args:
+        connection: Connection of the transaction to rebuild in (a migration's), a new
+            transaction of the app's engine by default.
+
+    Returns:
+        A tuple (number of authors, number of years) with books.
+    """
+    if connection is None:
+        with db.engine.begin() as connection:
+            return rebuild_catalogue_stats(connection)
+
+    connection.execute(text('DELETE FROM author_stats'))
+    connection.execute(text('DELETE FROM year_stats'))
+    connection.execute(text(
+        'INSERT INTO author_stats (author_id, book_count, co_author_count, rated_count, rating_sum) '
+        'SELECT author_id, count(*), 0, count(rating), coalesce(sum(rating), 0.0) FROM book '
+        'WHERE deleted_at IS NULL GROUP BY author_id'
+    ))
+    # "WHERE true" tells SQLite's parser the ON CONFLICT clause belongs to the INSERT, not to a join
+    connection.execute(text(
+        'INSERT INTO author_stats (author_id, book_count, co_author_count, rated_count, rating_sum) '
+        'SELECT author_id, 0, count(*), 0, 0.0 FROM book_co_author WHERE true GROUP BY author_id '
+        'ON CONFLICT (author_id) DO UPDATE SET co_author_count = excluded.co_author_count'
+    ))
+    connection.execute(text(
+        'INSERT INTO year_stats (publication_year, book_count) '
+        'SELECT publication_year, count(*) FROM book WHERE deleted_at IS NULL GROUP BY publication_year'
+    ))
+    authors = connection.execute(text('SELECT count(*) FROM author_stats')).scalar()
+    years = connection.execute(text('SELECT count(*) FROM year_stats')).scalar()
+    return authors, years
+
+
+def find_uncredited_authors(author_ids):
+    """Return the ids, among author_ids, of the authors no book credits anymore (as first or co-author).
+
+    Flush the session first, the stats follow the rows written to the database.
+    """
+    if not author_ids:
+        return set()
+    credited = db.session.scalars(select(AuthorStats.author_id).where(
+        AuthorStats.author_id.in_(author_ids), AuthorStats.book_count + AuthorStats.co_author_count > 0))
+    return set(author_ids) - set(credited)
+
+
+def get_author_stats(author_id):
+    """Return the AuthorStats of an author, None if no book credits them."""
+    return db.session.get(AuthorStats, author_id)
+
+
+def get_catalogue_stats(top_authors=DEFAULT_TOP_AUTHORS):
+    """Summary of the catalogue read from the stats tables, without scanning the books.
+
+    Returns:
+        A dict with the totals (books, authors with books, rated books, average rating), the
+        top_authors authors with the most books and the number of books per year and per decade.
+    """
+    totals = db.session.execute(select(
+        func.count().filter(AuthorStats.book_count > 0),
+        func.coalesce(func.sum(AuthorStats.book_count), 0),
+        func.coalesce(func.sum(AuthorStats.rated_count), 0),
+        func.sum(AuthorStats.rating_sum),
+    )).one()
+    authors_with_books, books, rated_books, rating_sum = totals
+
+    top = db.session.execute(
+        select(Author.id, Author.name, AuthorStats.book_count, AuthorStats.co_author_count,
+               AuthorStats.rated_count, AuthorStats.rating_sum)
+        .join(Author, Author.id == AuthorStats.author_id)
+        .order_by(AuthorStats.book_count.desc(), AuthorStats.author_id.desc()).limit(top_authors)).all()
+
+    years = db.session.execute(select(YearStats.publication_year, YearStats.book_count)
+                               .order_by(YearStats.publication_year)).all()
+    decades = {}
+    for year, count in years:
+        decade = year - year % 10
+        decades[decade] = decades.get(decade, 0) + count
+
+    return {
+        'books': books,
+        'authors': authors_with_books,
+        'rated_books': rated_books,
+        'average_rating': round(rating_sum / rated_books, 2) if rated_books else None,
+        'top_authors': [{
+            'id': author_id,
+            'name': name,
+            'books': book_count,
+            'co_authored_books': co_author_count,
+            'average_rating': round(rating_sum / rated_count, 2) if rated_count else None,
+        } for author_id, name, book_count, co_author_count, rated_count, rating_sum in top],
+        'books_per_year': [{'year': year, 'books': count} for year, count in years],
+        'books_per_decade': [{'decade': decade, 'books': count} for decade, count in decades.items()],
+    }
@@ -0,0 +1,254 @@
+import hashlib
+import io
+import ipaddress
+import os
+import re
+import socket
+import threading
+import time
+from urllib.parse import urljoin, urlsplit
+
+from flask import url_for
+from sqlalchemy import select
+
+from data_models import db, Book
+from helpers.job_queue import enqueue, job_handler
+from helpers.metrics import track_external_call
+
+try:
+    # In requirements.txt, an install without it serves the placeholder instead of full-size third-party covers
+    from PIL import Image, UnidentifiedImageError
+except ImportError:
+    Image = None
+
+DEFAULT_DIRECTORY = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'data', 'covers')
+COVER_DIRECTORY = os.getenv('COVER_CACHE_DIRECTORY', DEFAULT_DIRECTORY)
+
+# Longest side of a thumbnail in pixels, twice the size of the grid's covers for high density screens
+THUMBNAIL_SIZE = int(os.getenv('COVER_THUMBNAIL_SIZE', 200))
+THUMBNAIL_QUALITY = 85
+# Larger downloads are not covers, they are given up on
+MAX_DOWNLOAD_BYTES = int(os.getenv('COVER_MAX_BYTES', 5 * 1024 * 1024))
+# Redirects followed to reach a cover, each one to a public address only
+MAX_REDIRECTS = 5
+# Lets covers be fetched from loopback and private networks, for a local test server only: cover URLs
+# come from users, with it they can make the server call internal services
+ALLOW_PRIVATE_ADDRESSES = os.getenv('COVER_ALLOW_PRIVATE_ADDRESSES') == '1'
+# Seconds before a cover that could not be fetched is tried again
+BROKEN_RETRY_AFTER = float(os.getenv('COVER_BROKEN_RETRY_AFTER', 24 * 3600))
+
+# Thumbnails never change under their URL (it names their cover URL), browsers keep them for a year
+CACHE_MAX_AGE = 365 * 24 * 3600
+# The placeholder of a broken cover, until the cover is tried again
+BROKEN_MAX_AGE = 3600
+
+PLACEHOLDER = 'cover-placeholder.svg'
+
+MIMETYPES = {'jpg': 'image/jpeg', 'png': 'image/png', 'gif': 'image/gif', 'webp': 'image/webp'}
+
+# Cover key -> time its fetch was queued by this process, so a grid reloaded while its covers are
+# fetched does not queue them again
+_queued = {}
+_queued_lock = threading.Lock()
+QUEUED_FOR = 60
+
+
+def cover_key(cover):
+    """Name of a cover URL in the cache (and in the proxy URL of the cover)."""
+    return hashlib.sha256(cover.encode('utf-8')).hexdigest()[:32]
+
+
+def cover_url(book):
+    """URL the pages show a book's cover from: the local thumbnail proxy, or the placeholder."""
+    if not book.cover:
+        return url_for('static', filename=PLACEHOLDER)
+    return url_for('catalogue.cover', book_id=book.id, v=cover_key(book.cover))
+
+
+def cached_cover(key):
+    """Look up the thumbnail of a cover.
+
+    Returns:
+        A tuple (path, mimetype) of the thumbnail, ('', None) for a cover known to be broken
+        (until BROKEN_RETRY_AFTER), or None when the cover has not been fetched yet (or the
+        key is not a cover key).
+    """
+    if not re.fullmatch(r'[0-9a-f]{32}', key or ''):
+        return None
+    entry_path = _entry_path(key)
+    try:
+        with open(entry_path) as entry:
+            filename = entry.read().strip()
+        if not filename:
+            if time.time() - os.path.getmtime(entry_path) > BROKEN_RETRY_AFTER:
+                return None
+            return '', None
+    except OSError:
+        return None
+    path = _thumbnail_path(filename)
+    if not os.path.exists(path):
+        return None
+    return path, MIMETYPES[filename.rpartition('.')[2]]
+
+
+def book_cover(book_id):
+    """Return the cover URL of a book, None if the book has no cover (or does not exist)."""
+    return db.session.scalar(select(Book.cover).where(Book.id == book_id)) or None
+
+
+def queue_cover_fetch(cover):
+    """Queue a fetch_cover_job() for the background workers, unless this process just did.
+
+    Returns:
+        The id of the job, None when the cover is already queued or cannot be resized (Pillow is
+        not installed).
+    """
+    if Image is None:
+        return None
+    key = cover_key(cover)
+    now = time.monotonic()
+    with _queued_lock:
+        if now - _queued.get(key, -QUEUED_FOR) < QUEUED_FOR:
+            return None
+        _queued[key] = now
+        for stale_key in [stale_key for stale_key, queued in _queued.items() if now - queued >= QUEUED_FOR]:
+            del _queued[stale_key]
+    return enqueue('fetch_cover', hosts=[urlsplit(cover).hostname], cover=cover)
+
+
+def queue_missing_covers():
+    """Queue a fetch of every book cover that is not cached yet.
+
+    Returns:
+        The number of fetches queued.
+    """
+    covers = db.session.scalars(select(Book.cover).where(Book.cover.is_not(None), Book.cover != '').distinct())
+    queued = 0
+    for cover in covers.all():
+        if cached_cover(cover_key(cover)) is None and queue_cover_fetch(cover) is not None:
+            queued += 1
+    return queued
+
+
+@job_handler('fetch_cover')
+def fetch_cover_job(cover):
+    """Download a cover, store its thumbnail and record it under the cover's key.
+
+    Covers that cannot be downloaded, are not images or are too large are recorded as
+    broken, so their placeholder is served without trying again for BROKEN_RETRY_AFTER.
+
+    Returns:
+        The file name of the thumbnail, '' for a broken cover, None when Pillow is not installed
+        (nothing is downloaded or recorded then, so the cover is fetched once it is).
+    """
+    key = cover_key(cover)
+    cached = cached_cover(key)
+    if cached is not None:
+        return os.path.basename(cached[0])
+    if Image is None:
+        return None
+
+    try:
+        data = _download(cover)
+    except OSError:
+        # HTTP errors the client's own retries did not get past (requests' exceptions are OSErrors),
+        # try again after BROKEN_RETRY_AFTER
+        data = None
+    thumbnail = _make_thumbnail(data) if data is not None else None
+    filename = ''
+    if thumbnail is not None:
+        content, extension = thumbnail
+        # Named after the content, covers shared by several URLs are stored once
+        filename = f'{hashlib.sha256(content).hexdigest()[:32]}.{extension}'
+        path = _thumbnail_path(filename)
+        if not os.path.exists(path):
+            _write_atomically(path, content)
+    _write_atomically(_entry_path(key), filename.encode('ascii'))
+    return filename
+
+
+def _download(cover):
+    # Only the job workers download covers, web processes never load the HTTP client
+    from helpers.http_client import TIMEOUT, get_session
+
+    with track_external_call(urlsplit(cover).hostname):
+        for _ in range(MAX_REDIRECTS + 1):
+            if not _is_public_url(cover):
+                return None
+            # Redirects are followed here, so their targets are checked too
+            with get_session().get(cover, timeout=TIMEOUT, stream=True, allow_redirects=False) as response:
+                if response.is_redirect:
+                    cover = urljoin(cover, response.headers['Location'])
+                    continue
+                if response.status_code in (404, 410):
+                    return None
+                response.raise_for_status()
+                if int(response.headers.get('Content-Length') or 0) > MAX_DOWNLOAD_BYTES:
+                    return None
+                data = response.raw.read(MAX_DOWNLOAD_BYTES + 1, decode_content=True)
+                return data if len(data) <= MAX_DOWNLOAD_BYTES else None
+    return None
+
+
+def _is_public_url(url):
+    """Whether url is an http(s) URL whose host only resolves to public internet addresses.
+
+    Cover URLs are given by users, a URL of the loopback interface, a private network or the
+    link-local metadata service of a cloud host would make the server fetch internal resources.
+
+    Raises:
+        OSError: If the host cannot be resolved.
+    """
+    url = urlsplit(url)
+    if url.scheme not in ('http', 'https') or not url.hostname:
+        return False
+    if ALLOW_PRIVATE_ADDRESSES:
+        return True
+    addresses = socket.getaddrinfo(url.hostname, url.port or (443 if url.scheme == 'https' else 80),
+                                   type=socket.SOCK_STREAM)
+    for *_, socket_address in addresses:
+        address = ipaddress.ip_address(socket_address[0].split('%')[0])
+        if getattr(address, 'ipv4_mapped', None):
+            address = address.ipv4_mapped
+        if not address.is_global or address.is_multicast:
+            return False
+    return True
+
+
+def _make_thumbnail(data):
+    """Return (content, extension) of the thumbnail of an image, None if data is not an image."""
+    try:
+        with Image.open(io.BytesIO(data)) as image:
+            image.thumbnail((THUMBNAIL_SIZE, THUMBNAIL_SIZE))
+            output = io.BytesIO()
+            if image.mode in ('RGBA', 'LA', 'P'):
+                image.save(output, 'PNG', optimize=True)
+                return output.getvalue(), 'png'
+            image.convert('RGB').save(output, 'JPEG', quality=THUMBNAIL_QUALITY, optimize=True)
+            return output.getvalue(), 'jpg'
+    except (UnidentifiedImageError, Image.DecompressionBombError, OSError, ValueError):
+        return None
+
+
+def _entry_path(key):
+    # Spread over 256 directories, so none of them grows too large
+    return os.path.join(COVER_DIRECTORY, 'urls', key[:2], key)
+
+
+def _thumbnail_path(filename):
+    return os.path.join(COVER_DIRECTORY, filename[:2], filename)
+
+
+def _write_atomically(path, content):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    temporary_path = f'{path}.{os.getpid()}.{threading.get_ident()}.tmp'
+    with open(temporary_path, 'wb') as destination:
+        destination.write(content)
+    os.replace(temporary_path, path)
+
+
+def init_cover_cache(app):
+    """Make cover_url() available to the templates."""
+    app.jinja_env.globals['cover_url'] = cover_url
+    if Image is None:
+        app.logger.warning('Pillow is not installed, covers are shown as placeholders: pip install -r requirements.txt')
@@ -0,0 +1,63 @@
+import os
+
+from sqlalchemy import event
+
+# Seconds a connection waits for another one's write lock before failing with "database is locked"
+BUSY_TIMEOUT = float(os.getenv('SQLITE_BUSY_TIMEOUT', 5))
+
+# Applied to every new SQLite connection. WAL lets readers run while a writer commits, and
+# synchronous=NORMAL is durable across application crashes with WAL (only a power loss can
+# drop the last commits).
+SQLITE_PRAGMAS = {
+    'journal_mode': os.getenv('SQLITE_JOURNAL_MODE', 'WAL'),
+    'synchronous': os.getenv('SQLITE_SYNCHRONOUS', 'NORMAL'),
+    # Negative values are KiB: 64 MiB of page cache per connection
+    'cache_size': int(os.getenv('SQLITE_CACHE_SIZE', -64000)),
+    'mmap_size': int(os.getenv('SQLITE_MMAP_SIZE', 256 * 1024 * 1024)),
+    'busy_timeout': int(BUSY_TIMEOUT * 1000),
+    'temp_store': 'MEMORY',
+}
+
+# Connections kept per worker process, size it to the number of threads serving requests
+POOL_SIZE = int(os.getenv('DB_POOL_SIZE', 10))
+MAX_OVERFLOW = int(os.getenv('DB_MAX_OVERFLOW', 5))
+POOL_TIMEOUT = float(os.getenv('DB_POOL_TIMEOUT', 10))
+
+
+def engine_options(database_uri):
+    """SQLALCHEMY_ENGINE_OPTIONS for the given database.
+
+    In-memory SQLite databases keep SQLAlchemy's defaults, they live in a single connection.
+    """
+    if not database_uri:
+        return {}
+    if not database_uri.startswith('sqlite'):
+        return {'pool_size': POOL_SIZE, 'max_overflow': MAX_OVERFLOW, 'pool_timeout': POOL_TIMEOUT,
+                'pool_pre_ping': True}
+    if ':memory:' in database_uri or database_uri.rstrip('/') == 'sqlite:':
+        return {}
+    return {
+        'pool_size': POOL_SIZE,
+        'max_overflow': MAX_OVERFLOW,
+        'pool_timeout': POOL_TIMEOUT,
+        # Pooled connections move between request threads
+        'connect_args': {'timeout': BUSY_TIMEOUT, 'check_same_thread': False},
+    }
+
+
+def init_sqlite_tuning(app, db):
+    """Apply SQLITE_PRAGMAS to every connection the app's engines open (other databases are left alone)."""
+    with app.app_context():
+        engines = list(db.engines.values())
+    for engine in engines:
+        if engine.dialect.name == 'sqlite':
+            event.listen(engine, 'connect', apply_sqlite_pragmas)
+
+
+def apply_sqlite_pragmas(dbapi_connection, connection_record):
+    cursor = dbapi_connection.cursor()
+    try:
+        for name, value in SQLITE_PRAGMAS.items():
+            cursor.execute(f'PRAGMA {name} = {value}')
+    finally:
+        cursor.close()
@@ -0,0 +1,223 @@
+import json
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from sqlalchemy import or_, select, update
+
+from data_models import db, Author, Book
+from helpers.api_endpoint import get_isbn_code, search_hapi_books
+from helpers.catalogue_events import notify_catalogue_change
+from helpers.job_queue import enqueue, find_active_job, job_handler, report_progress
+from my_custom_exceptions import APICallError
+
+DEFAULT_WORKERS = 2
+DEFAULT_BATCH_SIZE = 20
+# Lookups are rate-limited per host anyway, more threads only wait for their turn
+MAX_WORKERS = 8
+MAX_BATCH_SIZE = 200
+
+DEFAULT_CHECKPOINT_PATH = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))),
+                                       'data', 'enrichment_checkpoint.json')
+CHECKPOINT_PATH = os.getenv('ENRICHMENT_CHECKPOINT_PATH', DEFAULT_CHECKPOINT_PATH)
+
+_status = {'state': 'idle'}
+_status_lock = threading.Lock()
+
+
+def get_status():
+    """Return a snapshot of the current (or last) enrichment run."""
+    with _status_lock:
+        status = dict(_status)
+    status['checkpoint'], status['failed_book_ids'] = load_checkpoint()
+    return status
+
+
+def load_checkpoint():
+    """Return where an unfinished run stopped.
+
+    Returns:
+        A tuple (id of the last book it went past, ids of the books whose lookups failed),
+        (0, []) if there is no unfinished run.
+    """
+    try:
+        with open(CHECKPOINT_PATH) as checkpoint_file:
+            checkpoint = json.load(checkpoint_file)
+        return checkpoint['last_book_id'], checkpoint.get('failed_book_ids', [])
+    except (OSError, ValueError, KeyError):
+        return 0, []
+
+
+def save_checkpoint(last_book_id, failed_book_ids=()):
+    # Write then rename, so a crash never leaves a half-written checkpoint behind
+    temporary_path = f'{CHECKPOINT_PATH}.tmp'
+    with open(temporary_path, 'w') as checkpoint_file:
+        json.dump({'last_book_id': last_book_id, 'failed_book_ids': list(failed_book_ids), 'saved_at': time.time()},
+                  checkpoint_file)
+    os.replace(temporary_path, CHECKPOINT_PATH)
+
+
+def reset_checkpoint():
+    if os.path.exists(CHECKPOINT_PATH):
+        os.remove(CHECKPOINT_PATH)
+
+
+def missing_metadata():
+    """Filter for books without an ISBN, a cover or additional info."""
+    return or_(*(or_(column.is_(None), column == '') for column in (Book.isbn, Book.cover, Book.additional_info)))
+
+
+def resolve_metadata(book):
+    """Look up the missing fields of one book on the external APIs.
+
+    Args:
+        book (dict): The book's id, title, author_name, isbn, cover and additional_info.
+
+    Returns:
+        A dict with the book id and the fields that were found.
+    """
+    found = {'id': book['id']}
+
+    if not book['cover'] or not book['additional_info']:
+        result = search_hapi_books(f"{book['title']} {book['author_name']}")
+        if result:
+            _, _, _, cover, additional_info = result
+            if cover and not book['cover']:
+                found['cover'] = cover
+            if additional_info and not book['additional_info']:
+                found['additional_info'] = additional_info
+
+    if not book['isbn']:
+        isbn = get_isbn_code(book['title'], book['author_name'])
+        if isbn:
+            found['isbn'] = isbn
+
+    return found
+
+
+def run_enrichment(workers=DEFAULT_WORKERS, batch_size=DEFAULT_BATCH_SIZE, limit=None):
+    """Fill in missing ISBNs, covers and additional info, resuming an unfinished run.
+
+    Books are read in id order, one batch at a time. A bounded pool of workers resolves a
+    batch through the (rate-limited) external APIs, the results are written back in one
+    commit and the checkpoint moves past the batch. Books whose lookups failed are kept in
+    the checkpoint, a resumed run retries them first. Once every book has been gone through
+    the checkpoint is cleared, the next run starts over from the first book.
+
+    Args:
+        workers (int): Number of concurrent lookups, capped at MAX_WORKERS.
+        batch_size (int): Books resolved and committed together, capped at MAX_BATCH_SIZE.
+        limit (int): Stop after this many books, None to process every book.
+    """
+    workers = min(max(workers, 1), MAX_WORKERS)
+    batch_size = min(max(batch_size, 1), MAX_BATCH_SIZE)
+    _update_status(state='running', started_at=time.time(), finished_at=None, processed=0, enriched=0,
+                   failed=0, last_error=None)
+    last_book_id, retry_book_ids = load_checkpoint()
+    failed_book_ids = []
+    finished = False
+
+    try:
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            while limit is None or _status['processed'] < limit:
+                size = batch_size if limit is None else min(batch_size, limit - _status['processed'])
+                if retry_book_ids:
+                    batch = _books_by_id(retry_book_ids[:size])
+                    retry_book_ids = retry_book_ids[size:]
+                else:
+                    batch = _next_batch(last_book_id, size)
+                    if not batch:
+                        finished = True
+                        break
+                    last_book_id = batch[-1]['id']
+
+                futures = [executor.submit(resolve_metadata, book) for book in batch]
+                updates = []
+                for book, future in zip(batch, futures):
+                    try:
+                        found = future.result()
+                    except APICallError as e:
+                        failed_book_ids.append(book['id'])
+                        _update_status(failed=_status['failed'] + 1, last_error=str(e))
+                        continue
+                    if len(found) > 1:
+                        updates.append(found)
+
+                _write_back(updates)
+                save_checkpoint(last_book_id, retry_book_ids + failed_book_ids)
+                _update_status(processed=_status['processed'] + len(batch),
+                               enriched=_status['enriched'] + len(updates))
+                report_progress(processed=_status['processed'], enriched=_status['enriched'],
+                                failed=_status['failed'], last_book_id=last_book_id)
+    except Exception as e:
+        db.session.rollback()
+        _update_status(state='failed', finished_at=time.time(), last_error=str(e))
+        raise
+
+    if finished:
+        reset_checkpoint()
+    _update_status(state='finished', finished_at=time.time())
+    return get_status()
+
+
+@job_handler('enrich_books')
+def enrich_books_job(workers=DEFAULT_WORKERS, batch_size=DEFAULT_BATCH_SIZE, limit=None):
+    """Background enrichment run, a failed run is retried from its last checkpoint."""
+    return run_enrichment(workers, batch_size, limit)
+
+
+def start_enrichment(**options):
+    """Queue an enrichment run for the background workers.
+
+    Returns:
+        A tuple (job id, True if it was queued by this call), with the id of the queued or
+        running job when there already is one.
+    """
+    job_id = find_active_job('enrich_books')
+    if job_id is not None:
+        return job_id, False
+    return enqueue('enrich_books', **options), True
+
+
+def _next_batch(last_book_id, size):
+    return _read_books(Book.id > last_book_id, limit=size)
+
+
+def _books_by_id(book_ids):
+    # Books completed or deleted since their lookup failed are left out
+    return _read_books(Book.id.in_(book_ids))
+
+
+def _read_books(criterion, limit=None):
+    statement = (select(Book.id, Book.title, Book.isbn, Book.cover, Book.additional_info,
+                        Author.name.label('author_name'))
+                 .join(Author, Author.id == Book.author_id)
+                 .where(criterion, missing_metadata())
+                 .order_by(Book.id)
+                 .limit(limit))
+    return [row._asdict() for row in db.session.execute(statement)]
+
+
+def _write_back(updates):
+    # An ISBN that already belongs to another book would break the unique index, drop it
+    isbns = [found['isbn'] for found in updates if 'isbn' in found]
+    taken = set()
+    if isbns:
+        taken = set(db.session.scalars(select(Book.isbn).where(Book.isbn.in_(isbns), Book.isbn != '')))
+    for found in updates:
+        if found.get('isbn') in taken:
+            del found['isbn']
+        elif 'isbn' in found:
+            taken.add(found['isbn'])
+
+    updates = [found for found in updates if len(found) > 1]
+    if updates:
+        db.session.execute(update(Book), updates)
+        notify_catalogue_change(db.session, [found['id'] for found in updates])
+    db.session.commit()
+
+
+def _update_status(**changes):
+    with _status_lock:
+        _status.update(changes)
@@ -0,0 +1,92 @@
+import csv
+import io
+import json
+import zlib
+
+from sqlalchemy import select
+
+from data_models import db, Author, Book
+
+DEFAULT_BATCH_SIZE = 1000
+
+EXPORT_COLUMNS = (
+    Book.id, Book.isbn, Book.title, Book.publication_year, Book.rating, Book.cover, Book.additional_info,
+    Book.author_id, Author.name.label('author_name'), Author.birth_date.label('author_birth_date'),
+    Author.date_of_death.label('author_date_of_death'),
+)
+FIELD_NAMES = [column.key for column in EXPORT_COLUMNS]
+
+CONTENT_TYPES = {'csv': 'text/csv', 'jsonl': 'application/x-ndjson'}
+
+
+def iter_catalogue_rows(batch_size=DEFAULT_BATCH_SIZE):
+    """Yield every book with its author as a plain dict, in id order.
+
+    Plain columns are selected instead of ORM objects and fetched batch_size rows at a
+    time, so memory use does not grow with the size of the catalogue.
+    """
+    statement = (select(*EXPORT_COLUMNS)
+                 .join(Author, Author.id == Book.author_id)
+                 .order_by(Book.id)
+                 .execution_options(yield_per=batch_size))
+    for row in db.session.execute(statement):
+        yield row._asdict()
+
+
+def iter_csv(rows, batch_size=DEFAULT_BATCH_SIZE):
+    """Encode rows as CSV with a header line, yielding one chunk of text per batch of rows."""
+    buffer = io.StringIO()
+    writer = csv.DictWriter(buffer, fieldnames=FIELD_NAMES)
+    writer.writeheader()
+    for count, row in enumerate(rows, 1):
+        writer.writerow(row)
+        if count % batch_size == 0:
+            yield _drain(buffer)
+    yield _drain(buffer)
+
+
+def iter_jsonl(rows, batch_size=DEFAULT_BATCH_SIZE):
+    """Encode rows as JSON Lines, yielding one chunk of text per batch of rows."""
+    lines = []
+    for row in rows:
+        lines.append(json.dumps(row, default=str, separators=(',', ':')))
+        if len(lines) == batch_size:
+            yield '\n'.join(lines) + '\n'
+            lines = []
+    if lines:
+        yield '\n'.join(lines) + '\n'
+
+
+def iter_gzip(chunks):
+    """Gzip a stream of text chunks on the fly."""
+    compressor = zlib.compressobj(wbits=31)
+    for chunk in chunks:
+        compressed = compressor.compress(chunk.encode('utf-8'))
+        if compressed:
+            yield compressed
+    yield compressor.flush()
+
+
+def iter_export(file_format, compress=False, batch_size=DEFAULT_BATCH_SIZE):
+    """Stream the whole catalogue in the given format ('csv' or 'jsonl').
+
+    Raises:
+        ValueError: If the format is not supported.
+    """
+    if file_format == 'csv':
+        chunks = iter_csv(iter_catalogue_rows(batch_size), batch_size)
+    elif file_format == 'jsonl':
+        chunks = iter_jsonl(iter_catalogue_rows(batch_size), batch_size)
+    else:
+        raise ValueError(f'Unsupported export format "{file_format}", use csv or jsonl.')
+
+    if compress:
+        return iter_gzip(chunks)
+    return (chunk.encode('utf-8') for chunk in chunks)
+
+
+def _drain(buffer):
+    text = buffer.getvalue()
+    buffer.seek(0)
+    buffer.truncate()
+    return text
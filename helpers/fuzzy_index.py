@@ -0,0 +1,319 @@
+import heapq
+import json
+import os
+import re
+import time
+import unicodedata
+from collections import defaultdict
+
+from flask import current_app
+
+from data_models import db
+from helpers.catalogue_events import catalogue_committed
+from helpers.catalogue_index import CatalogueIndex
+from helpers.page_cache import get_catalogue_version
+
+# Set FUZZY_SEARCH=0 to skip building the index (searches then never fall back to fuzzy matching)
+FUZZY_SEARCH = os.getenv('FUZZY_SEARCH', '1') == '1'
+
+DEFAULT_PATH = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'data', 'fuzzy_index.json')
+INDEX_PATH = os.getenv('FUZZY_INDEX_PATH', DEFAULT_PATH)
+
+# Minimum Dice similarity of the trigrams of two words for them to match, a swap of two letters
+# in the middle of a word ("tolkein" for "tolkien") scores 0.43
+SIMILARITY_THRESHOLD = float(os.getenv('FUZZY_SIMILARITY_THRESHOLD', 0.4))
+MAX_RESULTS = 200
+
+# Bounds on the work of one search: similar words considered per query word, and word
+# combinations visited (queries of many rare typos may return fewer than MAX_RESULTS books)
+MAX_WORDS_PER_TERM = 20
+MAX_COMBINATIONS = 500
+
+# Books of the rarest word of a combination first checked against the other words, the
+# following chunks double in size
+INTERSECTION_CHUNK = 256
+
+# Seconds between saves of an index that changed, so a restart does not have to rebuild it
+SAVE_INTERVAL = float(os.getenv('FUZZY_INDEX_SAVE_INTERVAL', 300))
+
+FORMAT_VERSION = 4
+
+
+def normalize_words(text):
+    """Lowercase words of text without accents, numbers and one-letter words are left out."""
+    text = ''.join(char for char in unicodedata.normalize('NFKD', text or '') if not unicodedata.combining(char))
+    return [word for word in re.findall(r'[^\W_]+', text.casefold()) if len(word) > 1 and not word.isdigit()]
+
+
+def trigrams(word):
+    padded = f' {word} '
+    return {padded[index:index + 3] for index in range(len(padded) - 2)}
+
+
+class TrigramIndex:
+    """In-memory trigram index over the words of book titles and author names.
+
+    Trigrams index the vocabulary (every distinct word) rather than the books: a query word
+    is matched against the vocabulary, then the books containing the similar words are
+    scored. The vocabulary grows much slower than the catalogue, which keeps lookups fast.
+    """
+
+    def __init__(self):
+        self.version = 0
+        self.words = []
+        self.word_ids = {}
+        self.word_trigram_counts = []
+        self.trigram_words = defaultdict(set)
+        self.word_books = defaultdict(set)
+        self.book_words = {}
+        # Word id -> its books in id order, built on first use and dropped when they change
+        self._sorted_books = {}
+
+    def dump(self):
+        """The index as plain lists, for JSON: the vocabulary and the word ids of every book."""
+        return {'version': self.version, 'words': self.words,
+                'books': [[book_id, sorted(word_ids)] for book_id, word_ids in self.book_words.items()]}
+
+    @classmethod
+    def load(cls, data):
+        """Rebuild an index from dump()'s lists, the trigrams are computed again."""
+        index = cls()
+        index.version = data['version']
+        for word in data['words']:
+            index._word_id(word)
+        for book_id, word_ids in data['books']:
+            index.book_words[book_id] = set(word_ids)
+            for word_id in word_ids:
+                index.word_books[word_id].add(book_id)
+        return index
+
+    def add_book(self, book_id, title, author_names):
+        self.remove_book(book_id)
+        word_ids = {self._word_id(word) for word in normalize_words(' '.join((title, *author_names)))}
+        self.book_words[book_id] = word_ids
+        for word_id in word_ids:
+            self.word_books[word_id].add(book_id)
+            self._sorted_books.pop(word_id, None)
+
+    def remove_book(self, book_id):
+        for word_id in self.book_words.pop(book_id, ()):
+            self.word_books[word_id].discard(book_id)
+            self._sorted_books.pop(word_id, None)
+
+    def search(self, query, limit=MAX_RESULTS, threshold=SIMILARITY_THRESHOLD):
+        """Return up to limit (book_id, score) pairs, best match first.
+
+        A book scores the average, over the query words, of the similarity of its closest
+        word (0 for query words it has nothing similar to). Instead of scoring every book
+        containing a similar word, combinations of similar words (one per query word, or
+        none) are visited from the best total similarity down, and the books containing a
+        combination are found by intersecting posting sets. The first combination a book
+        turns up in is its best one, and the walk stops as soon as limit books are found.
+        """
+        terms = list(dict.fromkeys(normalize_words(query)))
+        if not terms:
+            return []
+
+        # Per query word: its similar vocabulary words, most similar first, then "no match"
+        candidates = [self._similar_words(term, threshold) + [(0.0, None)] for term in terms]
+
+        results = []
+        seen = set()
+        start = (0,) * len(candidates)
+        heap = [(-sum(options[0][0] for options in candidates), start)]
+        visited = {start}
+        visits = 0
+        while heap and len(results) < limit and visits < MAX_COMBINATIONS:
+            negative_score, combination = heapq.heappop(heap)
+            if not negative_score:
+                break
+            visits += 1
+
+            word_ids = [candidates[term][choice][1] for term, choice in enumerate(combination)
+                        if candidates[term][choice][1] is not None]
+            score = -negative_score / len(terms)
+            found = self._first_books(word_ids, seen, limit - len(results))
+            seen.update(found)
+            results.extend((book_id, score) for book_id in found)
+
+            for term, choice in enumerate(combination):
+                if choice + 1 < len(candidates[term]):
+                    following = combination[:term] + (choice + 1,) + combination[term + 1:]
+                    if following not in visited:
+                        visited.add(following)
+                        score = sum(candidates[index][option][0] for index, option in enumerate(following))
+                        heapq.heappush(heap, (-score, following))
+        return results
+
+    def _first_books(self, word_ids, seen, count):
+        """The count smallest ids of the books containing all the words, apart from those seen.
+
+        The sorted books of the rarest word are walked in growing chunks, each chunk intersected
+        with the other words' sets, so combinations of common words stop after the first chunks
+        instead of intersecting the full sets.
+        """
+        word_ids = sorted(word_ids, key=lambda word_id: len(self.word_books[word_id]))
+        books = self._books_in_order(word_ids[0])
+        found = []
+        if len(word_ids) == 1:
+            for book_id in books:
+                if book_id not in seen:
+                    found.append(book_id)
+                    if len(found) == count:
+                        break
+            return found
+
+        others = [self.word_books[word_id] for word_id in word_ids[1:]]
+        # Books expected to contain all the words if they were spread independently
+        expected = len(books)
+        for other in others:
+            expected *= len(other) / len(self.book_words)
+        start, size = 0, INTERSECTION_CHUNK
+        while start < len(books) and len(found) < count:
+            if expected < count or start and len(found) * len(books) < count * start:
+                # Too few books to find, one intersection of the whole sets is cheaper than walking them
+                matching = self.word_books[word_ids[0]].intersection(*others)
+                if start:
+                    matching = {book_id for book_id in matching if book_id > books[start - 1]}
+                matching.difference_update(seen)
+                found.extend(heapq.nsmallest(count - len(found), matching))
+                break
+            matching = set(books[start:start + size]).intersection(*others)
+            matching.difference_update(seen)
+            found.extend(sorted(matching))
+            start, size = start + size, size * 2
+        return found[:count]
+
+    def _books_in_order(self, word_id):
+        books = self._sorted_books.get(word_id)
+        if books is None:
+            books = self._sorted_books[word_id] = sorted(self.word_books[word_id])
+        return books
+
+    def _similar_words(self, term, threshold):
+        """(similarity, word id) of the vocabulary words similar to term, most similar first."""
+        term_trigrams = trigrams(term)
+        shared = defaultdict(int)
+        for trigram in term_trigrams:
+            for word_id in self.trigram_words.get(trigram, ()):
+                shared[word_id] += 1
+
+        similar = []
+        for word_id, count in shared.items():
+            similarity = 2 * count / (len(term_trigrams) + self.word_trigram_counts[word_id])
+            if similarity >= threshold and self.word_books.get(word_id):
+                similar.append((similarity, word_id))
+        similar.sort(key=lambda item: (-item[0], item[1]))
+        return similar[:MAX_WORDS_PER_TERM]
+
+    def _word_id(self, word):
+        word_id = self.word_ids.get(word)
+        if word_id is None:
+            word_id = len(self.words)
+            self.words.append(word)
+            self.word_ids[word] = word_id
+            word_trigrams = trigrams(word)
+            self.word_trigram_counts.append(len(word_trigrams))
+            for trigram in word_trigrams:
+                self.trigram_words[trigram].add(word_id)
+        return word_id
+
+
+class FuzzyIndex(CatalogueIndex):
+    """Process-wide TrigramIndex kept in step with the catalogue (see CatalogueIndex), saved to disk.
+
+    Other processes' writes are looked for on every search. The index is saved now and then
+    while it changes, so a restart loads it instead of building it.
+    """
+
+    def __init__(self, path=INDEX_PATH):
+        super().__init__('fuzzy-index')
+        self.path = path
+        self._last_saved = 0.0
+
+    def create_index(self, rows, version):
+        index = TrigramIndex()
+        index.version = version
+        for book_id, title, author_names in rows:
+            index.add_book(book_id, title, author_names)
+        return index
+
+    def load_or_build(self):
+        """Load the saved index and apply the changes logged since it was saved, build it if they are not known."""
+        version = get_catalogue_version()[0]
+        index = self._load(version)
+        if index is not None:
+            self._replace(index)
+            if self._apply_logged_changes(version):
+                return index
+        index = self._build(version)
+        self._replace(index)
+        self._save(index)
+        return index
+
+    def search(self, query, limit=MAX_RESULTS):
+        """Return up to limit (book_id, score) pairs, or [] if the index has not been built."""
+        return self.lookup(lambda index: index.search(query, limit)) or []
+
+    def _applied(self):
+        if time.time() - self._last_saved > SAVE_INTERVAL:
+            self._save(self.index)
+
+    def _rebuilt(self, index):
+        self._save(index)
+
+    def _load(self, version):
+        try:
+            with open(self.path, encoding='utf-8') as index_file:
+                saved = json.load(index_file)
+            if (saved.get('format') != FORMAT_VERSION or saved.get('database') != str(db.engine.url)
+                    or not 0 < saved['index']['version'] <= version):
+                return None
+            return TrigramIndex.load(saved['index'])
+        except (OSError, ValueError, KeyError, TypeError, AttributeError):
+            return None
+
+    def _save(self, index):
+        temporary_path = f'{self.path}.{os.getpid()}.tmp'
+        try:
+            os.makedirs(os.path.dirname(self.path), exist_ok=True)
+            with self._lock:
+                data = json.dumps({'format': FORMAT_VERSION, 'database': str(db.engine.url), 'index': index.dump()},
+                                  separators=(',', ':'))
+            with open(temporary_path, 'w', encoding='utf-8') as index_file:
+                index_file.write(data)
+            os.replace(temporary_path, self.path)
+            self._last_saved = time.time()
+        except OSError as e:
+            current_app.logger.warning('Could not save the fuzzy search index: %s', e)
+
+
+fuzzy_index = FuzzyIndex()
+
+
+def init_fuzzy_index():
+    """Load or build the fuzzy search index, unless FUZZY_SEARCH is off."""
+    if FUZZY_SEARCH:
+        fuzzy_index.load_or_build()
+
+
+def rebuild_fuzzy_index():
+    """Build the index from the whole catalogue and save it.
+
+    Returns:
+        The number of books indexed.
+    """
+    index = fuzzy_index._build(get_catalogue_version()[0])
+    fuzzy_index._replace(index)
+    fuzzy_index._save(index)
+    return len(index.book_words)
+
+
+def fuzzy_search(query, limit=MAX_RESULTS):
+    """Ids of the books whose title or author name is similar to query, best match first."""
+    return [book_id for book_id, _ in fuzzy_index.search(query, limit)]
+
+
+@catalogue_committed.connect
+def _note_commit(session, book_ids, author_ids):
+    fuzzy_index.note_commit(book_ids, author_ids, session.info.get('catalogue_version'))
@@ -1,5 +1,20 @@
-from data_models import db, Book, Author
-from sqlalchemy import or_
+from data_models import db, Book, Author, BookCoAuthor
+from helpers.author_names import normalize_author_name
+from helpers.fuzzy_index import fuzzy_search
+from helpers.search_index import apply_full_text_search, rank_expression
+from sqlalchemy import String, and_, cast, func, literal, or_, select
+from sqlalchemy.orm import joinedload, selectinload
+
+DEFAULT_PAGE_SIZE = 50
+MAX_PAGE_SIZE = 200
+
+# Sort option -> (sort key column, descending, parser for the key part of an "after" cursor)
+SORT_OPTIONS = {
+    'title': (Book.title, False, str),
+    'author': (Author.name.collate('NOCASE'), False, str),
+    'publication_year': (Book.publication_year, False, int),
+    'rating': (Book.rating, True, float),
+}
 
 
 def search_books(search_query=None):
@@ -8,20 +23,238 @@ def search_books(search_query=None):
 
     # Apply search filtering if a search_query is provided
     if search_query:
+        # Prefer the ranked full-text index, fall back to substring matching when it cannot be used
+        full_text_query = apply_full_text_search(books_with_authors_query, search_query)
+        if full_text_query is not None:
+            return full_text_query, True
+
         books_with_authors_query = books_with_authors_query.filter(
             or_(Book.title.ilike(f"%{search_query}%"), Author.name.ilike(f"%{search_query}%"))
         )
-    # Execute the query and return the results
-    return books_with_authors_query.all()
+    # Return the unexecuted query and whether it was filtered by the full-text index
+    return books_with_authors_query, False
+
+
+def author_by_name_query(name):
+    # Any spelling of the name ("J.R.R. Tolkien", "J. R. R. Tolkien"), served by ix_author_name_key
+    return Author.query.filter(Author.name_key == normalize_author_name(name)).order_by(Author.id)
+
+
+def book_by_isbn_query(isbn):
+    # The isbn != '' term lets SQLite use the partial ux_book_isbn index
+    return Book.query.filter(Book.isbn == isbn, Book.isbn != '')
+
+
+def find_author_by_name(name):
+    return author_by_name_query(name).first()
+
+
+def find_or_create_authors(names):
+    """Resolve author names to Author rows, with one query for all of them.
+
+    Names are matched on their normalized key, so differently spelled duplicates are not
+    created. Missing authors are added to the session, not committed.
+
+    Returns:
+        The authors in the order of names, without repeats.
+    """
+    keys = {normalize_author_name(name): name for name in names}
+    keys.pop('', None)
+    existing = {}
+    if keys:
+        for author in Author.query.filter(Author.name_key.in_(keys)).order_by(Author.id.desc()):
+            # The oldest author wins when duplicates have not been merged yet
+            existing[author.name_key] = author
+    authors = []
+    for key, name in keys.items():
+        author = existing.get(key)
+        if author is None:
+            author = existing[key] = Author(name=name.strip())
+            db.session.add(author)
+        authors.append(author)
+    return authors
+
+
+def find_book_by_isbn(isbn, other_than=None):
+    """Return the book with this ISBN, leaving out the book with id other_than (the one being edited)."""
+    if not isbn:
+        return None
+    query = book_by_isbn_query(isbn)
+    if other_than is not None:
+        query = query.filter(Book.id != other_than)
+    return query.first()
+
+
+def fuzzy_search_books(search_query):
+    """Query of the books whose title or author is similar to search_query, typos included.
+
+    Returns:
+        A tuple (query, similarity_key): similarity_key orders the matches best first.
+    """
+    book_ids = fuzzy_search(search_query)
+    books_with_authors_query = db.session.query(Book, Author).join(Author).filter(Book.id.in_(book_ids))
+    # Offset of the book in the ranked ",id,id,...," list: a single bound string keeps the
+    # statement cacheable, where a CASE with a branch per book would be rebuilt every search
+    ranking = literal(f",{','.join(map(str, book_ids))},")
+    return books_with_authors_query, func.instr(ranking, literal(',').concat(cast(Book.id, String)).concat(','))
+
+
+def books_page_query(search_query=None, sort_by=None, after=None, limit=None, filters=(), fuzzy=False):
+    """Build the query behind get_books_page().
+
+    It selects (Book, Author, sort key) rows and one extra row past the page to detect
+    whether there is a next page. filters are extra criteria on Book/Author columns.
+
+    Raises:
+        ValueError: If the cursor is malformed.
+    """
+    limit = min(limit or DEFAULT_PAGE_SIZE, MAX_PAGE_SIZE)
+    similarity_key = None
+    if fuzzy and search_query:
+        books_with_authors_query, similarity_key = fuzzy_search_books(search_query)
+        ranked = False
+    else:
+        books_with_authors_query, ranked = search_books(search_query)
+    if filters:
+        books_with_authors_query = books_with_authors_query.filter(*filters)
+
+    if sort_by in SORT_OPTIONS:
+        sort_key, descending, parse_key = SORT_OPTIONS[sort_by]
+    elif similarity_key is not None:
+        sort_key, descending, parse_key = similarity_key, False, int
+    elif ranked:
+        sort_key, descending, parse_key = rank_expression(), False, float
+    else:
+        sort_key, descending, parse_key = Book.id, False, int
+
+    if after:
+        key_value, book_id = parse_cursor(after, parse_key)
+        books_with_authors_query = books_with_authors_query.filter(
+            _after_cursor(sort_key, descending, key_value, book_id))
+
+    # Book.id breaks ties so the order (and therefore the cursor) is stable. It follows the
+    # sort direction so that a (sort key, id) index can be walked in either direction.
+    if descending:
+        order = (sort_key.desc(), Book.id.desc())
+    else:
+        order = (sort_key.asc(), Book.id.asc())
+    if sort_by == 'author':
+        # Without table statistics SQLite would scan every book and sort the join. This always
+        # true range term makes it walk authors through ix_author_name_nocase instead.
+        books_with_authors_query = books_with_authors_query.filter(sort_key >= '')
+    return (books_with_authors_query.add_columns(sort_key)
+            .order_by(*order)
+            .limit(limit + 1))
+
+
+def get_book_with_author_or_404(book_id, co_authors=False):
+    # Book and author in a single joined query instead of one query each
+    query = Book.query.options(joinedload(Book.author, innerjoin=True))
+    if co_authors:
+        # All of them in one more query, instead of one per co-author
+        query = query.options(selectinload(Book.co_author_links).joinedload(BookCoAuthor.author, innerjoin=True))
+    return query.filter(Book.id == book_id).first_or_404()
+
+
+def get_authors_page(name_prefix=None, after=None, limit=None):
+    """Fetch one page of authors in case-insensitive name order.
+
+    Args:
+        name_prefix (str): Only authors whose name starts with it (case-insensitive).
+        after (str): Cursor "<name>,<id>" of the last author of the previous page.
+        limit (int): Page size, capped at MAX_PAGE_SIZE.
+
+    Returns:
+        A tuple (authors, next_cursor) where next_cursor is None on the last page.
+
+    Raises:
+        ValueError: If the cursor is malformed.
+    """
+    limit = min(limit or DEFAULT_PAGE_SIZE, MAX_PAGE_SIZE)
+    sort_key = Author.name.collate('NOCASE')
+    query = Author.query
+    if name_prefix:
+        # A range on the NOCASE index instead of LIKE, which SQLite cannot serve from it
+        query = query.filter(sort_key >= name_prefix, sort_key < name_prefix + '\U0010ffff')
+    if after:
+        key_value, author_id = parse_cursor(after, str)
+        query = query.filter(_after_cursor(sort_key, False, key_value, author_id, Author.id))
+    authors = query.order_by(sort_key, Author.id).limit(limit + 1).all()
+
+    next_cursor = None
+    if len(authors) > limit:
+        authors = authors[:limit]
+        next_cursor = format_cursor(authors[-1].name, authors[-1].id)
+    return authors, next_cursor
+
+
+def get_author_choices():
+    # Only the columns the author dropdown needs, in name order straight from ix_author_name_nocase
+    return db.session.execute(select(Author.id, Author.name).order_by(Author.name.collate('NOCASE'))).all()
+
+
+def get_books_page(search_query=None, sort_by=None, after=None, limit=None, filters=(), fuzzy=False):
+    """Fetch one page of (Book, Author) pairs, sorted and paginated by the database.
+
+    Pages are addressed with a keyset cursor instead of an offset, so every page costs the
+    same bounded query no matter how deep into the catalogue it is.
+
+    Args:
+        search_query (str): Optional text to filter the books by.
+        sort_by (str): One of SORT_OPTIONS. Without it, search results are ranked by
+            relevance and the full catalogue is listed in insertion order.
+        after (str): Cursor "<sort_key>,<id>" of the last book of the previous page.
+        limit (int): Page size, capped at MAX_PAGE_SIZE.
+        filters (list): Optional extra SQLAlchemy criteria, e.g. Book.author_id == 3.
+        fuzzy (bool): Match search_query with the typo-tolerant trigram index instead of the
+            full-text index, results are ranked by similarity.
+
+    Returns:
+        A tuple (books_with_authors, next_cursor) where next_cursor is None on the last page.
+
+    Raises:
+        ValueError: If the cursor is malformed.
+    """
+    limit = min(limit or DEFAULT_PAGE_SIZE, MAX_PAGE_SIZE)
+    rows = books_page_query(search_query, sort_by, after, limit, filters, fuzzy).all()
+
+    next_cursor = None
+    if len(rows) > limit:
+        rows = rows[:limit]
+        last_book, _, last_key = rows[-1]
+        next_cursor = format_cursor(last_key, last_book.id)
+
+    return [(book, author) for book, author, _ in rows], next_cursor
+
+
+def format_cursor(key_value, book_id):
+    return f"{'' if key_value is None else key_value},{book_id}"
+
+
+def parse_cursor(cursor, parse_key):
+    # Split on the last comma, titles and author names may contain commas themselves
+    key_part, _, id_part = cursor.rpartition(',')
+    if not id_part.isdigit():
+        raise ValueError('Invalid page cursor.')
+    if key_part == '' and parse_key is not str:
+        return None, int(id_part)
+    return parse_key(key_part), int(id_part)
+
 
+def _after_cursor(sort_key, descending, key_value, row_id, id_column=Book.id):
+    """Filter for the rows that come after (key_value, row_id) in the page order.
 
-def sort_search_results(results, sort_by):
-    # Apply sorting to the search results if sort_by is provided
-    if sort_by == 'title':
-        results.sort(key=lambda x: x[0].title)
-    elif sort_by == 'author':
-        results.sort(key=lambda x: x[1].name)
-    elif sort_by == 'publication_year':
-        results.sort(key=lambda x: x[0].publication_year)
+    SQLite sorts NULLs first in ascending order and last in descending order.
+    """
+    if descending:
+        same_key_next_id = and_(sort_key.is_(None) if key_value is None else sort_key == key_value,
+                                id_column < row_id)
+        if key_value is None:
+            return same_key_next_id
+        return or_(sort_key < key_value, same_key_next_id, sort_key.is_(None))
 
-    return results
+    same_key_next_id = and_(sort_key.is_(None) if key_value is None else sort_key == key_value,
+                            id_column > row_id)
+    if key_value is None:
+        return or_(same_key_next_id, sort_key.isnot(None))
+    return or_(sort_key > key_value, same_key_next_id)
@@ -0,0 +1,76 @@
+import os
+import threading
+
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+# Seconds to open a connection and to wait for response data
+CONNECT_TIMEOUT = float(os.getenv("API_CONNECT_TIMEOUT", 3.05))
+READ_TIMEOUT = float(os.getenv("API_READ_TIMEOUT", 10))
+TIMEOUT = (CONNECT_TIMEOUT, READ_TIMEOUT)
+
+MAX_RETRIES = int(os.getenv("API_MAX_RETRIES", 3))
+BACKOFF_FACTOR = float(os.getenv("API_BACKOFF_FACTOR", 0.5))
+# Longest Retry-After the client agrees to wait for before retrying
+MAX_RETRY_AFTER = float(os.getenv("API_MAX_RETRY_AFTER", 10))
+# Connections kept alive per upstream host
+POOL_SIZE = int(os.getenv("API_POOL_SIZE", 10))
+
+RETRY_STATUSES = (429, 500, 502, 503, 504)
+
+
+class CappedRetry(Retry):
+    """Retry policy that honours Retry-After headers, but never sleeps longer than MAX_RETRY_AFTER."""
+
+    def get_retry_after(self, response):
+        retry_after = super().get_retry_after(response)
+        if retry_after is None:
+            return None
+        return min(retry_after, MAX_RETRY_AFTER)
+
+
+def build_adapter():
+    """Build the default transport: a keep-alive connection pool with retries and backoff on 429/5xx."""
+    retry = CappedRetry(
+        total=MAX_RETRIES,
+        backoff_factor=BACKOFF_FACTOR,
+        status_forcelist=RETRY_STATUSES,
+        allowed_methods=frozenset(['GET']),
+        respect_retry_after_header=True,
+        raise_on_status=False,
+    )
+    return HTTPAdapter(pool_connections=4, pool_maxsize=POOL_SIZE, max_retries=retry)
+
+
+_session = None
+_session_lock = threading.Lock()
+
+
+def get_session():
+    """Return the process-wide HTTP session shared by every external API call."""
+    global _session
+    with _session_lock:
+        if _session is None:
+            _session = requests.Session()
+            adapter = build_adapter()
+            _session.mount('https://', adapter)
+            _session.mount('http://', adapter)
+        return _session
+
+
+def mount_transport(prefix, adapter):
+    """Route every request whose URL starts with prefix through another transport adapter.
+
+    Useful to point the API helpers at a local stub server or an in-process fake.
+    """
+    get_session().mount(prefix, adapter)
+
+
+def close_session():
+    """Close the pooled connections, a new session is created on the next call."""
+    global _session
+    with _session_lock:
+        if _session is not None:
+            _session.close()
+            _session = None
@@ -0,0 +1,350 @@
+import json
+import os
+import threading
+import time
+from datetime import datetime, timedelta, timezone
+from importlib import import_module
+
+from flask import current_app
+from sqlalchemy import and_, delete, func, literal, select, update
+from sqlalchemy.exc import SQLAlchemyError
+
+from data_models import db, Job
+from helpers.metrics import job_duration, jobs_finished
+from my_custom_exceptions import PermanentJobError
+
+# Worker threads per process. With 0 no jobs run in the web processes, start `flask run-jobs` instead.
+WORKERS = int(os.getenv('JOB_WORKERS', 2))
+
+# Attempts of a job that keeps failing, the delay before a retry doubles each time (in seconds)
+MAX_ATTEMPTS = int(os.getenv('JOB_MAX_ATTEMPTS', 3))
+RETRY_DELAY = float(os.getenv('JOB_RETRY_DELAY', 5))
+
+# Jobs running at the same time against one upstream host, across every process ("host=limit,host=limit"
+# for specific hosts). Requests to a host are rate limited anyway, this keeps jobs from piling
+# up on the limiter and the slow ones from holding every worker.
+DEFAULT_HOST_CONCURRENCY = int(os.getenv('JOB_HOST_CONCURRENCY_DEFAULT', 2))
+HOST_CONCURRENCY = {host.strip(): int(limit) for host, _, limit in
+                    (item.partition('=') for item in os.getenv('JOB_HOST_CONCURRENCY', '').split(',') if item)}
+
+# Seconds between looks for jobs queued by other processes (jobs of this process wake a worker at once)
+POLL_INTERVAL = float(os.getenv('JOB_POLL_INTERVAL', 1))
+# A running job whose heartbeat is older than this was lost with a crashed process, it is retried
+STALE_AFTER = float(os.getenv('JOB_STALE_AFTER', 120))
+HEARTBEAT_INTERVAL = STALE_AFTER / 4
+# Days finished jobs are kept, for their status and result
+RETENTION_DAYS = float(os.getenv('JOB_RETENTION_DAYS', 7))
+
+# Seconds between two progress reports of a job written to the database
+PROGRESS_INTERVAL = 1.0
+
+ACTIVE_STATES = ('queued', 'running')
+FINISHED_STATES = ('succeeded', 'failed')
+
+job_table = Job.__table__
+
+# Job kind -> JobHandler
+_handlers = {}
+# Id of the job run by the current worker thread
+_current = threading.local()
+
+
+class JobHandler:
+    def __init__(self, function, hosts, max_attempts):
+        self.function = function
+        self.hosts = tuple(hosts)
+        self.max_attempts = max_attempts
+
+
+def job_handler(kind, hosts=(), max_attempts=MAX_ATTEMPTS):
+    """Register the function running the jobs of a kind.
+
+    The function is called, inside an app context, with the job's payload as keyword
+    arguments and returns a JSON-serializable result. Failed jobs are retried, unless the
+    function raised PermanentJobError.
+
+    Args:
+        kind (str): Name the jobs are queued under.
+        hosts: Upstream hosts the jobs call, see HOST_CONCURRENCY.
+        max_attempts (int): Attempts before a job is marked as failed, 1 for jobs that are not
+            safe to repeat.
+    """
+    def decorator(function):
+        _handlers[kind] = JobHandler(function, hosts, max_attempts)
+        return function
+    return decorator
+
+
+def enqueue(kind, hosts=None, **payload):
+    """Queue a job and commit the session, so a worker can pick it up right away.
+
+    Args:
+        kind (str): A kind registered with job_handler().
+        hosts: Upstream hosts, when they differ from the ones the kind was registered with.
+        **payload: Arguments of the handler, must be JSON-serializable.
+
+    Returns:
+        The id of the job.
+    """
+    handler = _handlers[kind]
+    now = _now()
+    job = Job(kind=kind, payload=json.dumps(payload), state='queued', host=','.join(hosts or handler.hosts) or None,
+              attempts=0, max_attempts=handler.max_attempts, created_at=now, run_after=now)
+    db.session.add(job)
+    db.session.flush()
+    job_id = job.id
+    db.session.commit()
+
+    queue = current_app.extensions.get('job_queue')
+    if queue:
+        queue.wake_up()
+    return job_id
+
+
+def get_job(job_id):
+    """Return the Job with this id, None if there is none (or it was purged)."""
+    return db.session.get(Job, job_id)
+
+
+def find_active_job(kind, states=ACTIVE_STATES):
+    """Return the id of a queued or running (or only queued, with states=('queued',)) job of this kind.
+
+    Returns:
+        The id of the oldest such job, None if there is none.
+    """
+    return db.session.scalar(select(Job.id).where(Job.kind == kind, Job.state.in_(states))
+                             .order_by(Job.id).limit(1))
+
+
+def find_latest_job(kind):
+    """Return the most recently queued Job of this kind, None if there is none."""
+    return db.session.scalar(select(Job).where(Job.kind == kind).order_by(Job.id.desc()).limit(1))
+
+
+def job_status(job):
+    """JSON-friendly summary of a job, as served by the job status endpoint."""
+    return {
+        'id': job.id,
+        'kind': job.kind,
+        'state': job.state,
+        'attempts': job.attempts,
+        'max_attempts': job.max_attempts,
+        'progress': json.loads(job.progress) if job.progress else None,
+        'result': json.loads(job.result) if job.result else None,
+        'error': job.error,
+        'created_at': _isoformat(job.created_at),
+        'started_at': _isoformat(job.started_at),
+        'finished_at': _isoformat(job.finished_at),
+    }
+
+
+def report_progress(**progress):
+    """Save a progress report of the job run by this thread (nothing happens outside of a job).
+
+    Reports are written at most once per PROGRESS_INTERVAL, in their own transaction.
+    """
+    job_id = getattr(_current, 'job_id', None)
+    if job_id is None or time.monotonic() - _current.reported < PROGRESS_INTERVAL:
+        return
+    _current.reported = time.monotonic()
+    try:
+        with db.engine.begin() as connection:
+            connection.execute(update(job_table).where(job_table.c.id == job_id)
+                               .values(progress=json.dumps(progress)))
+    except SQLAlchemyError as e:
+        current_app.logger.warning('Could not save the progress of job %s: %s', job_id, e)
+
+
+class JobQueue:
+    """Worker threads running the queued jobs of one app.
+
+    Jobs live in the job table, so they survive restarts and any process can run them. A
+    worker claims a job with a conditional UPDATE (only one process wins it, and only while
+    fewer than HOST_CONCURRENCY jobs of each of its hosts are running anywhere), runs it and
+    records the result, or queues it again with a growing delay if it failed. Another thread
+    keeps the heartbeat of the running jobs fresh, retries the jobs of crashed processes and
+    purges old finished jobs.
+    """
+
+    def __init__(self, app, workers=WORKERS, handler_modules=()):
+        self.app = app
+        self.workers = workers
+        # Modules registering job handlers, the app may not have imported them yet
+        self.handler_modules = tuple(handler_modules)
+        self._pid = None
+        self._threads = []
+        self._stopping = threading.Event()
+        self._wake_up = threading.Condition()
+        self._lock = threading.Lock()
+        self._running_jobs = set()
+
+    def start(self):
+        """Start the threads of this process, once (worker processes forked later start their own)."""
+        if self._pid == os.getpid():
+            return
+        with self._lock:
+            if self._pid == os.getpid() or not self.workers:
+                return
+            self._pid = os.getpid()
+            self._stopping.clear()
+            self._threads = [threading.Thread(target=self._work, name=f'job-worker-{number}', daemon=True)
+                             for number in range(1, self.workers + 1)]
+            self._threads.append(threading.Thread(target=self._maintain, name='job-maintenance', daemon=True))
+        for thread in self._threads:
+            thread.start()
+
+    def stop(self, timeout=None):
+        """Let the running jobs finish, then stop the threads."""
+        self._stopping.set()
+        with self._wake_up:
+            self._wake_up.notify_all()
+        for thread in self._threads:
+            thread.join(timeout)
+        self._pid = None
+
+    def wake_up(self):
+        with self._wake_up:
+            self._wake_up.notify()
+
+    def _work(self):
+        for module in self.handler_modules:
+            import_module(module)
+        while not self._stopping.is_set():
+            try:
+                with self.app.app_context():
+                    job_id = self._claim()
+                    if job_id is not None:
+                        self._run(job_id)
+                        continue
+            except Exception as e:
+                self.app.logger.exception(e)
+            with self._wake_up:
+                self._wake_up.wait(POLL_INTERVAL)
+
+    def _claim(self):
+        now = _now()
+        with db.engine.connect() as connection:
+            candidates = connection.execute(
+                select(job_table.c.id, job_table.c.host)
+                .where(job_table.c.state == 'queued', job_table.c.run_after <= now)
+                .order_by(job_table.c.run_after, job_table.c.id).limit(50)).all()
+
+        # Hosts whose jobs could not be claimed, their other jobs are left for the next round
+        busy_hosts = set()
+        for job_id, host in candidates:
+            hosts = set(host.split(',')) if host else set()
+            if hosts & busy_hosts:
+                continue
+            with db.engine.begin() as connection:
+                claimed = connection.execute(
+                    update(job_table).where(job_table.c.id == job_id, job_table.c.state == 'queued',
+                                            *[_host_has_room(host) for host in hosts])
+                    .values(state='running', attempts=job_table.c.attempts + 1, started_at=now, heartbeat_at=now,
+                            finished_at=None)).rowcount
+            if claimed:
+                return job_id
+            # Another worker got it first, or one of its hosts is at its limit
+            busy_hosts |= hosts
+        return None
+
+    def _run(self, job_id):
+        job = db.session.get(Job, job_id)
+        kind, payload, attempts, max_attempts = job.kind, job.payload, job.attempts, job.max_attempts
+        with self._lock:
+            self._running_jobs.add(job_id)
+        _current.job_id, _current.reported = job_id, 0.0
+        started = time.perf_counter()
+        try:
+            handler = _handlers.get(kind)
+            if handler is None:
+                raise PermanentJobError(f'Unknown job kind "{kind}".')
+            result = handler.function(**json.loads(payload))
+        except Exception as e:
+            db.session.rollback()
+            retry = not isinstance(e, PermanentJobError) and attempts < max_attempts
+            if not isinstance(e, PermanentJobError):
+                self.app.logger.warning('Job %s (%s) failed on attempt %s: %r', job_id, kind, attempts, e)
+            self._finish(job_id, error=str(e) or type(e).__name__,
+                         retry_after=RETRY_DELAY * 2 ** (attempts - 1) if retry else None)
+            jobs_finished.inc(kind, 'retried' if retry else 'failed')
+        else:
+            self._finish(job_id, result=result)
+            jobs_finished.inc(kind, 'succeeded')
+        finally:
+            _current.job_id = None
+            job_duration.observe(time.perf_counter() - started, kind)
+            with self._lock:
+                self._running_jobs.discard(job_id)
+
+    def _finish(self, job_id, result=None, error=None, retry_after=None):
+        now = _now()
+        if retry_after is not None:
+            values = {'state': 'queued', 'error': error, 'run_after': now + timedelta(seconds=retry_after)}
+        elif error is not None:
+            values = {'state': 'failed', 'error': error, 'finished_at': now}
+        else:
+            values = {'state': 'succeeded', 'error': None, 'result': json.dumps(result), 'finished_at': now}
+        with db.engine.begin() as connection:
+            connection.execute(update(job_table).where(job_table.c.id == job_id).values(**values))
+
+    def _maintain(self):
+        while not self._stopping.wait(HEARTBEAT_INTERVAL):
+            try:
+                with self.app.app_context():
+                    self._beat()
+            except Exception as e:
+                self.app.logger.exception(e)
+
+    def _beat(self):
+        now = _now()
+        with self._lock:
+            running_jobs = list(self._running_jobs)
+        with db.engine.begin() as connection:
+            if running_jobs:
+                connection.execute(update(job_table).where(job_table.c.id.in_(running_jobs))
+                                   .values(heartbeat_at=now))
+            lost = (job_table.c.state == 'running') & (job_table.c.heartbeat_at < now - timedelta(seconds=STALE_AFTER))
+            connection.execute(update(job_table).where(lost, job_table.c.attempts < job_table.c.max_attempts)
+                               .values(state='queued', run_after=now, error='The worker running the job stopped.'))
+            connection.execute(update(job_table).where(lost)
+                               .values(state='failed', finished_at=now, error='The worker running the job stopped.'))
+            connection.execute(delete(job_table).where(job_table.c.state.in_(FINISHED_STATES),
+                                                       job_table.c.finished_at < now - timedelta(days=RETENTION_DAYS)))
+
+
+def init_job_queue(app, handler_modules=()):
+    """Run the app's queued jobs in worker threads of every process serving it.
+
+    The threads start with the first request a process handles, so with gunicorn's
+    preload_app each forked worker process gets its own (threads do not survive a fork).
+
+    Args:
+        app: The Flask app.
+        handler_modules: Names of the modules registering job handlers, imported by the
+            worker threads when they start (not when the app is created).
+    """
+    app.config.setdefault('JOB_WORKERS', WORKERS)
+    queue = app.extensions['job_queue'] = JobQueue(app, app.config['JOB_WORKERS'], handler_modules)
+
+    @app.before_request
+    def start_job_workers():
+        queue.start()
+
+    return queue
+
+
+def _host_has_room(host):
+    """Condition true while fewer running jobs call host than HOST_CONCURRENCY allows, for the claiming UPDATE."""
+    running = job_table.alias('running')
+    calls_host = (literal(',') + running.c.host + ',').contains(f',{host},', autoescape=True)
+    return (select(func.count()).select_from(running)
+            .where(and_(running.c.state == 'running', calls_host)).scalar_subquery()
+            < HOST_CONCURRENCY.get(host, DEFAULT_HOST_CONCURRENCY))
+
+
+def _now():
+    return datetime.now(timezone.utc).replace(tzinfo=None)
+
+
+def _isoformat(moment):
+    return moment.isoformat() + 'Z' if moment else None
@@ -0,0 +1,47 @@
+from flask import Blueprint
+from werkzeug.utils import cached_property, import_string
+
+
+class LazyView:
+    """View function imported from its module on the first request it handles.
+
+    Args:
+        import_name (str): Dotted path of the function, e.g. 'views.catalogue.home'.
+    """
+
+    def __init__(self, import_name):
+        self.__module__, self.__name__ = import_name.rsplit('.', 1)
+        self.import_name = import_name
+
+    @cached_property
+    def view(self):
+        return import_string(self.import_name)
+
+    def __call__(self, *args, **kwargs):
+        return self.view(*args, **kwargs)
+
+
+class LazyBlueprint(Blueprint):
+    """Blueprint whose URL rules are known when the app is created, but whose views are not.
+
+    The views live in a module of their own, imported (with everything it imports) by the
+    first request one of them handles. Processes and tests that never serve a route of the
+    blueprint never load its dependencies.
+
+    Args:
+        name (str): Name of the blueprint, the prefix of its endpoints.
+        import_name (str): Module declaring the blueprint, usually __name__.
+        views_module (str): Module defining the view functions.
+    """
+
+    def __init__(self, name, import_name, views_module, **options):
+        super().__init__(name, import_name, **options)
+        self.views_module = views_module
+
+    def lazy_route(self, rule, view_name, **options):
+        """Route rule to the function view_name of the views module, under the endpoint '<blueprint>.<view_name>'."""
+        self.add_url_rule(rule, view_name, LazyView(f'{self.views_module}.{view_name}'), **options)
+
+    def lazy_errorhandler(self, code_or_exception, view_name):
+        """Handle an HTTP error code or exception class raised by the blueprint's views with the function view_name."""
+        self.register_error_handler(code_or_exception, LazyView(f'{self.views_module}.{view_name}'))
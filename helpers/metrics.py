@@ -0,0 +1,382 @@
+import atexit
+import json
+import logging
+import os
+import sqlite3
+import threading
+import time
+from contextlib import contextmanager
+
+from flask import before_render_template, g, has_request_context, request, template_rendered
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+from helpers.query_counter import statements_in_request
+
+# Add a Server-Timing header (SQL, template and total time) to every response
+SERVER_TIMING = os.getenv('SERVER_TIMING') == '1'
+
+DEFAULT_PATH = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'data', 'metrics.sqlite')
+# Every process serving the app (gunicorn workers, job runners) adds its metrics to this file, so
+# /metrics reports the whole deployment whichever worker answers. Empty keeps them per process.
+METRICS_PATH = os.getenv('METRICS_PATH', DEFAULT_PATH)
+# Seconds between two additions of a process's new values to the shared file
+FLUSH_INTERVAL = float(os.getenv('METRICS_FLUSH_INTERVAL', 5))
+
+logger = logging.getLogger(__name__)
+
+# Prometheus' default latency buckets, in seconds
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+STATEMENT_BUCKETS = (1, 2, 3, 5, 8, 13, 21, 34)
+
+_registry = []
+
+
+class Counter:
+    """Monotonic counter with labels, rendered in the Prometheus text format."""
+
+    kind = 'counter'
+
+    def __init__(self, name, description, labels=()):
+        self.name = name
+        self.description = description
+        self.labels = labels
+        self._values = {}
+        self._lock = threading.Lock()
+        _registry.append(self)
+
+    def inc(self, *label_values, amount=1):
+        shared_metrics.start()
+        with self._lock:
+            self._values[label_values] = self._values.get(label_values, 0) + amount
+
+    def values(self):
+        """Return {(label values, position): value}, the form the values are shared in."""
+        with self._lock:
+            return {(label_values, 0): value for label_values, value in self._values.items()}
+
+    def samples(self, values):
+        return [(self.name, label_values, value) for (label_values, _), value in values.items()]
+
+    def sample_labels(self, sample_name):
+        return self.labels
+
+
+class Histogram:
+    """Cumulative histogram with labels, rendered in the Prometheus text format."""
+
+    kind = 'histogram'
+
+    def __init__(self, name, description, labels=(), buckets=DEFAULT_BUCKETS):
+        self.name = name
+        self.description = description
+        self.labels = labels
+        self.buckets = buckets
+        # Label values -> [count per bucket..., +Inf count, sum]
+        self._values = {}
+        self._lock = threading.Lock()
+        _registry.append(self)
+
+    def observe(self, value, *label_values):
+        shared_metrics.start()
+        with self._lock:
+            counts = self._values.setdefault(label_values, [0] * (len(self.buckets) + 2))
+            for index, bound in enumerate(self.buckets):
+                if value <= bound:
+                    counts[index] += 1
+            counts[-2] += 1
+            counts[-1] += value
+
+    def values(self):
+        """Return {(label values, position): value}, position indexing the bucket counts, +Inf count and sum."""
+        with self._lock:
+            return {(label_values, position): value for label_values, counts in self._values.items()
+                    for position, value in enumerate(counts)}
+
+    def samples(self, values):
+        by_labels = {}
+        for (label_values, position), value in values.items():
+            by_labels.setdefault(label_values, [0] * (len(self.buckets) + 2))[position] = value
+        samples = []
+        for label_values, counts in by_labels.items():
+            for bound, count in zip(self.buckets, counts):
+                samples.append((f'{self.name}_bucket', label_values + (_format_value(bound),), count))
+            samples.append((f'{self.name}_bucket', label_values + ('+Inf',), counts[-2]))
+            samples.append((f'{self.name}_count', label_values, counts[-2]))
+            samples.append((f'{self.name}_sum', label_values, counts[-1]))
+        return samples
+
+    def sample_labels(self, sample_name):
+        return self.labels + ('le',) if sample_name.endswith('_bucket') else self.labels
+
+
+class CacheStats:
+    """Hit and miss counters read from the caches' own stats() when the metrics are scraped."""
+
+    kind = 'counter'
+
+    def __init__(self, name, description, key, caches):
+        self.name = name
+        self.description = description
+        self.labels = ('cache',)
+        self.key = key
+        self.caches = caches
+        _registry.append(self)
+
+    def values(self):
+        return {((cache_name,), 0): get_cache().stats()[self.key] for cache_name, get_cache in self.caches.items()}
+
+    def samples(self, values):
+        return [(self.name, label_values, value) for (label_values, _), value in values.items()]
+
+    def sample_labels(self, sample_name):
+        return self.labels
+
+
+http_requests = Counter('http_requests_total', 'Requests handled, by route and status.',
+                        ('endpoint', 'method', 'status'))
+http_request_duration = Histogram('http_request_duration_seconds', 'Request latency by route.',
+                                  ('endpoint', 'method'))
+sql_statements_per_request = Histogram('sql_statements_per_request', 'SQL statements run by one request.',
+                                       ('endpoint',), STATEMENT_BUCKETS)
+sql_time_per_request = Histogram('sql_time_per_request_seconds', 'Time one request spent in SQL.', ('endpoint',))
+sql_statement_duration = Histogram('sql_statement_duration_seconds', 'Latency of single SQL statements.')
+template_render_duration = Histogram('template_render_duration_seconds', 'Time spent rendering templates.',
+                                     ('template',))
+external_api_duration = Histogram('external_api_request_duration_seconds', 'Latency of external API calls.',
+                                  ('host',))
+external_api_errors = Counter('external_api_errors_total', 'Failed external API calls.', ('host', 'reason'))
+jobs_finished = Counter('jobs_total', 'Background job attempts, by kind and outcome.', ('kind', 'outcome'))
+job_duration = Histogram('job_duration_seconds', 'Run time of background job attempts.', ('kind',),
+                         buckets=DEFAULT_BUCKETS + (30.0, 60.0, 300.0, 900.0))
+
+
+def register_cache_metrics(caches):
+    """Expose the hit rates of caches offering stats() with 'hits' and 'misses'.
+
+    Args:
+        caches (dict): Cache name -> function returning the cache.
+    """
+    CacheStats('cache_hits_total', 'Cache lookups answered from the cache.', 'hits', caches)
+    CacheStats('cache_misses_total', 'Cache lookups that had to compute the value.', 'misses', caches)
+
+
+class SharedMetrics:
+    """Totals of the metrics of every process, kept in a SQLite file they all write to.
+
+    Each process adds what its counters and histograms grew by since its last flush, every
+    FLUSH_INTERVAL seconds (from a thread started by its first recorded value) and when it
+    exits. The totals never go backwards, even as gunicorn recycles its workers, and they
+    include the last FLUSH_INTERVAL of the other processes at most.
+
+    Args:
+        path (str): The SQLite file, empty to keep the metrics of each process to itself.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self._lock = threading.Lock()
+        self._connection = None
+        self._pid = None
+        # (metric name, label values, position) -> value already added to the totals
+        self._flushed = {}
+
+    def start(self):
+        """Start flushing this process's metrics in the background, once per process."""
+        if self._pid == os.getpid() or not self.path:
+            return
+        with self._lock:
+            if self._pid == os.getpid():
+                return
+            if self._pid is not None:
+                # Forked: the values inherited from the parent are the parent's to add
+                self._flushed = _current_values(_registry)
+                self._connection = None
+            self._pid = os.getpid()
+        threading.Thread(target=self._flush_regularly, name='metrics-flush', daemon=True).start()
+
+    def flush(self, registry):
+        """Add the growth of the registry's metrics since the last flush to the totals."""
+        with self._lock:
+            rows = []
+            for key, value in _current_values(registry).items():
+                if value != self._flushed.get(key, 0):
+                    rows.append((key[0], json.dumps(key[1]), key[2], value - self._flushed.get(key, 0)))
+                    self._flushed[key] = value
+            if rows:
+                connection = self._connect()
+                with connection:
+                    connection.executemany(
+                        "INSERT INTO metric_total (metric, labels, position, value) VALUES (?, ?, ?, ?) "
+                        "ON CONFLICT (metric, labels, position) DO UPDATE SET value = value + excluded.value", rows)
+
+    def totals(self):
+        """Return {metric name: {(label values, position): value}} of every process."""
+        with self._lock:
+            rows = self._connect().execute("SELECT metric, labels, position, value FROM metric_total").fetchall()
+        totals = {}
+        for metric, labels, position, value in rows:
+            totals.setdefault(metric, {})[tuple(json.loads(labels)), position] = value
+        return totals
+
+    def _connect(self):
+        if self._connection is None:
+            self._connection = sqlite3.connect(self.path, timeout=10, check_same_thread=False)
+            self._connection.execute(
+                "CREATE TABLE IF NOT EXISTS metric_total (metric TEXT NOT NULL, labels TEXT NOT NULL, "
+                "position INTEGER NOT NULL, value REAL NOT NULL, PRIMARY KEY (metric, labels, position))")
+        return self._connection
+
+    def _after_fork(self):
+        # The parent's flush thread may have held the lock while forking
+        self._lock = threading.Lock()
+
+    def _flush_regularly(self):
+        while True:
+            time.sleep(FLUSH_INTERVAL)
+            self.flush_safely()
+
+    def flush_safely(self):
+        if self._pid != os.getpid():
+            return
+        try:
+            self.flush(_registry)
+        except sqlite3.Error as e:
+            logger.warning('Could not share the metrics of process %s: %s', os.getpid(), e)
+
+
+shared_metrics = SharedMetrics(METRICS_PATH)
+atexit.register(shared_metrics.flush_safely)
+if hasattr(os, 'register_at_fork'):
+    os.register_at_fork(after_in_child=shared_metrics._after_fork)
+
+
+def render_metrics():
+    """Return every metric in the Prometheus text exposition format.
+
+    With METRICS_PATH, the totals of every process serving the app (after adding this one's
+    latest values), otherwise the metrics of this process only.
+    """
+    if shared_metrics.path:
+        shared_metrics.start()
+        shared_metrics.flush(_registry)
+        totals = shared_metrics.totals()
+    else:
+        totals = {metric.name: metric.values() for metric in _registry}
+    lines = []
+    for metric in _registry:
+        lines.append(f'# HELP {metric.name} {metric.description}')
+        lines.append(f'# TYPE {metric.name} {metric.kind}')
+        for sample_name, label_values, value in metric.samples(totals.get(metric.name, {})):
+            label_text = ','.join(f'{label}="{_escape(label_value)}"'
+                                  for label, label_value in zip(metric.sample_labels(sample_name), label_values))
+            lines.append(f'{sample_name}{{{label_text}}} {_format_value(value)}' if label_text
+                         else f'{sample_name} {_format_value(value)}')
+    return '\n'.join(lines) + '\n'
+
+
+@contextmanager
+def track_external_call(host):
+    """Time an external API call and count it as an error if the block raises."""
+    started = time.perf_counter()
+    try:
+        yield
+    except Exception as e:
+        # HTTP errors of the requests library carry the response (requests is not imported here, only
+        # the processes calling external APIs load it)
+        response = getattr(e, 'response', None)
+        status_code = getattr(response, 'status_code', None)
+        external_api_errors.inc(host, f'http_{status_code}' if status_code is not None else type(e).__name__)
+        raise
+    finally:
+        external_api_duration.observe(time.perf_counter() - started, host)
+
+
+def init_metrics(app):
+    """Record latency, SQL and template timings of every request.
+
+    With the SERVER_TIMING setting the timings of each response are also sent in a
+    Server-Timing header, where the browser's developer tools show them.
+    """
+    app.config.setdefault('SERVER_TIMING', SERVER_TIMING)
+
+    @app.before_request
+    def start_timer():
+        g.request_started = time.perf_counter()
+        g.sql_time = 0.0
+        g.render_time = 0.0
+
+    @app.after_request
+    def record_request(response):
+        if 'request_started' not in g:
+            return response
+        elapsed = time.perf_counter() - g.request_started
+        endpoint = request.endpoint or 'unmatched'
+        statements = statements_in_request()
+
+        http_requests.inc(endpoint, request.method, str(response.status_code))
+        http_request_duration.observe(elapsed, endpoint, request.method)
+        sql_statements_per_request.observe(statements, endpoint)
+        sql_time_per_request.observe(g.sql_time, endpoint)
+
+        if app.config['SERVER_TIMING']:
+            response.headers['Server-Timing'] = (
+                f'sql;dur={g.sql_time * 1000:.1f};desc="{statements} statements", '
+                f'render;dur={g.render_time * 1000:.1f}, total;dur={elapsed * 1000:.1f}')
+        return response
+
+    before_render_template.connect(_start_render, app)
+    template_rendered.connect(_finish_render, app)
+
+
+def _start_render(sender, template, context, **extra):
+    g.setdefault('render_started', []).append(time.perf_counter())
+
+
+def _finish_render(sender, template, context, **extra):
+    stack = g.get('render_started')
+    if not stack:
+        return
+    elapsed = time.perf_counter() - stack.pop()
+    template_render_duration.observe(elapsed, template.name or 'string')
+    # A template rendered while another one renders is already part of the outer one's time
+    if not stack and 'render_time' in g:
+        g.render_time += elapsed
+
+
+@event.listens_for(Engine, 'before_cursor_execute')
+def _start_statement(conn, cursor, statement, parameters, context, executemany):
+    conn.info.setdefault('statement_started', []).append(time.perf_counter())
+
+
+@event.listens_for(Engine, 'after_cursor_execute')
+def _finish_statement(conn, cursor, statement, parameters, context, executemany):
+    stack = conn.info.get('statement_started')
+    if not stack:
+        return
+    elapsed = time.perf_counter() - stack.pop()
+    sql_statement_duration.observe(elapsed)
+    if has_request_context() and 'sql_time' in g:
+        g.sql_time += elapsed
+
+
+@event.listens_for(Engine, 'handle_error')
+def _drop_failed_statement(exception_context):
+    connection = exception_context.connection
+    if connection is not None and connection.info.get('statement_started'):
+        connection.info['statement_started'].pop()
+
+
+def _current_values(registry):
+    return {(metric.name, label_values, position): value for metric in registry
+            for (label_values, position), value in metric.values().items()}
+
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _format_value(value):
+    if isinstance(value, float) and value.is_integer():
+        return str(int(value)) if abs(value) < 1e15 else repr(value)
+    return str(value)
@@ -0,0 +1,213 @@
+import hashlib
+import json
+import os
+import threading
+from collections import OrderedDict
+from datetime import datetime, timezone
+
+from flask import render_template, session as user_session
+from markupsafe import Markup
+from sqlalchemy import delete, insert, select, text, update
+
+from data_models import db, CatalogueChange, CatalogueVersion
+from helpers.catalogue_events import catalogue_committed, catalogue_flushed
+
+# Rendered book grids (one per sort/page) and book cards kept in memory, 0 disables the cache
+PAGE_CACHE_SIZE = int(os.getenv('PAGE_CACHE_SIZE', 256))
+CARD_CACHE_SIZE = int(os.getenv('CARD_CACHE_SIZE', 5000))
+
+# Catalogue versions whose changes are kept in the change log, a process further behind
+# rebuilds its in-memory indexes from the whole catalogue
+CHANGE_LOG_SIZE = int(os.getenv('CATALOGUE_CHANGE_LOG_SIZE', 10000))
+
+catalogue_version = CatalogueVersion.__table__
+catalogue_change = CatalogueChange.__table__
+
+# Engine URL -> whether the catalogue_version and catalogue_change tables exist on that database
+_version_ready = {}
+
+
+class LRUCache:
+    """Small thread-safe mapping that drops the least recently used entries past max_entries."""
+
+    def __init__(self, max_entries):
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            if key not in self._entries:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return self._entries[key]
+
+    def set(self, key, value):
+        if self.max_entries <= 0:
+            return
+        with self._lock:
+            self._entries[key] = value
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self):
+        with self._lock:
+            return {'hits': self.hits, 'misses': self.misses, 'entries': len(self._entries)}
+
+
+grid_cache = LRUCache(PAGE_CACHE_SIZE)
+card_cache = LRUCache(CARD_CACHE_SIZE)
+
+
+def init_page_cache():
+    """Check whether the catalogue_version and catalogue_change tables exist (created by the migrations).
+
+    Returns:
+        True if pages can be cached, False if the database has not been upgraded yet (every
+        request is then rendered from the database).
+    """
+    connection = db.session.connection()
+    if connection.dialect.name == 'sqlite':
+        ready = connection.execute(text(
+            "SELECT count(*) FROM sqlite_master WHERE type = 'table' "
+            "AND name IN ('catalogue_version', 'catalogue_change')"
+        )).scalar() == 2
+    else:
+        # Fails like the next query if the table is missing
+        connection.execute(select(catalogue_change.c.id).limit(1))
+        ready = connection.execute(select(catalogue_version.c.id).limit(1)).first() is not None
+    _version_ready[str(connection.engine.url)] = ready
+    return ready
+
+
+def get_catalogue_version():
+    """Return (version, updated_at) of the catalogue, or (0, None) if it is not tracked."""
+    if not _version_ready.get(str(db.engine.url)):
+        return 0, None
+    row = db.session.execute(
+        select(catalogue_version.c.version, catalogue_version.c.updated_at).where(catalogue_version.c.id == 1)
+    ).first()
+    return (row.version, row.updated_at) if row else (0, None)
+
+
+def get_catalogue_changes(versions):
+    """Books and authors changed by the given catalogue versions, read from the change log.
+
+    Args:
+        versions (list): The versions, in ascending order.
+
+    Returns:
+        A tuple (book ids, author ids), or None if the log is missing some of the versions
+        (pruned, or written before the log existed).
+    """
+    # The primary holds the versions just committed, even when reads go to a replica
+    with db.engine.connect() as connection:
+        rows = connection.execute(
+            select(catalogue_change.c.version, catalogue_change.c.book_ids, catalogue_change.c.author_ids)
+            .where(catalogue_change.c.version.between(versions[0], versions[-1]))).all()
+    wanted = set(versions)
+    rows = [row for row in rows if row.version in wanted]
+    if {row.version for row in rows} != wanted:
+        return None
+    book_ids, author_ids = set(), set()
+    for row in rows:
+        book_ids.update(json.loads(row.book_ids))
+        author_ids.update(json.loads(row.author_ids))
+    return book_ids, author_ids
+
+
+def page_etag(version, *parts):
+    """Strong ETag of a page rendered from the given catalogue version and request parameters."""
+    digest = hashlib.sha1(repr(parts).encode()).hexdigest()[:16]
+    return f'{version}-{digest}'
+
+
+def has_pending_flashes():
+    # Pages showing flash messages are one-off and must not be cached by the browser
+    return bool(user_session.get('_flashes'))
+
+
+def render_book_grid(key, load_page):
+    """Return the book grid HTML of a page and its next page cursor, rendering it only on a cache miss.
+
+    Args:
+        key (tuple): Identifies the page, including the catalogue version it was read at.
+            None renders the grid without caching it.
+        load_page (callable): Returns the ((Book, Author) pairs, next cursor) of the page,
+            only called on a miss so a cached page does not query the books at all.
+
+    Returns:
+        A tuple (grid_html, next_cursor).
+    """
+    if key is not None:
+        cached = grid_cache.get(key)
+        if cached is not None:
+            html, next_cursor = cached
+            return Markup(html), next_cursor
+
+    books_with_authors, next_cursor = load_page()
+    cards = [render_book_card(book, author) for book, author in books_with_authors]
+    html = render_template('_book_grid.html', cards=cards)
+    if key is not None:
+        grid_cache.set(key, (html, next_cursor))
+    return Markup(html), next_cursor
+
+
+def render_book_card(book, author):
+    # Keyed by everything the card displays, so an unchanged book is reused across pages and versions
+    key = (book.id, book.title, book.publication_year, book.cover, author.id, author.name)
+    html = card_cache.get(key)
+    if html is None:
+        html = render_template('_book_card.html', book=book, author=author)
+        card_cache.set(key, html)
+    return Markup(html)
+
+
+def bump_catalogue_version(connection):
+    """Move the catalogue to a new version, inside the transaction that changed it.
+
+    Returns:
+        The new version.
+    """
+    now = datetime.now(timezone.utc).replace(tzinfo=None)
+    version = connection.execute(update(catalogue_version).where(catalogue_version.c.id == 1)
+                                 .values(version=catalogue_version.c.version + 1, updated_at=now)
+                                 .returning(catalogue_version.c.version)).scalar()
+    if version is None:
+        connection.execute(insert(catalogue_version).values(id=1, version=1, updated_at=now))
+        version = 1
+    elif version % 100 == 0:
+        # Now and then, drop the versions no process should still be behind from the change log
+        connection.execute(delete(catalogue_change).where(catalogue_change.c.version <= version - CHANGE_LOG_SIZE))
+    return version
+
+
+@catalogue_flushed.connect
+def _bump_on_change(session, book_ids, author_ids):
+    connection = session.connection()
+    if not _version_ready.get(str(connection.engine.url)):
+        return
+    # One bump per transaction is enough, however many times it flushes
+    transaction = session.get_transaction()
+    if session.info.get('catalogue_version_bumped_in') is not transaction:
+        session.info['catalogue_version'] = bump_catalogue_version(connection)
+        session.info['catalogue_version_bumped_in'] = transaction
+    # Other processes apply the changes to their in-memory indexes from the log
+    connection.execute(insert(catalogue_change).values(
+        version=session.info['catalogue_version'], book_ids=json.dumps(sorted(book_ids)),
+        author_ids=json.dumps(sorted(author_ids))))
+
+
+@catalogue_committed.connect
+def _drop_stale_grids(session, book_ids, author_ids):
+    # Old grids could never be served again (their version is gone), free the memory right away
+    grid_cache.clear()
@@ -0,0 +1,71 @@
+from flask import g, has_request_context, request
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+from my_custom_exceptions import QueryBudgetExceeded
+
+# Most SQL statements each route may run for one request
+ROUTE_QUERY_BUDGETS = {
+    # Catalogue version, then the (possibly cached) page of books
+    'catalogue.home': 4,
+    # The book with its author, then its co-authors
+    'catalogue.book_details': 2,
+    # The new ISBN is checked against the other books first. Writes also sync the search index, bump the
+    # catalogue version and log the change for other processes
+    'catalogue.update_book': 9,
+    # Marking books deleted, their co-author credits and orphaned authors, then queueing a purge if none is waiting
+    'catalogue.delete_book': 12,
+    'catalogue.delete_books': 11,
+    'authors.delete_author': 11,
+    'catalogue.add_book': 7,
+    'authors.add_author': 2,
+    # New authors are looked up by name first, then inserted (two of them budgeted)
+    'external_search.add_searched_data': 10,
+    # Routes queueing background jobs only insert the job and read back its status
+    'external_search.search': 1,
+    'catalogue.import_books_upload': 2,
+    'external_search.start_book_enrichment': 3,
+    'external_search.book_enrichment_status': 1,
+    'job_status_view': 1,
+    # Covers are read from disk, the database is only asked for the URL of a cover not cached yet
+    'catalogue.cover': 2,
+    'catalogue.catalogue_stats': 3,
+    'api_v1.books': 4,
+    'api_v1.book': 2,
+    'api_v1.authors': 1,
+    'api_v1.stats': 4,
+    # Answered from memory, apart from applying commits and checking the catalogue version now and then
+    'api_v1.suggestions': 2,
+}
+
+
+@event.listens_for(Engine, 'before_cursor_execute')
+def _count_statement(conn, cursor, statement, parameters, context, executemany):
+    if has_request_context():
+        g.sql_statements = g.get('sql_statements', 0) + 1
+
+
+def statements_in_request():
+    """Number of SQL statements the current request has run so far."""
+    return g.get('sql_statements', 0)
+
+
+def init_query_budgets(app, budgets=None):
+    """Check every request against its route's SQL statement budget.
+
+    A request over budget is logged. With the ENFORCE_QUERY_BUDGETS setting (on by default
+    when the app is testing) it raises QueryBudgetExceeded instead, so a test run through
+    the test client fails on any route that regresses into extra queries.
+    """
+    budgets = ROUTE_QUERY_BUDGETS if budgets is None else budgets
+
+    @app.after_request
+    def check_query_budget(response):
+        budget = budgets.get(request.endpoint)
+        used = statements_in_request()
+        if budget is not None and used > budget:
+            message = f'{request.method} {request.path} ran {used} SQL statements, its budget is {budget}.'
+            if app.config.get('ENFORCE_QUERY_BUDGETS', app.testing):
+                raise QueryBudgetExceeded(message)
+            app.logger.warning(message)
+        return response
@@ -0,0 +1,51 @@
+from sqlalchemy import text
+
+from data_models import db, Book
+from helpers.helper_functions import author_by_name_query, book_by_isbn_query, books_page_query
+from helpers.soft_delete import hide_deleted
+
+
+def explain_query_plan(query):
+    """Return the detail lines of SQLite's EXPLAIN QUERY PLAN for an ORM query.
+
+    The query is explained with the criteria hiding deleted rows, which the session adds to
+    every query it runs (see helpers/soft_delete.py).
+    """
+    sql = hide_deleted(query.statement).compile(dialect=db.engine.dialect, compile_kwargs={'literal_binds': True})
+    return [row.detail for row in db.session.execute(text(f'EXPLAIN QUERY PLAN {sql}'))]
+
+
+def hot_queries():
+    """The queries that must be served by an index, with the index each one relies on.
+
+    Returns:
+        A list of (description, query, index name) tuples.
+    """
+    return [
+        ('home sorted by title', books_page_query(sort_by='title'), 'ix_book_title'),
+        ('home sorted by title, next page', books_page_query(sort_by='title', after='M,1'), 'ix_book_title'),
+        ('home sorted by publication year', books_page_query(sort_by='publication_year'),
+         'ix_book_publication_year'),
+        ('home sorted by rating', books_page_query(sort_by='rating'), 'ix_book_rating'),
+        ('home sorted by author', books_page_query(sort_by='author'), 'ix_author_name_nocase'),
+        ('delete_book: other books of the author',
+         Book.query.filter_by(author_id=1).filter(Book.id != 1), 'ix_book_author_id'),
+        ('delete_author: books of the author', Book.query.filter_by(author_id=1), 'ix_book_author_id'),
+        ('add_searched_data: author lookup by name', author_by_name_query('Agatha Christie'),
+         'ix_author_name_key'),
+        ('duplicate check: book lookup by ISBN', book_by_isbn_query('9780007527502'), 'ux_book_isbn'),
+    ]
+
+
+def check_query_plans():
+    """Explain every hot query and check that its index shows up in the plan.
+
+    Returns:
+        A list of (description, passed, plan lines) tuples.
+    """
+    results = []
+    for description, query, index_name in hot_queries():
+        plan = explain_query_plan(query)
+        passed = any(f'INDEX {index_name}' in line for line in plan)
+        results.append((description, passed, plan))
+    return results
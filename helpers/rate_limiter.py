@@ -0,0 +1,89 @@
+import asyncio
+import os
+import sqlite3
+import threading
+import time
+
+from my_custom_exceptions import RateLimitError
+
+DEFAULT_PATH = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'data', 'rate_limits.sqlite')
+# Shared by every process on the machine, so the host rates hold for the whole deployment
+RATE_LIMIT_PATH = os.getenv('RATE_LIMIT_PATH', DEFAULT_PATH)
+
+
+class TokenBucket:
+    """Token bucket of one upstream host, shared by every process through a small SQLite file.
+
+    The bucket is kept as the time its next token is free (a token is free every 1 / rate
+    seconds, capacity of them may be saved up), and a token is reserved with a single UPDATE,
+    so the web and job worker processes of a deployment stay under the host's rate together.
+    Callers are told how long to wait for their token, so they queue fairly for the rate
+    budget and nobody sleeps while a token is available.
+
+    Args:
+        host (str): The upstream host, the bucket's name in the file.
+        rate (float): Tokens per second.
+        capacity (int): Tokens that may be used at once after a quiet period.
+        path (str): The SQLite file shared by the processes.
+    """
+
+    def __init__(self, host, rate, capacity=1, path=None):
+        self.host = host
+        self.rate = rate
+        self.capacity = capacity
+        self._lock = threading.Lock()
+        self._connection = sqlite3.connect(path or RATE_LIMIT_PATH, timeout=10, check_same_thread=False,
+                                           isolation_level=None)
+        self._connection.executescript(
+            "CREATE TABLE IF NOT EXISTS rate_limit (host TEXT PRIMARY KEY, next_free REAL NOT NULL);"
+        )
+        self._connection.execute("INSERT OR IGNORE INTO rate_limit (host, next_free) VALUES (?, 0)", (host,))
+
+    def reserve(self, timeout=None):
+        """Take a token and return the number of seconds to wait before using it.
+
+        Raises:
+            RateLimitError: If the wait would be longer than timeout, no token is taken.
+        """
+        interval = 1 / self.rate
+        now = time.time()
+        # The token is free at next_free, or now if tokens were saved up in the meantime
+        earliest = now - (self.capacity - 1) * interval
+        with self._lock:
+            row = self._connection.execute(
+                "UPDATE rate_limit SET next_free = max(next_free, ?) + ? WHERE host = ? AND max(next_free, ?) - ? <= ? "
+                "RETURNING next_free",
+                (earliest, interval, self.host, earliest, now, float('inf') if timeout is None else timeout)).fetchone()
+            if row is None:
+                next_free = self._connection.execute("SELECT next_free FROM rate_limit WHERE host = ?",
+                                                     (self.host,)).fetchone()[0]
+                raise RateLimitError(f"Rate limit reached, the next request slot is {next_free - now:.1f}s away.")
+        return max(0.0, row[0] - interval - now)
+
+    def acquire(self, timeout=None):
+        wait = self.reserve(timeout)
+        if wait:
+            time.sleep(wait)
+
+    async def acquire_async(self, timeout=None):
+        wait = self.reserve(timeout)
+        if wait:
+            await asyncio.sleep(wait)
+
+
+# Requests per second allowed by each upstream host
+HOST_RATES = {
+    "hapi-books.p.rapidapi.com": float(os.getenv("HAPI_BOOKS_RATE", 5)),
+    "book-finder1.p.rapidapi.com": float(os.getenv("BOOK_FINDER_RATE", 1)),
+}
+
+_limiters = {}
+_limiters_lock = threading.Lock()
+
+
+def get_rate_limiter(host):
+    """Return the token bucket of an upstream host, shared with the other processes."""
+    with _limiters_lock:
+        if host not in _limiters:
+            _limiters[host] = TokenBucket(host, HOST_RATES.get(host, 1.0))
+        return _limiters[host]
@@ -0,0 +1,90 @@
+import os
+import random
+import time
+from functools import wraps
+
+from flask import current_app, has_request_context, session as user_session
+from flask_sqlalchemy.session import Session
+from sqlalchemy import event
+from sqlalchemy.sql.elements import TextClause
+
+# Comma separated URIs of read-only copies of DATABASE
+REPLICA_URIS = [uri.strip() for uri in os.getenv('DATABASE_REPLICAS', '').split(',') if uri.strip()]
+
+# Seconds a browser keeps reading from the primary after one of its requests wrote, longer
+# than the replication lag so the page shown after a redirect includes the write
+STICKY_SECONDS = float(os.getenv('REPLICA_STICKY_SECONDS', 10))
+
+REPLICA_BIND_PREFIX = 'replica_'
+
+_READ_ONLY_TEXT = ('SELECT', 'WITH', 'EXPLAIN', 'PRAGMA')
+
+
+class RoutingSession(Session):
+    """Session sending the reads of a request to a replica and everything else to the primary.
+
+    A statement goes to the primary when it writes, when the session is flushing or has
+    written before (so it reads its own writes, also after the commit), when the view asked
+    for it with use_primary(), or outside of requests (CLI commands, background jobs). Each
+    session sticks to one replica, so all the reads of a request see the same snapshot.
+    """
+
+    def get_bind(self, mapper=None, clause=None, bind=None, **kwargs):
+        if bind is None and not self._needs_primary(clause):
+            replicas = sorted(key for key in self._db.engines if isinstance(key, str)
+                              and key.startswith(REPLICA_BIND_PREFIX))
+            if replicas:
+                if self.info.get('replica') not in replicas:
+                    self.info['replica'] = random.choice(replicas)
+                return self._db.engines[self.info['replica']]
+        return super().get_bind(mapper=mapper, clause=clause, bind=bind, **kwargs)
+
+    def _needs_primary(self, clause):
+        if getattr(clause, 'is_dml', False) or (
+                isinstance(clause, TextClause) and not clause.text.lstrip().upper().startswith(_READ_ONLY_TEXT)):
+            # Everything after a write, in this session, reads from the primary
+            self.info['use_primary'] = True
+            self.info['wrote'] = True
+        return self.info.get('use_primary') or self._flushing or not has_request_context()
+
+
+@event.listens_for(RoutingSession, 'after_flush')
+def _remember_write(session, flush_context):
+    session.info['use_primary'] = True
+    session.info['wrote'] = True
+
+
+def replica_binds(replica_uris=None):
+    """SQLALCHEMY_BINDS entries for the replicas, routed to by RoutingSession."""
+    uris = REPLICA_URIS if replica_uris is None else replica_uris
+    return {f'{REPLICA_BIND_PREFIX}{index}': uri for index, uri in enumerate(uris)}
+
+
+def init_read_replicas(app, db):
+    """Keep browsers that just wrote on the primary for STICKY_SECONDS.
+
+    After a POST that wrote, the redirected GET reads its data from the primary even if the
+    replicas have not caught up yet.
+    """
+    if not any(key.startswith(REPLICA_BIND_PREFIX) for key in app.config.get('SQLALCHEMY_BINDS', {})):
+        return
+
+    @app.before_request
+    def stick_to_primary():
+        if user_session.get('_primary_until', 0) > time.time():
+            db.session.info['use_primary'] = True
+
+    @app.after_request
+    def remember_write(response):
+        if db.session.info.get('wrote'):
+            user_session['_primary_until'] = time.time() + STICKY_SECONDS
+        return response
+
+
+def use_primary(view):
+    """Route every query of a view to the primary database (views that read then write)."""
+    @wraps(view)
+    def wrapper(*args, **kwargs):
+        current_app.extensions['sqlalchemy'].session.info['use_primary'] = True
+        return view(*args, **kwargs)
+    return wrapper
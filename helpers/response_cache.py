@@ -0,0 +1,115 @@
+import json
+import os
+import re
+import sqlite3
+import threading
+import time
+
+# Sentinel telling a cache miss apart from a cached None
+MISS = object()
+
+DEFAULT_PATH = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'data', 'api_cache.sqlite')
+
+# Writes of a process between two checks of the cache size (a full count of the table), the cache
+# may hold up to this many extra entries per process in between
+EVICT_INTERVAL = 100
+
+
+class ResponseCache:
+    """Persistent cache of upstream API responses, stored in its own SQLite file.
+
+    Entries expire after a TTL (a shorter one for empty results) and the least recently
+    used entries are evicted once the cache holds more than max_entries, checked every
+    EVICT_INTERVAL writes.
+    """
+
+    def __init__(self, path, ttl, negative_ttl, max_entries):
+        self.ttl = ttl
+        self.negative_ttl = negative_ttl
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+        self._writes = 0
+        self._lock = threading.Lock()
+        self._connection = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self._connection.executescript(
+            "CREATE TABLE IF NOT EXISTS api_cache ("
+            " key TEXT PRIMARY KEY, value TEXT NOT NULL, expires_at REAL NOT NULL, last_used REAL NOT NULL);"
+            "CREATE INDEX IF NOT EXISTS ix_api_cache_last_used ON api_cache (last_used);"
+        )
+
+    def get(self, key):
+        """Return the cached value of key, or MISS if it is absent or expired."""
+        now = time.time()
+        with self._lock:
+            row = self._connection.execute(
+                "SELECT value, expires_at FROM api_cache WHERE key = ?", (key,)).fetchone()
+            if row is None or row[1] < now:
+                self.misses += 1
+                return MISS
+            self._connection.execute("UPDATE api_cache SET last_used = ? WHERE key = ?", (now, key))
+            self.hits += 1
+        return json.loads(row[0])
+
+    def set(self, key, value):
+        """Store a JSON-serializable value, empty values use the negative TTL."""
+        now = time.time()
+        ttl = self.ttl if value else self.negative_ttl
+        with self._lock:
+            self._connection.execute(
+                "INSERT OR REPLACE INTO api_cache (key, value, expires_at, last_used) VALUES (?, ?, ?, ?)",
+                (key, json.dumps(value), now + ttl, now))
+            self._writes += 1
+            if self._writes % EVICT_INTERVAL == 0:
+                self._evict()
+
+    def clear(self):
+        with self._lock:
+            self._connection.execute("DELETE FROM api_cache")
+
+    def stats(self):
+        with self._lock:
+            entries = self._count()
+        return {'hits': self.hits, 'misses': self.misses, 'entries': entries}
+
+    def _evict(self):
+        if self._count() <= self.max_entries:
+            return
+        # Expired entries go first, then the least recently used ones
+        self._connection.execute("DELETE FROM api_cache WHERE expires_at < ?", (time.time(),))
+        excess = self._count() - self.max_entries
+        if excess > 0:
+            self._connection.execute(
+                "DELETE FROM api_cache WHERE key IN (SELECT key FROM api_cache ORDER BY last_used LIMIT ?)",
+                (excess,))
+
+    def _count(self):
+        return self._connection.execute("SELECT COUNT(*) FROM api_cache").fetchone()[0]
+
+
+def normalize_key(*parts):
+    """Build a cache key that ignores case, extra whitespace and the order of list items (authors)."""
+    normalized = []
+    for part in parts:
+        if isinstance(part, (list, tuple)):
+            part = ','.join(sorted(normalize_key(item) for item in part))
+        normalized.append(re.sub(r'\s+', ' ', str(part or '')).strip().lower())
+    return '|'.join(normalized)
+
+
+_cache = None
+_cache_lock = threading.Lock()
+
+
+def get_response_cache():
+    """Return the process-wide response cache, configured from the environment."""
+    global _cache
+    with _cache_lock:
+        if _cache is None:
+            _cache = ResponseCache(
+                path=os.getenv('API_CACHE_PATH', DEFAULT_PATH),
+                ttl=float(os.getenv('API_CACHE_TTL', 7 * 24 * 3600)),
+                negative_ttl=float(os.getenv('API_CACHE_NEGATIVE_TTL', 3600)),
+                max_entries=int(os.getenv('API_CACHE_MAX_ENTRIES', 10000)),
+            )
+        return _cache
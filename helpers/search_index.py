@@ -0,0 +1,168 @@
+import re
+
+from sqlalchemy import bindparam, column, literal_column, table, text
+from sqlalchemy.exc import OperationalError
+
+from data_models import db, Book
+from helpers.catalogue_events import catalogue_flushed
+
+SEARCH_TABLE = 'book_search'
+
+# Column weights used by bm25(): a title hit ranks above an author hit, which ranks above additional info
+RANK_WEIGHTS = (10.0, 5.0, 1.0)
+
+book_search = table(SEARCH_TABLE, column('rowid'))
+
+# Indexed author text of a book: the first author's name, then the co-authors' ones
+AUTHOR_NAMES = ("author.name || coalesce((SELECT ' ' || group_concat(co_author.name, ' ') FROM book_co_author "
+                "JOIN author AS co_author ON co_author.id = book_co_author.author_id "
+                "WHERE book_co_author.book_id = book.id), '')")
+
+# Engine URL -> whether the FTS5 table is usable on that database
+_index_ready = {}
+
+
+def init_search_index():
+    """Create the FTS5 search table if it is missing and fill it from the catalogue.
+
+    Returns:
+        True if full-text search is available, False if the database does not support FTS5
+        (the search then falls back to ILIKE matching).
+    """
+    engine = db.engine
+    if engine.dialect.name != 'sqlite':
+        _index_ready[str(engine.url)] = False
+        return False
+
+    with engine.begin() as connection:
+        created = not _table_exists(connection)
+        if created:
+            try:
+                connection.execute(text(
+                    f"CREATE VIRTUAL TABLE {SEARCH_TABLE} USING fts5("
+                    "title, author_name, additional_info, tokenize='unicode61 remove_diacritics 2')"
+                ))
+            except OperationalError:
+                # SQLite was compiled without FTS5
+                _index_ready[str(engine.url)] = False
+                return False
+
+    if created:
+        try:
+            with engine.begin() as connection:
+                _rebuild(connection)
+        except OperationalError:
+            # The app started on a database its migrations have not upgraded yet (flask db upgrade
+            # does). SQLite commits the CREATE on its own, the table is dropped so it is created
+            # again and filled on the next start instead of staying empty.
+            with engine.begin() as connection:
+                connection.execute(text(f'DROP TABLE {SEARCH_TABLE}'))
+            raise
+
+    _index_ready[str(engine.url)] = True
+    return True
+
+
+def rebuild_search_index():
+    """Drop every indexed row and re-index the whole catalogue in one transaction."""
+    if not init_search_index():
+        return False
+    with db.engine.begin() as connection:
+        _rebuild(connection)
+    return True
+
+
+def fts_available():
+    """Return True if the search table exists on the current database."""
+    key = str(db.engine.url)
+    if key not in _index_ready:
+        _index_ready[key] = db.engine.dialect.name == 'sqlite' and _table_exists(db.session.connection())
+    return _index_ready[key]
+
+
+def include_in_migrations(object, name, type_, reflected, compare_to):
+    """Alembic include_object hook: the search table and its FTS5 shadow tables are not managed by migrations."""
+    return not (type_ == 'table' and (name == SEARCH_TABLE or name.startswith(f'{SEARCH_TABLE}_')))
+
+
+def build_match_expression(search_query):
+    """Turn free text typed by a user into a safe FTS5 MATCH expression.
+
+    Every word becomes a quoted prefix term and all terms must match, so "lord ring"
+    finds "The Lord of the Rings". Returns None when the query has no searchable words.
+    """
+    terms = re.findall(r'\w+', search_query or '')
+    if not terms:
+        return None
+    return ' '.join(f'"{term}"*' for term in terms)
+
+
+def rank_expression():
+    """Relevance of a full-text match, lower is better (only valid on a query filtered by the index)."""
+    weights = ', '.join(str(weight) for weight in RANK_WEIGHTS)
+    return literal_column(f'bm25({SEARCH_TABLE}, {weights})')
+
+
+def apply_full_text_search(query, search_query):
+    """Restrict a Book query to full-text matches.
+
+    The query is not ordered, sort by rank_expression() to get the best matches first.
+
+    Returns:
+        The filtered query, or None if full-text search cannot serve this query.
+    """
+    match_expression = build_match_expression(search_query)
+    if match_expression is None or not fts_available():
+        return None
+
+    return (query.join(book_search, book_search.c.rowid == Book.id)
+            .filter(text(f'{SEARCH_TABLE} MATCH :match_expression').bindparams(match_expression=match_expression)))
+
+
+def reindex_books(connection, book_ids):
+    """Refresh the indexed rows of the given books (books that no longer exist or are deleted are just removed)."""
+    if not book_ids:
+        return
+    ids = list(book_ids)
+    connection.execute(
+        text(f"DELETE FROM {SEARCH_TABLE} WHERE rowid IN :ids").bindparams(bindparam('ids', expanding=True)),
+        {'ids': ids})
+    connection.execute(text(
+        f"INSERT INTO {SEARCH_TABLE} (rowid, title, author_name, additional_info) "
+        f"SELECT book.id, book.title, {AUTHOR_NAMES}, book.additional_info "
+        "FROM book JOIN author ON author.id = book.author_id WHERE book.id IN :ids AND book.deleted_at IS NULL"
+    ).bindparams(bindparam('ids', expanding=True)), {'ids': ids})
+
+
+def _rebuild(connection):
+    connection.execute(text(f"DELETE FROM {SEARCH_TABLE}"))
+    connection.execute(text(
+        f"INSERT INTO {SEARCH_TABLE} (rowid, title, author_name, additional_info) "
+        f"SELECT book.id, book.title, {AUTHOR_NAMES}, book.additional_info "
+        "FROM book JOIN author ON author.id = book.author_id WHERE book.deleted_at IS NULL"
+    ))
+
+
+def _table_exists(connection):
+    return connection.execute(
+        text("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = :name"), {'name': SEARCH_TABLE}
+    ).first() is not None
+
+
+@catalogue_flushed.connect
+def _sync_search_index(session, book_ids, author_ids):
+    """Keep the search table in step with every Book/Author change, inside the same transaction."""
+    connection = session.connection()
+    if not _index_ready.get(str(connection.engine.url)):
+        return
+
+    book_ids = set(book_ids)
+    if author_ids:
+        # Renamed authors change the indexed author names of all their books, and of those they co-wrote
+        book_ids.update(connection.execute(
+            text("SELECT id FROM book WHERE (author_id IN :ids OR id IN "
+                 "(SELECT book_id FROM book_co_author WHERE author_id IN :ids)) AND deleted_at IS NULL")
+            .bindparams(bindparam('ids', expanding=True)),
+            {'ids': list(author_ids)}
+        ).scalars())
+    reindex_books(connection, book_ids)
@@ -0,0 +1,171 @@
+import os
+import time
+from datetime import datetime, timezone
+
+from sqlalchemy import delete, event, exists, select, update
+from sqlalchemy.orm import Session, with_loader_criteria
+
+from data_models import db, Author, Book, BookCoAuthor
+from helpers.catalogue_events import notify_catalogue_change
+from helpers.catalogue_stats import find_uncredited_authors
+from helpers.job_queue import enqueue, find_active_job, job_handler, report_progress
+
+# Rows hard-deleted per transaction by the purger, and seconds it pauses between two of them so
+# other writers are not kept waiting on the database lock
+PURGE_CHUNK_SIZE = int(os.getenv('PURGE_CHUNK_SIZE', 500))
+PURGE_PAUSE = float(os.getenv('PURGE_PAUSE', 0.05))
+
+# Criteria added to every ORM query, lambdas so the statements stay cacheable
+_HIDE_DELETED = (
+    with_loader_criteria(Book, lambda cls: cls.deleted_at.is_(None), include_aliases=True),
+    with_loader_criteria(Author, lambda cls: cls.deleted_at.is_(None), include_aliases=True),
+)
+
+
+def init_soft_delete():
+    """Leave the deleted books and authors out of every ORM query of the app's sessions, see _hide_deleted()."""
+    if not event.contains(Session, 'do_orm_execute', _hide_deleted):
+        event.listen(Session, 'do_orm_execute', _hide_deleted)
+
+
+def _hide_deleted(execute_state):
+    """Leave deleted books and authors out of every ORM query (relationship loads included).
+
+    Queries run with execution_options(include_deleted=True) see them. Refreshing the
+    attributes of an object already loaded is not filtered, so a book deleted in this session
+    can still be read (to name it in a flash message).
+    """
+    if (execute_state.is_select and not execute_state.is_column_load
+            and not execute_state.execution_options.get('include_deleted', False)):
+        execute_state.statement = hide_deleted(execute_state.statement)
+
+
+def hide_deleted(statement):
+    """Add the criteria leaving deleted books and authors out to an ORM select, as its execution would."""
+    return statement.options(*_HIDE_DELETED)
+
+
+def soft_delete_books(book_ids):
+    """Mark books as deleted, they disappear from every page right away and are purged later.
+
+    Their co-author credits are removed at once and the authors left without books are marked
+    as deleted too. Nothing is committed.
+
+    Returns:
+        A tuple (ids of the books deleted, ids of the authors deleted). Books that do not exist
+        or were already deleted are left out.
+    """
+    if not book_ids:
+        return [], set()
+    now = _now()
+    rows = db.session.execute(update(Book).where(Book.id.in_(book_ids), Book.deleted_at.is_(None))
+                              .values(deleted_at=now).returning(Book.id, Book.author_id)).all()
+    deleted_book_ids = [book_id for book_id, _ in rows]
+    if not deleted_book_ids:
+        return [], set()
+
+    co_author_ids = db.session.scalars(delete(BookCoAuthor).where(BookCoAuthor.book_id.in_(deleted_book_ids))
+                                       .returning(BookCoAuthor.author_id)).all()
+    # The stats triggers have already taken the books out of their authors' counts
+    deleted_author_ids = find_uncredited_authors({author_id for _, author_id in rows} | set(co_author_ids))
+    if deleted_author_ids:
+        db.session.execute(update(Author).where(Author.id.in_(deleted_author_ids), Author.deleted_at.is_(None))
+                           .values(deleted_at=now))
+    notify_catalogue_change(db.session, deleted_book_ids, deleted_author_ids)
+    return deleted_book_ids, deleted_author_ids
+
+
+def soft_delete_author(author_id):
+    """Mark an author and all their books as deleted, in two UPDATE statements.
+
+    The author's credits as a co-author are removed at once, the books they co-wrote stay.
+    Nothing is committed.
+
+    Returns:
+        The number of books deleted with the author.
+    """
+    now = _now()
+    db.session.execute(update(Author).where(Author.id == author_id).values(deleted_at=now))
+    deleted_book_ids = db.session.scalars(update(Book).where(Book.author_id == author_id, Book.deleted_at.is_(None))
+                                          .values(deleted_at=now).returning(Book.id),
+                                          execution_options={'synchronize_session': False}).all()
+    db.session.execute(delete(BookCoAuthor).where(BookCoAuthor.author_id == author_id))
+    notify_catalogue_change(db.session, deleted_book_ids, [author_id])
+    return len(deleted_book_ids)
+
+
+def purge_deleted(chunk_size=PURGE_CHUNK_SIZE, pause=PURGE_PAUSE, progress=None):
+    """Hard-delete the books and authors marked as deleted, chunk_size rows per transaction.
+
+    Deleting a prolific author in one transaction would hold SQLite's write lock for as long
+    as it takes, every chunk here is a short transaction of its own.
+
+    Args:
+        chunk_size (int): Rows deleted per transaction.
+        pause (float): Seconds to wait between two transactions.
+        progress: Optional callable receiving the numbers of books and authors purged so far.
+
+    Returns:
+        A tuple (books purged, authors purged).
+    """
+    books = authors = 0
+    while True:
+        book_ids = db.session.scalars(select(Book.id).where(Book.deleted_at.is_not(None)).limit(chunk_size)
+                                      .execution_options(include_deleted=True)).all()
+        if not book_ids:
+            break
+        _purge_chunk(delete(Book).where(Book.id.in_(book_ids)), BookCoAuthor.book_id.in_(book_ids), book_ids=book_ids)
+        books += len(book_ids)
+        if progress:
+            progress(books, authors)
+        time.sleep(pause)
+
+    while True:
+        # Authors whose books were all purged (a book added to a deleted author keeps it)
+        author_ids = db.session.scalars(select(Author.id).where(
+            Author.deleted_at.is_not(None), ~exists().where(Book.author_id == Author.id)).limit(chunk_size)
+            .execution_options(include_deleted=True)).all()
+        if not author_ids:
+            break
+        _purge_chunk(delete(Author).where(Author.id.in_(author_ids)), BookCoAuthor.author_id.in_(author_ids),
+                     author_ids=author_ids)
+        authors += len(author_ids)
+        if progress:
+            progress(books, authors)
+        time.sleep(pause)
+    return books, authors
+
+
+def _purge_chunk(statement, co_author_criteria, book_ids=(), author_ids=()):
+    try:
+        # Credits first, they reference the books and authors being deleted
+        db.session.execute(delete(BookCoAuthor).where(co_author_criteria))
+        db.session.execute(statement, execution_options={'synchronize_session': False})
+        notify_catalogue_change(db.session, book_ids, author_ids)
+        db.session.commit()
+    except Exception:
+        db.session.rollback()
+        raise
+
+
+def queue_purge():
+    """Queue a purge_deleted_job(), unless one is already waiting to run.
+
+    A purge that is already running may have passed the rows deleted since, so only a queued
+    one makes another unnecessary.
+
+    Returns:
+        The id of the queued job.
+    """
+    return find_active_job('purge_deleted', states=('queued',)) or enqueue('purge_deleted')
+
+
+@job_handler('purge_deleted')
+def purge_deleted_job():
+    """Purge the deleted books and authors in the background, see purge_deleted()."""
+    books, authors = purge_deleted(progress=lambda books, authors: report_progress(books=books, authors=authors))
+    return {'books': books, 'authors': authors}
+
+
+def _now():
+    return datetime.now(timezone.utc).replace(tzinfo=None)
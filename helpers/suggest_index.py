@@ -0,0 +1,202 @@
+import bisect
+import os
+import re
+import unicodedata
+
+from helpers.catalogue_events import catalogue_committed
+from helpers.catalogue_index import CatalogueIndex
+
+# Set SUGGEST_INDEX=0 to skip building the index (the suggest endpoint then answers nothing)
+SUGGEST_INDEX = os.getenv('SUGGEST_INDEX', '1') == '1'
+
+# Seconds between checks of the catalogue version for writes made by other processes, in
+# between suggestions are answered without touching the database
+SYNC_INTERVAL = float(os.getenv('SUGGEST_SYNC_INTERVAL', 5))
+
+DEFAULT_LIMIT = 10
+MAX_LIMIT = 50
+# Completions of a prefix ranked by their number of books, among the first MAX_SCANNED in name order
+MAX_SCANNED = 200
+# Prefixes up to this length complete to too many entries to scan, the completions of each are
+# kept ranked instead, over the whole catalogue
+SHORT_PREFIX_LENGTH = 2
+
+# Leading words a title is also found without ("hobbit" completes to "The Hobbit")
+ARTICLES = {'the', 'a', 'an', 'le', 'la', 'les', 'el', 'los', 'las', 'der', 'die', 'das', 'o', 'os', 'as'}
+
+# Separates the key, kind and display text of an entry, sorts before every other character so
+# entries stay in key order
+SEPARATOR = '\x00'
+
+
+def normalize_prefix(text):
+    """Lowercase words of text without accents or punctuation, joined by single spaces."""
+    text = ''.join(char for char in unicodedata.normalize('NFKD', text or '') if not unicodedata.combining(char))
+    return ' '.join(re.findall(r'[^\W_]+', text.casefold()))
+
+
+def entry_keys(kind, text):
+    """Keys a title or an author name is found under.
+
+    Titles are found by their first words, with or without a leading article, author names
+    by their first words or from any later word on (so by surname too).
+    """
+    words = normalize_prefix(text).split()
+    if not words:
+        return []
+    keys = [' '.join(words)]
+    if kind == 'title':
+        if len(words) > 1 and words[0] in ARTICLES:
+            keys.append(' '.join(words[1:]))
+    else:
+        keys.extend(' '.join(words[index:]) for index in range(1, len(words)))
+    return keys
+
+
+class PrefixIndex:
+    """Sorted array of the title and author name keys of the catalogue, searched with bisect.
+
+    Each entry is "key, kind, display text" in one string, with the number of books it
+    stands for. The completions of a prefix are the run of entries starting with it. Those of
+    short prefixes are also kept ranked, as (-books, casefolded text, kind, text) lists.
+    """
+
+    def __init__(self):
+        self.version = 0
+        self.entries = []
+        self.counts = {}
+        self.book_entries = {}
+        self.ranked = {}
+
+    @classmethod
+    def build(cls, rows, version=0):
+        """Build the index from (book id, title, author names) rows in one sort."""
+        index = cls()
+        index.version = version
+        for book_id, title, author_names in rows:
+            entries = index._book_entries(title, author_names)
+            index.book_entries[book_id] = entries
+            for entry in entries:
+                index.counts[entry] = index.counts.get(entry, 0) + 1
+        index.entries = sorted(index.counts)
+        for prefix, completion in index._ranked_completions(index.counts):
+            index.ranked.setdefault(prefix, []).append(completion)
+        for completions in index.ranked.values():
+            completions.sort()
+        return index
+
+    def add_book(self, book_id, title, author_names):
+        self.remove_book(book_id)
+        entries = self._book_entries(title, author_names)
+        self.book_entries[book_id] = entries
+        before = self._ranked_completions(entries)
+        for entry in entries:
+            count = self.counts.get(entry, 0)
+            if not count:
+                bisect.insort(self.entries, entry)
+            self.counts[entry] = count + 1
+        self._rerank(before, self._ranked_completions(entries))
+
+    def remove_book(self, book_id):
+        entries = self.book_entries.pop(book_id, ())
+        before = self._ranked_completions(entries)
+        for entry in entries:
+            count = self.counts[entry] - 1
+            if count:
+                self.counts[entry] = count
+            else:
+                del self.counts[entry]
+                del self.entries[bisect.bisect_left(self.entries, entry)]
+        self._rerank(before, self._ranked_completions(entries))
+
+    def suggest(self, prefix, limit=DEFAULT_LIMIT):
+        """Return up to limit dicts (text, type, books) completing prefix, those with the most books first."""
+        key = normalize_prefix(prefix)
+        if not key:
+            return []
+        if len(key) <= SHORT_PREFIX_LENGTH:
+            return [{'text': text, 'type': kind, 'books': -negative_books}
+                    for negative_books, _, kind, text in self.ranked.get(key, [])[:limit]]
+
+        # (kind, display text) -> number of books, a title found with and without its article counts once
+        found = {}
+        start = bisect.bisect_left(self.entries, key)
+        for entry in self.entries[start:start + MAX_SCANNED]:
+            if not entry.startswith(key):
+                break
+            _, kind, text = entry.split(SEPARATOR)
+            books = self.counts[entry]
+            if (kind, text) not in found or found[kind, text] < books:
+                found[kind, text] = books
+
+        ranked = sorted(found.items(), key=lambda item: (-item[1], item[0][1].casefold()))
+        return [{'text': text, 'type': kind, 'books': books} for (kind, text), books in ranked[:limit]]
+
+    def _ranked_completions(self, entries):
+        """(short prefix, ranked completion) pairs of entries, at their current number of books.
+
+        All the entries of a title or name have the same number of books, it is listed once
+        under each short prefix of its keys.
+        """
+        completions = set()
+        for entry in entries:
+            books = self.counts.get(entry)
+            if books:
+                key, kind, text = entry.split(SEPARATOR)
+                for length in range(1, min(len(key), SHORT_PREFIX_LENGTH) + 1):
+                    completions.add((key[:length], (-books, text.casefold(), kind, text)))
+        return completions
+
+    def _rerank(self, before, after):
+        for prefix, completion in before - after:
+            completions = self.ranked[prefix]
+            del completions[bisect.bisect_left(completions, completion)]
+            if not completions:
+                del self.ranked[prefix]
+        for prefix, completion in after - before:
+            bisect.insort(self.ranked.setdefault(prefix, []), completion)
+
+    @staticmethod
+    def _book_entries(title, author_names):
+        entries = {f'{key}{SEPARATOR}title{SEPARATOR}{title}' for key in entry_keys('title', title)}
+        for author_name in author_names:
+            entries.update(f'{key}{SEPARATOR}author{SEPARATOR}{author_name}'
+                           for key in entry_keys('author', author_name))
+        return tuple(entries)
+
+
+class SuggestIndex(CatalogueIndex):
+    """Process-wide PrefixIndex kept in step with the catalogue (see CatalogueIndex).
+
+    Other processes' writes are looked for every SYNC_INTERVAL seconds, in between suggestions
+    are answered without touching the database.
+    """
+
+    def __init__(self):
+        super().__init__('suggest-index', SYNC_INTERVAL)
+
+    def create_index(self, rows, version):
+        return PrefixIndex.build(rows, version)
+
+    def suggest(self, prefix, limit=DEFAULT_LIMIT):
+        """Return the completions of prefix, [] if the index has not been built."""
+        return self.lookup(lambda index: index.suggest(prefix, limit)) or []
+
+
+suggest_index = SuggestIndex()
+
+
+def init_suggest_index():
+    """Build the prefix index of titles and author names, unless SUGGEST_INDEX is off."""
+    if SUGGEST_INDEX:
+        suggest_index.build()
+
+
+def suggest(prefix, limit=DEFAULT_LIMIT):
+    """Title and author name completions of prefix, the ones with the most books first."""
+    return suggest_index.suggest(prefix, limit)
+
+
+@catalogue_committed.connect
+def _note_commit(session, book_ids, author_ids):
+    suggest_index.note_commit(book_ids, author_ids, session.info.get('catalogue_version'))
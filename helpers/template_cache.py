@@ -0,0 +1,35 @@
+import os
+
+from jinja2 import FileSystemBytecodeCache
+
+DEFAULT_DIRECTORY = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'data',
+                                 'template_cache')
+# Where compiled templates are kept between runs, set it to an empty value to compile them in every process
+TEMPLATE_CACHE_DIRECTORY = os.getenv('TEMPLATE_CACHE_DIRECTORY', DEFAULT_DIRECTORY)
+
+
+def init_template_cache(app):
+    """Keep the bytecode of the compiled templates on disk, shared by every process.
+
+    A new process then loads the bytecode of a template the first time it renders it, instead
+    of parsing and compiling its source. Entries are checked against the template source, an
+    edited template is compiled again.
+    """
+    directory = app.config.setdefault('TEMPLATE_CACHE_DIRECTORY', TEMPLATE_CACHE_DIRECTORY)
+    if directory:
+        os.makedirs(directory, exist_ok=True)
+        app.jinja_env.bytecode_cache = FileSystemBytecodeCache(directory)
+
+
+def precompile_templates(app):
+    """Compile every template of the app into the bytecode cache, before a process renders them.
+
+    Returns:
+        The number of templates compiled, 0 when the cache is disabled.
+    """
+    if app.jinja_env.bytecode_cache is None:
+        return 0
+    names = app.jinja_env.list_templates()
+    for name in names:
+        app.jinja_env.get_template(name)
+    return len(names)
@@ -0,0 +1,38 @@
+"""add lookup and sort indexes
+
+The unique ISBN index fails if two books already share a non-empty ISBN,
+remove the duplicates before upgrading.
+
+Revision ID: 2a0ffcfdc310
+Revises: c219ba6164f0
+Create Date: 2026-10-18 04:14:18.526414
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '2a0ffcfdc310'
+down_revision = 'c219ba6164f0'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_index('ix_author_name_nocase', 'author', [sa.text('name COLLATE NOCASE')], unique=False)
+    op.create_index('ix_book_author_id', 'book', ['author_id'], unique=False)
+    op.create_index('ix_book_title', 'book', ['title', 'id'], unique=False)
+    op.create_index('ix_book_publication_year', 'book', ['publication_year', 'id'], unique=False)
+    op.create_index('ix_book_rating', 'book', ['rating', 'id'], unique=False)
+    op.create_index('ux_book_isbn', 'book', ['isbn'], unique=True,
+                    sqlite_where=sa.text("isbn != ''"))
+
+
+def downgrade():
+    op.drop_index('ux_book_isbn', table_name='book')
+    op.drop_index('ix_book_rating', table_name='book')
+    op.drop_index('ix_book_publication_year', table_name='book')
+    op.drop_index('ix_book_title', table_name='book')
+    op.drop_index('ix_book_author_id', table_name='book')
+    op.drop_index('ix_author_name_nocase', table_name='author')
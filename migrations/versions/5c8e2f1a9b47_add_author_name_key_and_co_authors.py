@@ -0,0 +1,70 @@
+"""add author name key and co-authors
+
+Fills the normalized name of every existing author. Duplicate authors are
+left in place, merge them afterwards with flask merge-duplicate-authors.
+
+Revision ID: 5c8e2f1a9b47
+Revises: 7d41e0b9a3c2
+Create Date: 2026-10-18 11:26:05.503118
+
+"""
+import re
+import unicodedata
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '5c8e2f1a9b47'
+down_revision = '7d41e0b9a3c2'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # SQLite can only add a NOT NULL column that has a default
+    op.add_column('author', sa.Column('name_key', sa.String(length=100), nullable=False, server_default=''))
+
+    author = sa.table('author', sa.column('id', sa.Integer), sa.column('name', sa.String),
+                      sa.column('name_key', sa.String))
+    connection = op.get_bind()
+    keys = [{'author_id': author_id, 'key': normalize_author_name(name)}
+            for author_id, name in connection.execute(sa.select(author.c.id, author.c.name))]
+    if keys:
+        connection.execute(author.update().where(author.c.id == sa.bindparam('author_id'))
+                           .values(name_key=sa.bindparam('key')), keys)
+    op.create_index('ix_author_name_key', 'author', ['name_key'], unique=False)
+
+    op.create_table(
+        'book_co_author',
+        sa.Column('book_id', sa.Integer(), nullable=False),
+        sa.Column('author_id', sa.Integer(), nullable=False),
+        sa.Column('position', sa.Integer(), nullable=False),
+        sa.ForeignKeyConstraint(['author_id'], ['author.id'], ondelete='CASCADE'),
+        sa.ForeignKeyConstraint(['book_id'], ['book.id'], ondelete='CASCADE'),
+        sa.PrimaryKeyConstraint('book_id', 'author_id')
+    )
+    op.create_index('ix_book_co_author_author_id', 'book_co_author', ['author_id'], unique=False)
+
+
+def normalize_author_name(name):
+    # Copied from helpers/author_names.py as it is at this revision, later changes there must not alter it
+    name = ''.join(char for char in unicodedata.normalize('NFKD', name or '') if not unicodedata.combining(char))
+    words = re.findall(r'[^\W_]+', name.casefold())
+    key = []
+    initials = False
+    for word in words:
+        if len(word) == 1 and initials:
+            key[-1] += word
+        else:
+            key.append(word)
+            initials = len(word) == 1
+    return ' '.join(key)[:100]
+
+
+def downgrade():
+    op.drop_index('ix_book_co_author_author_id', table_name='book_co_author')
+    op.drop_table('book_co_author')
+    op.drop_index('ix_author_name_key', table_name='author')
+    op.drop_column('author', 'name_key')
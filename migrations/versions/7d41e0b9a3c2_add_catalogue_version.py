@@ -0,0 +1,34 @@
+"""add catalogue version
+
+Revision ID: 7d41e0b9a3c2
+Revises: 2a0ffcfdc310
+Create Date: 2026-10-18 09:02:41.118230
+
+"""
+from datetime import datetime, timezone
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '7d41e0b9a3c2'
+down_revision = '2a0ffcfdc310'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    catalogue_version = op.create_table(
+        'catalogue_version',
+        sa.Column('id', sa.Integer(), nullable=False),
+        sa.Column('version', sa.Integer(), nullable=False),
+        sa.Column('updated_at', sa.DateTime(), nullable=False),
+        sa.PrimaryKeyConstraint('id')
+    )
+    op.bulk_insert(catalogue_version,
+                   [{'id': 1, 'version': 1, 'updated_at': datetime.now(timezone.utc).replace(tzinfo=None)}])
+
+
+def downgrade():
+    op.drop_table('catalogue_version')
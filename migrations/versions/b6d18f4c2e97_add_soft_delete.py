@@ -0,0 +1,127 @@
+"""add soft delete
+
+Adds deleted_at to books and authors, leaves deleted books out of the ISBN uniqueness and
+replaces the book stats triggers with ones that do not count deleted books.
+
+Revision ID: b6d18f4c2e97
+Revises: e4a7c1d9f302
+Create Date: 2026-10-18 17:38:11.402856
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+BOOK_TRIGGERS = ('book_stats_insert', 'book_stats_delete', 'book_stats_update')
+
+
+# revision identifiers, used by Alembic.
+revision = 'b6d18f4c2e97'
+down_revision = 'e4a7c1d9f302'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.add_column('author', sa.Column('deleted_at', sa.DateTime(), nullable=True))
+    op.add_column('book', sa.Column('deleted_at', sa.DateTime(), nullable=True))
+    op.create_index('ix_author_deleted_at', 'author', ['deleted_at'], unique=False,
+                    sqlite_where=sa.text('deleted_at IS NOT NULL'))
+    op.create_index('ix_book_deleted_at', 'book', ['deleted_at'], unique=False,
+                    sqlite_where=sa.text('deleted_at IS NOT NULL'))
+    op.drop_index('ux_book_isbn', table_name='book')
+    op.create_index('ux_book_isbn', 'book', ['isbn'], unique=True,
+                    sqlite_where=sa.text("isbn != '' AND deleted_at IS NULL"))
+
+    # Copied from helpers/catalogue_stats.py as it is at this revision, later changes there must not alter it
+    for name in BOOK_TRIGGERS:
+        op.execute(f'DROP TRIGGER IF EXISTS {name}')
+    op.execute("""
+        CREATE TRIGGER book_stats_insert AFTER INSERT ON book WHEN NEW.deleted_at IS NULL BEGIN
+            INSERT INTO author_stats (author_id, book_count, co_author_count, rated_count, rating_sum)
+            VALUES (NEW.author_id, 1, 0, NEW.rating IS NOT NULL, coalesce(NEW.rating, 0))
+            ON CONFLICT (author_id) DO UPDATE SET book_count = book_count + 1,
+                rated_count = rated_count + excluded.rated_count, rating_sum = rating_sum + excluded.rating_sum;
+            INSERT INTO year_stats (publication_year, book_count) VALUES (NEW.publication_year, 1)
+            ON CONFLICT (publication_year) DO UPDATE SET book_count = book_count + 1;
+        END
+    """)
+    op.execute("""
+        CREATE TRIGGER book_stats_delete AFTER DELETE ON book WHEN OLD.deleted_at IS NULL BEGIN
+            UPDATE author_stats SET book_count = book_count - 1, rated_count = rated_count - (OLD.rating IS NOT NULL),
+                rating_sum = CASE WHEN rated_count = (OLD.rating IS NOT NULL) THEN 0.0
+                                  ELSE rating_sum - coalesce(OLD.rating, 0) END
+            WHERE author_id = OLD.author_id;
+            UPDATE year_stats SET book_count = book_count - 1 WHERE publication_year = OLD.publication_year;
+            DELETE FROM year_stats WHERE publication_year = OLD.publication_year AND book_count <= 0;
+        END
+    """)
+    op.execute("""
+        CREATE TRIGGER book_stats_update AFTER UPDATE OF author_id, rating, publication_year, deleted_at ON book
+        WHEN OLD.author_id IS NOT NEW.author_id OR OLD.rating IS NOT NEW.rating
+            OR OLD.publication_year IS NOT NEW.publication_year OR (OLD.deleted_at IS NULL) != (NEW.deleted_at IS NULL)
+        BEGIN
+            UPDATE author_stats SET book_count = book_count - 1, rated_count = rated_count - (OLD.rating IS NOT NULL),
+                rating_sum = CASE WHEN rated_count = (OLD.rating IS NOT NULL) THEN 0.0
+                                  ELSE rating_sum - coalesce(OLD.rating, 0) END
+            WHERE author_id = OLD.author_id AND OLD.deleted_at IS NULL;
+            INSERT INTO author_stats (author_id, book_count, co_author_count, rated_count, rating_sum)
+            SELECT NEW.author_id, 1, 0, NEW.rating IS NOT NULL, coalesce(NEW.rating, 0) WHERE NEW.deleted_at IS NULL
+            ON CONFLICT (author_id) DO UPDATE SET book_count = book_count + 1,
+                rated_count = rated_count + excluded.rated_count, rating_sum = rating_sum + excluded.rating_sum;
+            UPDATE year_stats SET book_count = book_count - 1
+            WHERE publication_year = OLD.publication_year AND OLD.deleted_at IS NULL;
+            INSERT INTO year_stats (publication_year, book_count)
+            SELECT NEW.publication_year, 1 WHERE NEW.deleted_at IS NULL
+            ON CONFLICT (publication_year) DO UPDATE SET book_count = book_count + 1;
+            DELETE FROM year_stats WHERE publication_year = OLD.publication_year AND book_count <= 0;
+        END
+    """)
+
+
+def downgrade():
+    # Without the column deleted rows would come back, purge them first
+    op.execute('DELETE FROM book_co_author WHERE book_id IN (SELECT id FROM book WHERE deleted_at IS NOT NULL) '
+               'OR author_id IN (SELECT id FROM author WHERE deleted_at IS NOT NULL)')
+    op.execute('DELETE FROM book WHERE deleted_at IS NOT NULL')
+    op.execute('DELETE FROM author WHERE deleted_at IS NOT NULL AND id NOT IN (SELECT author_id FROM book)')
+
+    # The previous triggers count every book
+    for name in BOOK_TRIGGERS:
+        op.execute(f'DROP TRIGGER IF EXISTS {name}')
+    op.execute(
+        "CREATE TRIGGER book_stats_insert AFTER INSERT ON book BEGIN "
+        "INSERT INTO author_stats (author_id, book_count, co_author_count, rated_count, rating_sum) "
+        "VALUES (NEW.author_id, 1, 0, NEW.rating IS NOT NULL, coalesce(NEW.rating, 0)) "
+        "ON CONFLICT (author_id) DO UPDATE SET book_count = book_count + 1, "
+        "rated_count = rated_count + excluded.rated_count, rating_sum = rating_sum + excluded.rating_sum; "
+        "INSERT INTO year_stats (publication_year, book_count) VALUES (NEW.publication_year, 1) "
+        "ON CONFLICT (publication_year) DO UPDATE SET book_count = book_count + 1; END")
+    op.execute(
+        "CREATE TRIGGER book_stats_delete AFTER DELETE ON book BEGIN "
+        "UPDATE author_stats SET book_count = book_count - 1, rated_count = rated_count - (OLD.rating IS NOT NULL), "
+        "rating_sum = CASE WHEN rated_count = (OLD.rating IS NOT NULL) THEN 0.0 "
+        "ELSE rating_sum - coalesce(OLD.rating, 0) END WHERE author_id = OLD.author_id; "
+        "UPDATE year_stats SET book_count = book_count - 1 WHERE publication_year = OLD.publication_year; "
+        "DELETE FROM year_stats WHERE publication_year = OLD.publication_year AND book_count <= 0; END")
+    op.execute(
+        "CREATE TRIGGER book_stats_update AFTER UPDATE OF author_id, rating, publication_year ON book "
+        "WHEN OLD.author_id IS NOT NEW.author_id OR OLD.rating IS NOT NEW.rating "
+        "OR OLD.publication_year IS NOT NEW.publication_year BEGIN "
+        "UPDATE author_stats SET book_count = book_count - 1, rated_count = rated_count - (OLD.rating IS NOT NULL), "
+        "rating_sum = CASE WHEN rated_count = (OLD.rating IS NOT NULL) THEN 0.0 "
+        "ELSE rating_sum - coalesce(OLD.rating, 0) END WHERE author_id = OLD.author_id; "
+        "INSERT INTO author_stats (author_id, book_count, co_author_count, rated_count, rating_sum) "
+        "VALUES (NEW.author_id, 1, 0, NEW.rating IS NOT NULL, coalesce(NEW.rating, 0)) "
+        "ON CONFLICT (author_id) DO UPDATE SET book_count = book_count + 1, "
+        "rated_count = rated_count + excluded.rated_count, rating_sum = rating_sum + excluded.rating_sum; "
+        "UPDATE year_stats SET book_count = book_count - 1 WHERE publication_year = OLD.publication_year; "
+        "INSERT INTO year_stats (publication_year, book_count) VALUES (NEW.publication_year, 1) "
+        "ON CONFLICT (publication_year) DO UPDATE SET book_count = book_count + 1; "
+        "DELETE FROM year_stats WHERE publication_year = OLD.publication_year AND book_count <= 0; END")
+
+    op.drop_index('ux_book_isbn', table_name='book')
+    op.create_index('ux_book_isbn', 'book', ['isbn'], unique=True, sqlite_where=sa.text("isbn != ''"))
+    op.drop_index('ix_book_deleted_at', table_name='book')
+    op.drop_index('ix_author_deleted_at', table_name='author')
+    op.drop_column('book', 'deleted_at')
+    op.drop_column('author', 'deleted_at')
@@ -0,0 +1,49 @@
+"""initial schema
+
+The author and book tables as they existed before migrations were introduced.
+Databases created with db.create_all() should be stamped with this revision
+(flask db stamp c219ba6164f0) instead of upgraded to it.
+
+Revision ID: c219ba6164f0
+Revises: 
+Create Date: 2026-10-18 04:14:17.145537
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'c219ba6164f0'
+down_revision = None
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table(
+        'author',
+        sa.Column('id', sa.Integer(), nullable=False),
+        sa.Column('name', sa.String(length=100), nullable=False),
+        sa.Column('birth_date', sa.Date(), nullable=True),
+        sa.Column('date_of_death', sa.Date(), nullable=True),
+        sa.PrimaryKeyConstraint('id')
+    )
+    op.create_table(
+        'book',
+        sa.Column('id', sa.Integer(), nullable=False),
+        sa.Column('isbn', sa.String(length=13), nullable=True),
+        sa.Column('title', sa.String(length=200), nullable=False),
+        sa.Column('publication_year', sa.Integer(), nullable=False),
+        sa.Column('author_id', sa.Integer(), nullable=False),
+        sa.Column('cover', sa.String(), nullable=True),
+        sa.Column('rating', sa.Float(), nullable=True),
+        sa.Column('additional_info', sa.Text(), nullable=True),
+        sa.ForeignKeyConstraint(['author_id'], ['author.id']),
+        sa.PrimaryKeyConstraint('id')
+    )
+
+
+def downgrade():
+    op.drop_table('book')
+    op.drop_table('author')
@@ -0,0 +1,129 @@
+"""add catalogue stats
+
+Creates the author_stats and year_stats tables, fills them from the catalogue and adds the
+triggers keeping them up to date (see helpers/catalogue_stats.py). The statements are copied
+here as they were at this revision, later revisions replace the triggers.
+
+Revision ID: e4a7c1d9f302
+Revises: 9b3f6d2e8a15
+Create Date: 2026-10-18 16:12:48.927301
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'e4a7c1d9f302'
+down_revision = '9b3f6d2e8a15'
+branch_labels = None
+depends_on = None
+
+TRIGGERS = {
+    'book_stats_insert': """
+        CREATE TRIGGER book_stats_insert AFTER INSERT ON book BEGIN
+            INSERT INTO author_stats (author_id, book_count, co_author_count, rated_count, rating_sum)
+            VALUES (NEW.author_id, 1, 0, NEW.rating IS NOT NULL, coalesce(NEW.rating, 0))
+            ON CONFLICT (author_id) DO UPDATE SET book_count = book_count + 1,
+                rated_count = rated_count + excluded.rated_count, rating_sum = rating_sum + excluded.rating_sum;
+            INSERT INTO year_stats (publication_year, book_count) VALUES (NEW.publication_year, 1)
+            ON CONFLICT (publication_year) DO UPDATE SET book_count = book_count + 1;
+        END
+    """,
+    'book_stats_delete': """
+        CREATE TRIGGER book_stats_delete AFTER DELETE ON book BEGIN
+            UPDATE author_stats SET book_count = book_count - 1, rated_count = rated_count - (OLD.rating IS NOT NULL),
+                rating_sum = CASE WHEN rated_count = (OLD.rating IS NOT NULL) THEN 0.0
+                                  ELSE rating_sum - coalesce(OLD.rating, 0) END
+            WHERE author_id = OLD.author_id;
+            UPDATE year_stats SET book_count = book_count - 1 WHERE publication_year = OLD.publication_year;
+            DELETE FROM year_stats WHERE publication_year = OLD.publication_year AND book_count <= 0;
+        END
+    """,
+    'book_stats_update': """
+        CREATE TRIGGER book_stats_update AFTER UPDATE OF author_id, rating, publication_year ON book
+        WHEN OLD.author_id IS NOT NEW.author_id OR OLD.rating IS NOT NEW.rating
+            OR OLD.publication_year IS NOT NEW.publication_year
+        BEGIN
+            UPDATE author_stats SET book_count = book_count - 1, rated_count = rated_count - (OLD.rating IS NOT NULL),
+                rating_sum = CASE WHEN rated_count = (OLD.rating IS NOT NULL) THEN 0.0
+                                  ELSE rating_sum - coalesce(OLD.rating, 0) END
+            WHERE author_id = OLD.author_id;
+            INSERT INTO author_stats (author_id, book_count, co_author_count, rated_count, rating_sum)
+            VALUES (NEW.author_id, 1, 0, NEW.rating IS NOT NULL, coalesce(NEW.rating, 0))
+            ON CONFLICT (author_id) DO UPDATE SET book_count = book_count + 1,
+                rated_count = rated_count + excluded.rated_count, rating_sum = rating_sum + excluded.rating_sum;
+            UPDATE year_stats SET book_count = book_count - 1 WHERE publication_year = OLD.publication_year;
+            INSERT INTO year_stats (publication_year, book_count) VALUES (NEW.publication_year, 1)
+            ON CONFLICT (publication_year) DO UPDATE SET book_count = book_count + 1;
+            DELETE FROM year_stats WHERE publication_year = OLD.publication_year AND book_count <= 0;
+        END
+    """,
+    'book_co_author_stats_insert': """
+        CREATE TRIGGER book_co_author_stats_insert AFTER INSERT ON book_co_author BEGIN
+            INSERT INTO author_stats (author_id, book_count, co_author_count, rated_count, rating_sum)
+            VALUES (NEW.author_id, 0, 1, 0, 0.0)
+            ON CONFLICT (author_id) DO UPDATE SET co_author_count = co_author_count + 1;
+        END
+    """,
+    'book_co_author_stats_delete': """
+        CREATE TRIGGER book_co_author_stats_delete AFTER DELETE ON book_co_author BEGIN
+            UPDATE author_stats SET co_author_count = co_author_count - 1 WHERE author_id = OLD.author_id;
+        END
+    """,
+    'book_co_author_stats_update': """
+        CREATE TRIGGER book_co_author_stats_update AFTER UPDATE OF author_id ON book_co_author
+        WHEN OLD.author_id IS NOT NEW.author_id
+        BEGIN
+            UPDATE author_stats SET co_author_count = co_author_count - 1 WHERE author_id = OLD.author_id;
+            INSERT INTO author_stats (author_id, book_count, co_author_count, rated_count, rating_sum)
+            VALUES (NEW.author_id, 0, 1, 0, 0.0)
+            ON CONFLICT (author_id) DO UPDATE SET co_author_count = co_author_count + 1;
+        END
+    """,
+    'author_stats_delete': """
+        CREATE TRIGGER author_stats_delete AFTER DELETE ON author BEGIN
+            DELETE FROM author_stats WHERE author_id = OLD.id;
+        END
+    """,
+}
+
+REBUILD = (
+    'INSERT INTO author_stats (author_id, book_count, co_author_count, rated_count, rating_sum) '
+    'SELECT author_id, count(*), 0, count(rating), coalesce(sum(rating), 0.0) FROM book GROUP BY author_id',
+    'INSERT INTO author_stats (author_id, book_count, co_author_count, rated_count, rating_sum) '
+    'SELECT author_id, 0, count(*), 0, 0.0 FROM book_co_author WHERE true GROUP BY author_id '
+    'ON CONFLICT (author_id) DO UPDATE SET co_author_count = excluded.co_author_count',
+    'INSERT INTO year_stats (publication_year, book_count) '
+    'SELECT publication_year, count(*) FROM book GROUP BY publication_year',
+)
+
+
+def upgrade():
+    op.create_table(
+        'author_stats',
+        sa.Column('author_id', sa.Integer(), nullable=False),
+        sa.Column('book_count', sa.Integer(), nullable=False),
+        sa.Column('co_author_count', sa.Integer(), nullable=False),
+        sa.Column('rated_count', sa.Integer(), nullable=False),
+        sa.Column('rating_sum', sa.Float(), nullable=False),
+        sa.PrimaryKeyConstraint('author_id')
+    )
+    op.create_index('ix_author_stats_book_count', 'author_stats', ['book_count', 'author_id'], unique=False)
+    op.create_table(
+        'year_stats',
+        sa.Column('publication_year', sa.Integer(), autoincrement=False, nullable=False),
+        sa.Column('book_count', sa.Integer(), nullable=False),
+        sa.PrimaryKeyConstraint('publication_year')
+    )
+
+    for statement in REBUILD + tuple(TRIGGERS.values()):
+        op.execute(statement)
+
+
+def downgrade():
+    for name in TRIGGERS:
+        op.execute(f'DROP TRIGGER IF EXISTS {name}')
+    op.drop_table('year_stats')
+    op.drop_index('ix_author_stats_book_count', table_name='author_stats')
+    op.drop_table('author_stats')
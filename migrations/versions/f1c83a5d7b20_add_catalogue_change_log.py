@@ -0,0 +1,33 @@
+"""add catalogue change log
+
+Revision ID: f1c83a5d7b20
+Revises: b6d18f4c2e97
+Create Date: 2026-10-18 21:04:37.519204
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'f1c83a5d7b20'
+down_revision = 'b6d18f4c2e97'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table(
+        'catalogue_change',
+        sa.Column('id', sa.Integer(), nullable=False),
+        sa.Column('version', sa.Integer(), nullable=False),
+        sa.Column('book_ids', sa.Text(), nullable=False),
+        sa.Column('author_ids', sa.Text(), nullable=False),
+        sa.PrimaryKeyConstraint('id')
+    )
+    op.create_index('ix_catalogue_change_version', 'catalogue_change', ['version'], unique=False)
+
+
+def downgrade():
+    op.drop_index('ix_catalogue_change_version', table_name='catalogue_change')
+    op.drop_table('catalogue_change')
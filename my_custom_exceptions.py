@@ -3,4 +3,20 @@ class APICallError(Exception):
 
     def __init__(self, message):
         self.message = message
-        super().__init__(message)
\ No newline at end of file
+        super().__init__(message)
+
+
+class RateLimitError(APICallError):
+    """Raised when an upstream API cannot be called within its rate limit in time."""
+
+
+class QueryBudgetExceeded(Exception):
+    """Raised when a request runs more SQL statements than its route is allowed."""
+
+
+class PermanentJobError(Exception):
+    """Raised by a background job for a failure that retrying cannot fix."""
+
+
+class BadRequest(ValueError):
+    """Raised by a JSON API view for invalid query parameters, answered with a 400 and the message."""
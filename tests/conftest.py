@@ -0,0 +1,39 @@
+import os
+import tempfile
+
+import pytest
+
+# The app reads its settings when its modules are imported, so they are set before any of them is
+_directory = tempfile.mkdtemp(prefix='library-tests-')
+DATABASE_PATH = os.path.join(_directory, 'library.sqlite')
+os.environ.update({
+    'DATABASE': f'sqlite:///{DATABASE_PATH}',
+    'SECRETKEY': 'tests',
+    'API_KEY': 'tests',
+    'JOB_WORKERS': '0',
+    'API_CACHE_PATH': os.path.join(_directory, 'api_cache.sqlite'),
+    'RATE_LIMIT_PATH': os.path.join(_directory, 'rate_limits.sqlite'),
+    'METRICS_PATH': os.path.join(_directory, 'metrics.sqlite'),
+    'FUZZY_INDEX_PATH': os.path.join(_directory, 'fuzzy_index.json'),
+    'COVER_CACHE_DIRECTORY': os.path.join(_directory, 'covers'),
+    'IMPORT_UPLOAD_DIRECTORY': os.path.join(_directory, 'imports'),
+    'ENRICHMENT_CHECKPOINT_PATH': os.path.join(_directory, 'enrichment_checkpoint.json'),
+    'TEMPLATE_CACHE_DIRECTORY': '',
+})
+os.environ.pop('DATABASE_REPLICAS', None)
+
+
+@pytest.fixture(scope='session')
+def app():
+    """An app on a small, fully migrated catalogue, with the query budgets enforced."""
+    from benchmarks.generate_data import generate_catalogue
+
+    generate_catalogue(DATABASE_PATH, authors=20, books=200, seed=7)
+
+    import app as library
+    return library.create_app({'TESTING': True, 'ENFORCE_QUERY_BUDGETS': True})
+
+
+@pytest.fixture
+def client(app):
+    return app.test_client()
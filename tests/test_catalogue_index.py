@@ -0,0 +1,123 @@
+import json
+import random
+import sqlite3
+import threading
+import timeit
+
+from benchmarks.generate_data import FIRST_NAMES, LAST_NAMES, TITLE_PATTERNS, TITLE_WORDS
+from data_models import db, Author, Book
+from helpers.fuzzy_index import TrigramIndex, fuzzy_search
+from helpers.search_index import apply_full_text_search
+from helpers.suggest_index import MAX_SCANNED, PrefixIndex, suggest, suggest_index
+
+
+def _write_from_another_process(title, logged=True):
+    """Add a book the way another process would: bump the catalogue version and log the change (or not)."""
+    connection = sqlite3.connect(db.engine.url.database)
+    with connection:
+        book_id = connection.execute("INSERT INTO book (isbn, title, publication_year, author_id) "
+                                     "VALUES ('', ?, 2000, 1)", (title,)).lastrowid
+        version = connection.execute('UPDATE catalogue_version SET version = version + 1 WHERE id = 1 '
+                                     'RETURNING version').fetchone()[0]
+        if logged:
+            connection.execute('INSERT INTO catalogue_change (version, book_ids, author_ids) VALUES (?, ?, ?)',
+                               (version, json.dumps([book_id]), '[]'))
+    connection.close()
+    return version
+
+
+def _wait_for_catch_up():
+    for thread in threading.enumerate():
+        if thread.name == f'{suggest_index.name}-sync':
+            thread.join()
+
+
+def test_changes_of_other_processes_are_applied_from_the_log(app, monkeypatch):
+    monkeypatch.setattr(suggest_index, 'sync_interval', 0)
+    with app.app_context():
+        suggest('a')
+        index = suggest_index.index
+
+        version = _write_from_another_process('Zanzibar Chronicle')
+        suggest('zanzib')
+        _wait_for_catch_up()
+        assert [found['text'] for found in suggest('zanzib')] == ['Zanzibar Chronicle']
+        # Caught up without a rebuild
+        assert suggest_index.index is index and index.version == version
+
+        version = _write_from_another_process('Unlogged Volume', logged=False)
+        assert not suggest_index._apply_logged_changes(version)
+
+
+def test_fuzzy_index_survives_a_json_round_trip():
+    index = TrigramIndex()
+    index.version = 3
+    index.add_book(1, 'The Hobbit', ('J. R. R. Tolkien',))
+    index.add_book(2, 'Murder on the Orient Express', ('Agatha Christie',))
+    index.remove_book(1)
+    index.add_book(3, 'The Silmarillion', ('J. R. R. Tolkien',))
+
+    loaded = TrigramIndex.load(json.loads(json.dumps(index.dump())))
+    assert loaded.version == 3
+    assert loaded.search('tolkein') == index.search('tolkein')
+    assert loaded.search('hobbit') == []
+    assert loaded.search('agata cristie') == index.search('agata cristie')
+
+
+def test_fuzzy_search_of_common_words_stays_fast():
+    # 150,000 books over a small vocabulary: every similar word has thousands of books
+    randomizer = random.Random(42)
+    index = TrigramIndex()
+    for book_id in range(1, 150001):
+        title = randomizer.choice(TITLE_PATTERNS).format(*randomizer.sample(TITLE_WORDS, 2))
+        index.add_book(book_id, title, (f'{randomizer.choice(FIRST_NAMES)} {randomizer.choice(LAST_NAMES)}',))
+
+    for query in ('the lst wolf', 'dark forst of the kng'):
+        assert len(index.search(query)) == 200
+        fastest = min(timeit.repeat(lambda: index.search(query), number=1, repeat=20))
+        assert fastest < 0.0004, f'fuzzy search of {query!r} took {fastest * 1000:.2f} ms'
+
+
+def test_short_prefixes_rank_the_whole_catalogue():
+    # More titles than are scanned sort before the prolific author's name
+    rows = [(book_id, f'Baa Volume {book_id}', ('Ann Other',)) for book_id in range(MAX_SCANNED + 1)]
+    rows += [(book_id, f'Book {book_id}', ('Brenda Zed',)) for book_id in range(1000, 1003)]
+    index = PrefixIndex.build(rows)
+    assert index.suggest('b', 1) == index.suggest('br', 1) == [{'text': 'Brenda Zed', 'type': 'author', 'books': 3}]
+
+    index.add_book(2000, 'Zoology', ('Bob Bee',))
+    index.add_book(2001, 'Zebras', ('Bob Bee',))
+    for book_id in range(1000, 1003):
+        index.remove_book(book_id)
+    assert index.suggest('b', 1) == [{'text': 'Bob Bee', 'type': 'author', 'books': 2}]
+    assert index.suggest('br') == []
+
+
+def test_books_of_a_deleted_author_leave_the_indexes(app, client):
+    with app.app_context():
+        author = Author(name='Quentin Vexley', name_key='quentin vexley')
+        author.books = [Book(title=f'Vexley Saga {number}', publication_year=2000) for number in range(3)]
+        db.session.add(author)
+        db.session.commit()
+        author_id = author.id
+        assert {'text': 'Quentin Vexley', 'type': 'author', 'books': 3} in suggest('vexley')
+
+    assert client.post(f'/author/{author_id}/delete').status_code == 302
+    with app.test_request_context():
+        assert suggest('vexley') == []
+        assert fuzzy_search('vexley saga') == []
+
+
+def test_co_authors_are_found_by_every_search(app):
+    with app.app_context():
+        book = Book(title='Good Omens', publication_year=1990,
+                    author=Author(name='Terry Pratchett', name_key='terry pratchett'))
+        book.co_authors.append(Author(name='Neil Gaiman', name_key='neil gaiman'))
+        db.session.add(book)
+        db.session.commit()
+        book_id = book.id
+
+    with app.test_request_context():
+        assert [found.id for found in apply_full_text_search(Book.query, 'gaiman')] == [book_id]
+        assert fuzzy_search('good omens gaimen')[:1] == [book_id]
+        assert {'text': 'Neil Gaiman', 'type': 'author', 'books': 1} in suggest('gaim')
@@ -0,0 +1,61 @@
+import socket
+
+import pytest
+from requests import Response
+from requests.adapters import BaseAdapter
+
+from helpers import cover_cache
+from helpers.http_client import close_session, mount_transport
+
+PUBLIC_ADDRESS = '93.184.216.34'
+
+
+@pytest.fixture
+def resolve_covers_host(monkeypatch):
+    """Resolve covers.example.org to a public address, without a DNS lookup."""
+    resolve = socket.getaddrinfo
+
+    def getaddrinfo(host, port, *args, **kwargs):
+        if host == 'covers.example.org':
+            return [(socket.AF_INET, socket.SOCK_STREAM, 6, '', (PUBLIC_ADDRESS, port))]
+        return resolve(host, port, *args, **kwargs)
+    monkeypatch.setattr(socket, 'getaddrinfo', getaddrinfo)
+
+
+class RedirectingAdapter(BaseAdapter):
+    def __init__(self, location):
+        super().__init__()
+        self.location = location
+        self.requested = []
+
+    def send(self, request, **kwargs):
+        self.requested.append(request.url)
+        response = Response()
+        response.status_code, response.url, response.request = 302, request.url, request
+        response.headers['Location'] = self.location
+        return response
+
+    def close(self):
+        pass
+
+
+@pytest.mark.parametrize('url', ['http://127.0.0.1/cover.jpg', 'http://localhost:8080/admin', 'http://10.1.2.3/a.jpg',
+                                 'http://169.254.169.254/latest/meta-data/', 'http://[::1]/a.jpg',
+                                 'http://[::ffff:127.0.0.1]/a.jpg', 'file:///etc/passwd'])
+def test_covers_are_not_fetched_from_internal_addresses(url):
+    assert not cover_cache._is_public_url(url)
+    assert cover_cache._download(url) is None
+
+
+@pytest.fixture
+def redirect_to_metadata_service():
+    adapter = RedirectingAdapter('http://169.254.169.254/latest/meta-data/')
+    mount_transport('https://covers.example.org/', adapter)
+    yield adapter
+    close_session()
+
+
+def test_redirects_to_internal_addresses_are_not_followed(resolve_covers_host, redirect_to_metadata_service):
+    assert cover_cache._is_public_url('https://covers.example.org/1.jpg')
+    assert cover_cache._download('https://covers.example.org/1.jpg') is None
+    assert redirect_to_metadata_service.requested == ['https://covers.example.org/1.jpg']
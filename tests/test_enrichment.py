@@ -0,0 +1,57 @@
+import os
+
+from helpers import enrichment
+from helpers.enrichment import CHECKPOINT_PATH, MAX_BATCH_SIZE, MAX_WORKERS, reset_checkpoint, run_enrichment
+from my_custom_exceptions import RateLimitError
+
+
+def _resolver(monkeypatch, failing=()):
+    """Replace the external lookups: books in failing raise, the others find nothing. Returns the ids looked up."""
+    looked_up = []
+
+    def resolve_metadata(book):
+        looked_up.append(book['id'])
+        if book['id'] in failing:
+            raise RateLimitError('Rate limit reached.')
+        return {'id': book['id']}
+
+    monkeypatch.setattr(enrichment, 'resolve_metadata', resolve_metadata)
+    return looked_up
+
+
+def test_failed_books_are_retried_and_a_finished_run_starts_over(app, monkeypatch):
+    with app.app_context():
+        reset_checkpoint()
+        first_ids = [book['id'] for book in enrichment._next_batch(0, 4)]
+
+        _resolver(monkeypatch, failing={first_ids[1]})
+        status = run_enrichment(workers=1, batch_size=3, limit=3)
+        assert (status['checkpoint'], status['failed_book_ids']) == (first_ids[2], [first_ids[1]])
+
+        looked_up = _resolver(monkeypatch)
+        status = run_enrichment(workers=1, batch_size=3, limit=2)
+        assert looked_up == [first_ids[1], first_ids[3]]
+        assert (status['checkpoint'], status['failed_book_ids']) == (first_ids[3], [])
+
+        status = run_enrichment(workers=1, batch_size=50)
+        assert status['state'] == 'finished' and status['failed'] == 0
+        assert (status['checkpoint'], status['failed_book_ids']) == (0, [])
+        assert not os.path.exists(CHECKPOINT_PATH)
+
+
+def test_workers_and_batch_size_are_capped(app, monkeypatch):
+    pool_sizes = []
+    batch_sizes = []
+
+    class ThreadPoolExecutor(enrichment.ThreadPoolExecutor):
+        def __init__(self, max_workers):
+            pool_sizes.append(max_workers)
+            super().__init__(max_workers)
+
+    monkeypatch.setattr(enrichment, 'ThreadPoolExecutor', ThreadPoolExecutor)
+    monkeypatch.setattr(enrichment, '_next_batch', lambda last_book_id, size: batch_sizes.append(size) or [])
+    with app.app_context():
+        run_enrichment(workers=1000, batch_size=100000)
+
+    assert pool_sizes == [MAX_WORKERS]
+    assert batch_sizes == [MAX_BATCH_SIZE]
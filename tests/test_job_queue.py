@@ -0,0 +1,46 @@
+from datetime import datetime
+
+import pytest
+from sqlalchemy import delete
+
+from data_models import db, Job
+from helpers import job_queue
+from helpers.job_queue import JobQueue
+from helpers.rate_limiter import TokenBucket
+from my_custom_exceptions import RateLimitError
+
+
+def test_processes_share_the_rate_of_a_host(tmp_path):
+    path = str(tmp_path / 'rate_limits.sqlite')
+    # One bucket per process, on the same file
+    first, second = TokenBucket('api.example', 1, path=path), TokenBucket('api.example', 1, path=path)
+
+    assert first.reserve() == 0
+    assert second.reserve() == pytest.approx(1, abs=0.1)
+    with pytest.raises(RateLimitError):
+        first.reserve(timeout=1.5)
+    assert TokenBucket('other.example', 1, path=path).reserve() == 0
+
+
+def _job(host, state='queued'):
+    now = datetime.utcnow()
+    job = Job(kind='lookup_book', payload='{}', state=state, host=host, attempts=0, max_attempts=1,
+              created_at=now, run_after=now, heartbeat_at=now)
+    db.session.add(job)
+    db.session.commit()
+    return job.id
+
+
+def test_jobs_of_a_busy_host_wait_whichever_process_runs_them(app, monkeypatch):
+    monkeypatch.setattr(job_queue, 'HOST_CONCURRENCY', {'finder.example': 1})
+    with app.app_context():
+        db.session.execute(delete(Job))
+        # Running in another process
+        _job('search.example,finder.example', state='running')
+        waiting = _job('finder.example')
+        free = _job('search.example')
+
+        queue = JobQueue(app, workers=0)
+        assert queue._claim() == free
+        assert queue._claim() is None
+        assert db.session.get(Job, waiting).state == 'queued'
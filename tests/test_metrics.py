@@ -0,0 +1,28 @@
+import re
+
+from helpers import metrics
+from helpers.metrics import Counter, SharedMetrics
+
+
+def _home_requests(client):
+    found = re.search(r'^http_requests_total\{endpoint="catalogue.home",method="GET",status="200"\} (\S+)$',
+                      client.get('/metrics').get_data(as_text=True), re.MULTILINE)
+    return float(found.group(1)) if found else 0.0
+
+
+def test_metrics_add_up_the_processes(client):
+    before = _home_requests(client)
+    client.get('/?sort=title')
+    assert _home_requests(client) == before + 1
+
+    # Another worker process flushing its own requests to the shared file
+    other_process = SharedMetrics(metrics.METRICS_PATH)
+    other_requests = Counter('http_requests_total', 'Requests handled.', ('endpoint', 'method', 'status'))
+    metrics._registry.remove(other_requests)
+    other_requests.inc('catalogue.home', 'GET', '200', amount=5)
+    other_process.flush([other_requests])
+    # Flushing again adds only what grew since
+    other_requests.inc('catalogue.home', 'GET', '200')
+    other_process.flush([other_requests])
+
+    assert _home_requests(client) == before + 7
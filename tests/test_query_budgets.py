@@ -0,0 +1,97 @@
+"""Every budgeted route, requested through the test client with the query budgets enforced.
+
+A route running more SQL statements than its entry in ROUTE_QUERY_BUDGETS raises
+QueryBudgetExceeded, which fails its test.
+"""
+import io
+
+import pytest
+from flask import request
+from sqlalchemy import delete
+
+from data_models import db, Author, Book, Job
+from helpers.query_counter import ROUTE_QUERY_BUDGETS
+
+
+@pytest.fixture(autouse=True)
+def no_queued_jobs(app):
+    """Drop the jobs queued by earlier tests (nothing runs them here), a queued purge would spare a route its INSERT."""
+    with app.app_context():
+        db.session.execute(delete(Job))
+        db.session.commit()
+
+
+def _new_author(app, books):
+    """Add an author with the given number of books of their own, return (author id, book ids)."""
+    with app.app_context():
+        author = Author(name='Budget Author', name_key='budget author')
+        author.books = [Book(title=f'Budget Book {number}', publication_year=2000) for number in range(books)]
+        db.session.add(author)
+        db.session.commit()
+        return author.id, [book.id for book in author.books]
+
+
+def _only_book_of_its_author(app):
+    # Deleting it deletes its author too, the most expensive path of delete_book
+    return _new_author(app, 1)[1][0]
+
+
+def _queued_job(client):
+    return client.post('/enrichment').json['id']
+
+
+UPDATE_FORM = {'title': 'The Shadow Garden', 'publication_year': '1999', 'rating': '4', 'authors': 'Ines Folha',
+               'birth_date': '1970-01-01', 'death_date': '', 'isbn': '9789999999999', 'cover': '',
+               'additional_info': ''}
+SEARCHED_BOOK_FORM = {'isbn': '9781111111111', 'title': 'A Searched Book', 'publication_year': '2001',
+                      'authors': ['Brand New Author', 'Another New Author'], 'cover': '', 'additional_info': ''}
+
+# Endpoint -> (request sent by the test client, expected status)
+CASES = {
+    'catalogue.home': (lambda client, app: client.get('/?sort=title'), 200),
+    'catalogue.book_details': (lambda client, app: client.get('/book/1'), 200),
+    'catalogue.update_book': (lambda client, app: client.post('/book/2/update', data=UPDATE_FORM), 302),
+    'catalogue.add_book': (lambda client, app: client.post('/add_book', data={
+        'isbn': '9782222222222', 'title': 'An Added Book', 'publication_year': '2010', 'author_id': '1'}), 200),
+    'authors.add_author': (lambda client, app: client.post('/add_author', data={
+        'name': 'Added Author', 'birth_date': '1950-05-05'}), 200),
+    'external_search.add_searched_data': (lambda client, app: client.post('/search/add_book',
+                                                                          data=SEARCHED_BOOK_FORM), 302),
+    'external_search.search': (lambda client, app: client.post('/search', data={'search_query': 'dune'}), 302),
+    'catalogue.import_books_upload': (lambda client, app: client.post('/import', data={
+        'file': (io.BytesIO(b'title,author,publication_year\nImported,Someone,2000\n'), 'books.csv')}), 202),
+    'external_search.start_book_enrichment': (lambda client, app: client.post('/enrichment'), 202),
+    'external_search.book_enrichment_status': (lambda client, app: client.get('/enrichment/status'), 200),
+    'job_status_view': (lambda client, app: client.get(f'/jobs/{_queued_job(client)}'), 200),
+    'catalogue.cover': (lambda client, app: client.get('/covers/1'), 200),
+    'catalogue.catalogue_stats': (lambda client, app: client.get('/stats'), 200),
+    'catalogue.delete_book': (lambda client, app: client.post(f'/book/{_only_book_of_its_author(app)}/delete'),
+                              302),
+    'catalogue.delete_books': (lambda client, app: client.post('/books/delete',
+                                                               data={'book_ids': _new_author(app, 5)[1]}), 302),
+    'authors.delete_author': (lambda client, app: client.post(f'/author/{_new_author(app, 5)[0]}/delete'), 302),
+    'api_v1.books': (lambda client, app: client.get('/api/v1/books?sort=rating&limit=20'), 200),
+    'api_v1.book': (lambda client, app: client.get('/api/v1/books/1'), 200),
+    'api_v1.authors': (lambda client, app: client.get('/api/v1/authors'), 200),
+    'api_v1.stats': (lambda client, app: client.get('/api/v1/stats'), 200),
+    'api_v1.suggestions': (lambda client, app: client.get('/api/v1/suggest?q=sha'), 200),
+}
+
+
+def test_every_budget_names_a_route(app):
+    endpoints = {rule.endpoint for rule in app.url_map.iter_rules()}
+    assert set(ROUTE_QUERY_BUDGETS) <= endpoints
+
+
+def test_every_budgeted_route_is_requested():
+    assert set(CASES) == set(ROUTE_QUERY_BUDGETS)
+
+
+@pytest.mark.parametrize('endpoint', list(CASES))
+def test_route_stays_within_its_budget(app, client, endpoint):
+    send, status = CASES[endpoint]
+    # The last request's context is kept, to check which route answered it
+    with client:
+        response = send(client, app)
+        assert request.endpoint == endpoint
+    assert response.status_code == status
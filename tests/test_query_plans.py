@@ -0,0 +1,12 @@
+from helpers.query_plans import explain_query_plan, hot_queries
+
+
+def test_hot_queries_use_their_index(app):
+    with app.app_context():
+        missing = {}
+        for description, query, index_name in hot_queries():
+            plan = explain_query_plan(query)
+            if not any(f'INDEX {index_name}' in line for line in plan):
+                missing[description] = plan
+
+    assert not missing, f'Queries not served by their index: {missing}'
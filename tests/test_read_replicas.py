@@ -0,0 +1,65 @@
+import pytest
+from flask import Flask
+from sqlalchemy import create_engine, select
+
+from data_models import db, Author
+from helpers import read_replicas
+from helpers.read_replicas import init_read_replicas, replica_binds
+
+
+@pytest.fixture
+def replicated_app(tmp_path):
+    """An app on two SQLite files whose author 1 differs, so each read tells which file answered it."""
+    uris = {}
+    for name in ('primary', 'replica'):
+        uris[name] = f"sqlite:///{tmp_path / f'{name}.sqlite'}"
+        engine = create_engine(uris[name])
+        Author.__table__.create(engine)
+        with engine.begin() as connection:
+            connection.execute(Author.__table__.insert(), {'id': 1, 'name': name, 'name_key': name})
+        engine.dispose()
+
+    app = Flask(__name__)
+    app.secret_key = 'tests'
+    app.config['SQLALCHEMY_DATABASE_URI'] = uris['primary']
+    app.config['SQLALCHEMY_BINDS'] = replica_binds([uris['replica']])
+    db.init_app(app)
+    init_read_replicas(app, db)
+
+    @app.get('/author')
+    def read_author():
+        return db.session.scalar(select(Author.name).where(Author.id == 1))
+
+    @app.post('/author')
+    def write_author():
+        db.session.add(Author(name='New Author', name_key='new author'))
+        db.session.commit()
+        return 'written'
+
+    yield app
+    with app.app_context():
+        for engine in db.engines.values():
+            engine.dispose()
+
+
+def test_reads_go_to_the_replica_until_the_browser_writes(replicated_app):
+    client = replicated_app.test_client()
+    assert client.get('/author').text == 'replica'
+
+    assert client.post('/author').text == 'written'
+    # The redirected page of the same browser must show the write, the replica may not have it yet
+    assert client.get('/author').text == 'primary'
+    # Other browsers keep reading from the replica
+    assert replicated_app.test_client().get('/author').text == 'replica'
+
+
+def test_a_browser_goes_back_to_the_replica_after_the_sticky_period(replicated_app, monkeypatch):
+    monkeypatch.setattr(read_replicas, 'STICKY_SECONDS', -1)
+    client = replicated_app.test_client()
+    client.post('/author')
+    assert client.get('/author').text == 'replica'
+
+
+def test_reads_outside_of_requests_go_to_the_primary(replicated_app):
+    with replicated_app.app_context():
+        assert db.session.scalar(select(Author.name).where(Author.id == 1)) == 'primary'
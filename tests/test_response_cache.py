@@ -0,0 +1,15 @@
+from helpers.response_cache import EVICT_INTERVAL, MISS, ResponseCache
+
+
+def test_least_recently_used_entries_are_evicted_every_interval(tmp_path):
+    cache = ResponseCache(str(tmp_path / 'cache.sqlite'), ttl=3600, negative_ttl=60, max_entries=10)
+    for number in range(EVICT_INTERVAL - 1):
+        cache.set(f'key {number}', [number])
+    # Not checked yet
+    assert cache.stats()['entries'] == EVICT_INTERVAL - 1
+
+    cache.get('key 0')
+    cache.set('last', ['value'])
+    assert cache.stats()['entries'] == 10
+    assert cache.get('key 0') == [0] and cache.get('last') == ['value']
+    assert cache.get('key 1') is MISS
@@ -0,0 +1,32 @@
+from sqlalchemy import select
+
+from data_models import db, Book
+
+FORM = {'title': 'An Edited Book', 'publication_year': '1999', 'rating': '', 'authors': 'Edited Author',
+        'birth_date': '', 'death_date': '', 'cover': '', 'additional_info': ''}
+
+
+def _two_books(app):
+    with app.app_context():
+        first, second = db.session.scalars(select(Book).where(Book.isbn != '').order_by(Book.id).limit(2))
+        return (first.id, first.isbn), (second.id, second.isbn, second.title)
+
+
+def test_an_isbn_of_another_book_is_refused(app, client):
+    (first_id, first_isbn), (second_id, second_isbn, second_title) = _two_books(app)
+
+    response = client.post(f'/book/{second_id}/update', data=dict(FORM, isbn=first_isbn), follow_redirects=True)
+    assert response.status_code == 200
+    assert f'A book with ISBN {first_isbn} is already in the library.' in response.text
+    with app.app_context():
+        book = db.session.get(Book, second_id)
+        assert (book.isbn, book.title) == (second_isbn, second_title)
+
+
+def test_a_book_keeps_its_own_isbn(app, client):
+    _, (second_id, second_isbn, _) = _two_books(app)
+
+    response = client.post(f'/book/{second_id}/update', data=dict(FORM, isbn=second_isbn), follow_redirects=True)
+    assert 'Book details have been updated successfully!' in response.text
+    with app.app_context():
+        assert db.session.get(Book, second_id).title == 'An Edited Book'
@@ -0,0 +1,258 @@
+import json
+
+from flask import Response, request, url_for
+
+from data_models import Book
+from helpers.catalogue_stats import DEFAULT_TOP_AUTHORS, get_catalogue_stats
+from helpers.helper_functions import SORT_OPTIONS, get_authors_page, get_book_with_author_or_404, get_books_page
+from helpers.page_cache import get_catalogue_version, page_etag
+from helpers.suggest_index import DEFAULT_LIMIT as DEFAULT_SUGGESTIONS, MAX_LIMIT as MAX_SUGGESTIONS, suggest
+from my_custom_exceptions import BadRequest
+
+try:
+    # Optional, several times faster than the standard library encoder
+    import orjson
+except ImportError:
+    orjson = None
+
+# Field name -> function reading it from a (Book, Author) pair
+BOOK_FIELDS = {
+    'id': lambda book, author: book.id,
+    'isbn': lambda book, author: book.isbn,
+    'title': lambda book, author: book.title,
+    'publication_year': lambda book, author: book.publication_year,
+    'rating': lambda book, author: book.rating,
+    'cover': lambda book, author: book.cover,
+    'additional_info': lambda book, author: book.additional_info,
+    'author': lambda book, author: {'id': author.id, 'name': author.name},
+}
+
+AUTHOR_FIELDS = {
+    'id': lambda author: author.id,
+    'name': lambda author: author.name,
+    'birth_date': lambda author: author.birth_date.isoformat() if author.birth_date else None,
+    'date_of_death': lambda author: author.date_of_death.isoformat() if author.date_of_death else None,
+}
+
+# Seconds browsers may reuse a list of suggestions, long enough for a user deleting and retyping a letter
+SUGGEST_MAX_AGE = 30
+
+
+def bad_request(e):
+    return json_response({'error': str(e)}, 400)
+
+
+def not_found(e):
+    return json_response({'error': 'Not found.'}, 404)
+
+
+def database_error(e):
+    return json_response({'error': 'An unexpected error occurred while accessing the database.'}, 500)
+
+
+def books():
+    """List books, one keyset page at a time.
+
+    Query parameters:
+        fields: Comma separated fields to include (all of BOOK_FIELDS by default).
+        q: Full-text search on title, author and additional info.
+        fuzzy: 1 to match q against titles and authors with typo tolerance, ranked by similarity.
+        sort: One of title, author, publication_year or rating (relevance for searches).
+        author_id, year_from, year_to, min_rating: Filters.
+        after, limit: Page cursor (the next_cursor of the previous page) and page size.
+
+    Returns:
+        {"data": [...], "next_cursor": ..., "next": <url of the next page>}, with an ETag
+        derived from the catalogue version so an unchanged page is answered with a 304.
+    """
+    fields = _selected_fields(BOOK_FIELDS)
+    sort_by = request.args.get('sort')
+    if sort_by and sort_by not in SORT_OPTIONS:
+        raise BadRequest(f"Unknown sort '{sort_by}', use one of: {', '.join(SORT_OPTIONS)}.")
+
+    filters = []
+    author_id = _int_arg('author_id')
+    if author_id is not None:
+        filters.append(Book.author_id == author_id)
+    year_from, year_to = _int_arg('year_from'), _int_arg('year_to')
+    if year_from is not None:
+        filters.append(Book.publication_year >= year_from)
+    if year_to is not None:
+        filters.append(Book.publication_year <= year_to)
+    min_rating = _number_arg('min_rating')
+    if min_rating is not None:
+        filters.append(Book.rating >= min_rating)
+
+    not_modified, etag, last_modified = _check_version_etag('books')
+    if not_modified:
+        return not_modified
+
+    try:
+        books_with_authors, next_cursor = get_books_page(
+            request.args.get('q'), sort_by, request.args.get('after'), _int_arg('limit'), filters,
+            fuzzy=request.args.get('fuzzy') == '1')
+    except ValueError as e:
+        raise BadRequest(str(e))
+
+    payload = {
+        'data': [{name: BOOK_FIELDS[name](book, author) for name in fields} for book, author in books_with_authors],
+        'next_cursor': next_cursor,
+        'next': _next_url(next_cursor),
+    }
+    return json_response(payload, etag=etag, last_modified=last_modified)
+
+
+def book(book_id):
+    """Return one book with its author, supports ?fields= and conditional GETs."""
+    fields = _selected_fields(BOOK_FIELDS)
+    not_modified, etag, last_modified = _check_version_etag('book', book_id)
+    if not_modified:
+        return not_modified
+
+    found = get_book_with_author_or_404(book_id)
+    return json_response({name: BOOK_FIELDS[name](found, found.author) for name in fields},
+                         etag=etag, last_modified=last_modified)
+
+
+def authors():
+    """List authors in name order.
+
+    Query parameters:
+        fields: Comma separated fields to include (all of AUTHOR_FIELDS by default).
+        name: Only authors whose name starts with it (case-insensitive).
+        after, limit: Page cursor and page size.
+
+    Returns:
+        {"data": [...], "next_cursor": ..., "next": ...}. Author details are not part of the
+        catalogue version, so the ETag is a hash of the body.
+    """
+    fields = _selected_fields(AUTHOR_FIELDS)
+    try:
+        page, next_cursor = get_authors_page(request.args.get('name'), request.args.get('after'), _int_arg('limit'))
+    except ValueError as e:
+        raise BadRequest(str(e))
+
+    response = json_response({
+        'data': [{name: AUTHOR_FIELDS[name](author) for name in fields} for author in page],
+        'next_cursor': next_cursor,
+        'next': _next_url(next_cursor),
+    })
+    response.add_etag()
+    return response.make_conditional(request)
+
+
+def stats():
+    """Return the catalogue statistics, read from the maintained per-author and per-year counts.
+
+    Query parameters:
+        top_authors: Number of most prolific authors to include (10 by default, 100 at most).
+
+    Returns:
+        {"books", "authors", "rated_books", "average_rating", "top_authors": [...],
+        "books_per_year": [...], "books_per_decade": [...]}, with an ETag derived from the
+        catalogue version.
+    """
+    top_authors = _int_arg('top_authors')
+    if top_authors is None:
+        top_authors = DEFAULT_TOP_AUTHORS
+    if not 0 < top_authors <= 100:
+        raise BadRequest("'top_authors' must be between 1 and 100.")
+
+    not_modified, etag, last_modified = _check_version_etag('stats')
+    if not_modified:
+        return not_modified
+    return json_response(get_catalogue_stats(top_authors), etag=etag, last_modified=last_modified)
+
+
+def suggestions():
+    """Complete a partly typed title or author name, for the search box.
+
+    Answered from the in-memory prefix index, without querying the catalogue.
+
+    Query parameters:
+        q: The text typed so far.
+        limit: Number of suggestions (10 by default, 50 at most).
+
+    Returns:
+        {"data": [{"text": ..., "type": "title" or "author", "books": <number of books>}, ...]},
+        the completions with the most books first.
+    """
+    limit = _int_arg('limit')
+    if limit is None:
+        limit = DEFAULT_SUGGESTIONS
+    if not 0 < limit <= MAX_SUGGESTIONS:
+        raise BadRequest(f"'limit' must be between 1 and {MAX_SUGGESTIONS}.")
+
+    response = json_response({'data': suggest(request.args.get('q', ''), limit)})
+    response.cache_control.public = True
+    response.cache_control.max_age = SUGGEST_MAX_AGE
+    return response
+
+
+def dumps(data):
+    """Serialize to compact UTF-8 JSON, with orjson when it is installed."""
+    if orjson is not None:
+        return orjson.dumps(data)
+    return json.dumps(data, separators=(',', ':'), ensure_ascii=False).encode('utf-8')
+
+
+def json_response(data, status=200, etag=None, last_modified=None):
+    response = Response(dumps(data), status=status, mimetype='application/json')
+    if etag:
+        response.set_etag(etag)
+        response.last_modified = last_modified
+        response.cache_control.no_cache = True
+    return response
+
+
+def _check_version_etag(*parts):
+    """Answer a conditional GET from the catalogue version alone, before running any query.
+
+    Returns:
+        A tuple (not_modified_response or None, etag, last_modified).
+    """
+    version, last_modified = get_catalogue_version()
+    if not version:
+        return None, None, None
+    etag = page_etag(version, *parts, sorted(request.args.items(multi=True)))
+    probe = json_response(None, etag=etag, last_modified=last_modified).make_conditional(request)
+    return (probe if probe.status_code == 304 else None), etag, last_modified
+
+
+def _selected_fields(available):
+    requested = request.args.get('fields')
+    if not requested:
+        return list(available)
+    fields = [name.strip() for name in requested.split(',') if name.strip()]
+    unknown = [name for name in fields if name not in available]
+    if unknown:
+        raise BadRequest(f"Unknown fields: {', '.join(unknown)}. Available: {', '.join(available)}.")
+    return fields
+
+
+def _int_arg(name):
+    value = request.args.get(name)
+    if value in (None, ''):
+        return None
+    try:
+        return int(value)
+    except ValueError:
+        raise BadRequest(f"'{name}' must be an integer.")
+
+
+def _number_arg(name):
+    value = request.args.get(name)
+    if value in (None, ''):
+        return None
+    try:
+        return float(value)
+    except ValueError:
+        raise BadRequest(f"'{name}' must be a number.")
+
+
+def _next_url(next_cursor):
+    if next_cursor is None:
+        return None
+    args = request.args.to_dict()
+    args['after'] = next_cursor
+    return url_for(request.endpoint, **request.view_args, **args)
@@ -0,0 +1,109 @@
+from datetime import datetime
+
+from flask import render_template, request, redirect, url_for, flash, current_app
+from sqlalchemy.exc import SQLAlchemyError
+from sqlalchemy.orm.exc import NoResultFound
+
+from data_models import db, Author
+from helpers.helper_functions import find_author_by_name
+from helpers.read_replicas import use_primary
+from helpers.soft_delete import queue_purge, soft_delete_author
+
+
+@use_primary
+def add_author():
+    """Add a new author to the library.
+
+    Returns:
+        If the request method is POST and the author is added successfully,
+        the user will see a success message on the 'add_author.html' page.
+        If the request method is POST and there are errors in adding the author,
+        the user will see an error message on the 'add_author.html' page.
+        If the request method is GET, the user will see the 'add_author.html' page.
+    """
+    if request.method == 'POST':
+        name = request.form.get('name')
+        birth_date_str = request.form.get('birth_date')
+        date_of_death_str = request.form.get('date_of_death')
+
+        if not name or not birth_date_str:
+            # Handle missing name or birth date
+            error_message = 'Please provide both name and birth date.'
+            return render_template('add_author.html', error_message=error_message)
+
+        # Check if the birth date has the correct format
+        try:
+            birth_date = datetime.strptime(birth_date_str, '%Y-%m-%d').date()
+        except ValueError:
+            error_message = 'Invalid birth date format. Please use YYYY-MM-DD format for dates.'
+            return render_template('add_author.html', error_message=error_message)
+
+        # Check if the date_of_death has the correct format
+        date_of_death = None
+        if date_of_death_str:
+            try:
+                date_of_death = datetime.strptime(date_of_death_str, '%Y-%m-%d').date()
+            except ValueError:
+                error_message = 'Invalid date of death format. Please use YYYY-MM-DD format for dates.'
+                return render_template('add_author.html', error_message=error_message)
+
+        try:
+            existing_author = find_author_by_name(name)
+            if existing_author:
+                error_message = f'{existing_author.name} is already in the library.'
+                return render_template('add_author.html', error_message=error_message)
+
+            new_author = Author(name=name, birth_date=birth_date, date_of_death=date_of_death)
+            db.session.add(new_author)
+            db.session.commit()
+            return render_template('add_author.html', message='Author added successfully!')
+
+        except SQLAlchemyError as e:
+            # Handle database-related errors
+            error_message = 'An unexpected error occurred. Please try again later.'
+            return render_template('add_author.html', error_message=error_message)
+
+    # For GET requests, render the 'add_author.html' page
+    return render_template('add_author.html')
+
+
+@use_primary
+def delete_author(author_id):
+    """Delete an author and all associated books from the database.
+
+    Args:
+        author_id (int): The ID of the author to be deleted.
+
+    Returns:
+        Response: A redirect response to the home page.
+
+    Raises:
+        NoResultFound: If the author with the given ID does not exist in the database.
+    """
+    try:
+        author = Author.query.get_or_404(author_id)
+        author_name = author.name
+
+        # The author and their books are only marked as deleted here, however many books there
+        # are. The purger removes them in short transactions, so other writers are not blocked.
+        # Books the author only co-wrote stay, without the author's credit.
+        soft_delete_author(author_id)
+        db.session.commit()
+        queue_purge()
+
+        message = f'The author "{author_name}" and all associated books have been successfully deleted.'
+        flash(message, 'success')
+        return redirect(url_for('catalogue.home'))
+
+    except NoResultFound:
+        # Handle the case when the author with the given ID does not exist
+        flash('Author not found.', 'error')
+        return redirect(url_for('catalogue.home'))
+
+    except SQLAlchemyError as e:
+        # Handle database-related errors
+        db.session.rollback()  # Roll back the session to avoid inconsistent data
+        flash('An error occurred while deleting the author and associated books.', 'error')
+        # Log the error for further investigation if needed
+        current_app.logger.exception(e)
+        return redirect(url_for('catalogue.home'))
@@ -0,0 +1,413 @@
+from datetime import datetime
+
+from flask import (render_template, request, redirect, url_for, flash, get_flashed_messages, jsonify, Response,
+                   stream_with_context, current_app, send_file)
+from sqlalchemy.exc import SQLAlchemyError
+
+from data_models import db, Book
+from helpers.bulk_import import DEFAULT_CHUNK_SIZE, FORMATS as IMPORT_FORMATS, guess_format, queue_import
+from helpers.catalogue_stats import get_catalogue_stats
+from helpers.cover_cache import BROKEN_MAX_AGE, CACHE_MAX_AGE, PLACEHOLDER, book_cover, cached_cover, cover_key, \
+    queue_cover_fetch
+from helpers.export import CONTENT_TYPES, iter_export
+from helpers.helper_functions import MAX_PAGE_SIZE, find_book_by_isbn, get_author_choices, get_books_page, \
+    get_book_with_author_or_404
+from helpers.job_queue import get_job, job_status
+from helpers.page_cache import get_catalogue_version, has_pending_flashes, page_etag, render_book_grid
+from helpers.read_replicas import use_primary
+from helpers.soft_delete import queue_purge, soft_delete_books
+
+
+def home():
+    """Display the home page with a page of books.
+
+    If a search query is provided, filter the books based on the search query. When nothing
+    matches it exactly (or with 'fuzzy=1'), books with similar titles or authors are shown.
+    If a sorting option is provided, the database sorts the books accordingly.
+    The 'after' and 'limit' query parameters select the page to display.
+
+    Returns:
+        If there are books matching the search query, they are displayed on the 'home.html' page.
+        If there are no matching books, a message indicating no results is shown.
+    """
+
+    sort_by = request.args.get('sort')
+    search_query = request.form.get('search_query') or request.args.get('q')
+    after = request.args.get('after')
+    limit = request.args.get('limit', type=int)
+    fuzzy = bool(search_query) and request.args.get('fuzzy') == '1'
+
+    def load_page():
+        nonlocal fuzzy
+        page = get_books_page(search_query, sort_by, after, limit, fuzzy=fuzzy)
+        if search_query and not fuzzy and not after and not page[0]:
+            # No exact match, likely a typo: fall back to the similar titles and authors
+            fuzzy = True
+            page = get_books_page(search_query, sort_by, after, limit, fuzzy=True)
+        return page
+
+    # The unsearched listing only changes with the catalogue version, so it is served from the
+    # page cache and browsers revalidate it with ETag/Last-Modified (304 when nothing changed)
+    cacheable = request.method == 'GET' and not search_query and not has_pending_flashes()
+
+    try:
+        version, last_modified = get_catalogue_version() if cacheable else (0, None)
+        cacheable = cacheable and version > 0
+        etag = page_etag(version, sort_by, after, limit) if cacheable else None
+        if cacheable:
+            not_modified = Response()
+            not_modified.set_etag(etag)
+            not_modified.last_modified = last_modified
+            not_modified.cache_control.no_cache = True
+            if not_modified.make_conditional(request).status_code == 304:
+                return not_modified
+
+        success_messages = get_flashed_messages(category_filter=['success'])
+        error_messages = get_flashed_messages(category_filter=['error'])
+        book_grid, next_cursor = render_book_grid(
+            (version, sort_by, after, limit) if cacheable else None, load_page)
+    except ValueError as e:
+        return render_template('error.html', error_code=400, error_message=str(e)), 400
+    except SQLAlchemyError:
+        # Handle database-related errors
+        error_message = 'An unexpected error occurred while accessing the database. Please try again later.'
+        return render_template('error.html', error_code=500, message=error_message), 500
+
+    response = current_app.make_response(render_template(
+        'home.html', book_grid=book_grid, success_message=success_messages, error_message=error_messages,
+        sort_by=sort_by, search_query=search_query, limit=limit, next_cursor=next_cursor, fuzzy=fuzzy))
+    if cacheable:
+        response.set_etag(etag)
+        response.last_modified = last_modified
+        # Browsers may keep the page but must check it is still current before showing it
+        response.cache_control.no_cache = True
+    return response
+
+
+@use_primary
+def add_book():
+    """Add a new book to the library.
+
+    POST Method:
+    If the form data is valid, the book is added to the database, and a success message is displayed.
+    If there are missing fields or an invalid publication year format, an error message is shown.
+
+    GET Method:
+    The 'add_book.html' page is rendered with a dropdown list of authors.
+
+    Returns:
+        For successful book addition (POST), a success message is displayed.
+        For errors (POST) or the 'add_book.html' page (GET), appropriate messages or template is returned.
+    """
+    if request.method == 'POST':
+        isbn = request.form.get('isbn')
+        title = request.form.get('title')
+        publication_year = request.form.get('publication_year')
+        author_id = request.form.get('author_id')
+
+        # Check for missing fields
+        if not isbn or not title or not publication_year or not author_id:
+            error_message = 'Please provide all required fields.'
+            return render_template('add_book.html', error_message=error_message, authors=get_author_choices())
+
+        # Check for invalid year format
+        if not publication_year.isdigit() or len(publication_year) != 4:
+            error_message = 'Invalid publication year format. Please provide a valid year.'
+            return render_template('add_book.html', error_message=error_message, authors=get_author_choices())
+
+        # Convert publication year to an integer
+        publication_year = int(publication_year)
+
+        if find_book_by_isbn(isbn):
+            error_message = f'A book with ISBN {isbn} is already in the library.'
+            return render_template('add_book.html', error_message=error_message, authors=get_author_choices())
+
+        try:
+            # Create a new Book record in the database
+            new_book = Book(isbn=isbn, title=title, publication_year=publication_year, author_id=author_id)
+            db.session.add(new_book)
+            db.session.commit()
+
+            return render_template('add_book.html', message='Book added successfully!', authors=get_author_choices())
+
+        except SQLAlchemyError as e:
+            # Handle database-related errors
+            error_message = 'An unexpected error occurred. Please try again later.'
+            return render_template('add_book.html', error_message=error_message, authors=get_author_choices())
+
+    return render_template('add_book.html', authors=get_author_choices())
+
+
+def book_details(book_id):
+    """
+       Display details of a specific book and its corresponding author.
+
+       Args:
+           book_id (int): The ID of the book to display details for.
+
+       Returns:
+           Renders the 'book_details.html' template with book and author details on success.
+           Displays an error message on unexpected database errors.
+       """
+    try:
+        messages = get_flashed_messages(category_filter=['success'])
+        # Query the Book table to get the book and its corresponding author in one round trip
+        book = get_book_with_author_or_404(book_id, co_authors=True)
+
+        return render_template('book_details.html', book=book, author=book.author, success_message=messages)
+
+    except SQLAlchemyError as e:
+        current_app.logger.exception(e)
+        flash('An unexpected error occurred while processing your request.', 'error')
+        return render_template('book_details.html.html')
+
+
+@use_primary
+def update_book(book_id):
+    """
+    Update book details based on user input.
+
+    Args:
+        book_id (int): The ID of the book to be updated.
+
+    Returns:
+        GET: Renders 'update_book.html' with book and author details.
+        POST: Redirects to the book details page on success, or re-renders the page on error.
+    """
+    book = get_book_with_author_or_404(book_id)
+    author = book.author
+
+    if request.method == 'POST':
+        try:
+            publication_year = request.form['publication_year']
+            rating = request.form['rating']
+
+            if publication_year and not publication_year.isdigit() and len(publication_year) != 4:
+                raise ValueError("Publication year must be numeric.")
+            if rating and not rating.isdigit():
+                raise ValueError("Rating must be numeric.")
+
+            # Checked before the book changes, the query would otherwise flush the changes made so far
+            isbn = request.form['isbn']
+            if find_book_by_isbn(isbn, other_than=book_id):
+                raise ValueError(f'A book with ISBN {isbn} is already in the library.')
+
+            book.title = request.form['title']
+
+            # Handle date fields if there is input
+            if publication_year:
+                book.publication_year = int(publication_year)
+            else:
+                book.publication_year = None
+
+            author.name = request.form['authors']
+
+            # Handle birth_date if there is input
+            birth_date_str = request.form['birth_date']
+            if birth_date_str:
+                author.birth_date = datetime.strptime(birth_date_str, '%Y-%m-%d').date()
+            else:
+                author.birth_date = None
+
+            # Handle death_date if there is input
+            death_date_str = request.form['death_date']
+            if death_date_str:
+                author.death_date = datetime.strptime(death_date_str, '%Y-%m-%d').date()
+            else:
+                author.death_date = None
+
+            book.isbn = isbn
+
+            # Handle rating if there is input
+            if rating:
+                book.rating = int(rating)
+            else:
+                book.rating = None
+
+            book.cover = request.form['cover']
+            book.additional_info = request.form['additional_info']
+
+            db.session.commit()
+
+            flash('Book details have been updated successfully!', 'success')
+            return redirect(url_for('catalogue.book_details', book_id=book_id))
+
+        except ValueError as e:
+            # Handle form validation errors
+            flash(str(e), 'error')
+            return redirect(url_for('catalogue.book_details', book_id=book_id))
+
+        except SQLAlchemyError as e:
+            # Handle SQLAlchemy-related database errors
+            current_app.logger.exception(e)
+            flash('An unexpected database error occurred while updating the book details.', 'error')
+            return redirect(url_for('catalogue.book_details', book_id=book_id))
+
+    return render_template('update_book.html', book=book, author=author)
+
+
+@use_primary
+def delete_book(book_id):
+    """Delete a book from the library.
+
+        Args:
+            book_id (int): The ID of the book to be deleted.
+
+        Returns:
+            After deleting the book, the user is redirected to the home page.
+        """
+    # Get the book and its author in one query
+    book = get_book_with_author_or_404(book_id)
+    title, author_name = book.title, book.author.name
+    try:
+        # Marked as deleted (with its authors, if it was their last book) and purged in the background
+        soft_delete_books([book_id])
+        db.session.commit()
+        queue_purge()
+
+        message = f'The book "{title}" by {author_name} has been successfully deleted.'
+        flash(message, 'success')
+        return redirect(url_for('catalogue.home'))
+
+    except SQLAlchemyError as e:
+        # Handle database-related errors
+        db.session.rollback()  # Roll back the transaction
+        error_message = 'An unexpected error occurred while accessing the database. Please try again later.'
+        current_app.logger.exception(e)
+        flash(error_message, 'error')
+        return redirect(url_for('catalogue.home'))
+
+
+@use_primary
+def delete_books():
+    """Delete the books selected on the home page.
+
+    Returns:
+        A redirect to the home page, with a message saying how many books were deleted.
+    """
+    book_ids = request.form.getlist('book_ids', type=int)
+    if not book_ids:
+        flash('Select the books to delete first.', 'error')
+        return redirect(url_for('catalogue.home'))
+    if len(book_ids) > MAX_PAGE_SIZE:
+        flash(f'At most {MAX_PAGE_SIZE} books can be deleted at once.', 'error')
+        return redirect(url_for('catalogue.home'))
+
+    try:
+        deleted_book_ids, _ = soft_delete_books(book_ids)
+        db.session.commit()
+        queue_purge()
+    except SQLAlchemyError as e:
+        db.session.rollback()
+        current_app.logger.exception(e)
+        flash('An unexpected error occurred while accessing the database. Please try again later.', 'error')
+        return redirect(url_for('catalogue.home'))
+
+    flash(f'{len(deleted_book_ids)} books have been successfully deleted.', 'success')
+    return redirect(url_for('catalogue.home'))
+
+
+@use_primary
+def import_books_upload():
+    """Bulk import books from a CSV or JSON Lines upload, in the background.
+
+    The file can be sent as the 'file' field of a multipart form or as the raw request body.
+    It is saved to disk and imported by a background job, in chunked transactions.
+
+    Returns:
+        202 with the status of the import job, poll its Location for the import report.
+    """
+    upload = request.files.get('file')
+    if upload:
+        stream, filename, mimetype = upload.stream, upload.filename, upload.mimetype
+    else:
+        stream, filename, mimetype = request.stream, '', request.mimetype
+    file_format = request.args.get('format') or guess_format(filename, mimetype)
+    chunk_size = request.args.get('chunk_size', DEFAULT_CHUNK_SIZE, type=int)
+    if file_format not in IMPORT_FORMATS:
+        return jsonify(error=f'Unsupported import format "{file_format}", use csv or jsonl.'), 400
+
+    try:
+        job_id = queue_import(stream, file_format, chunk_size)
+    except OSError as e:
+        current_app.logger.exception(e)
+        return jsonify(error='The upload could not be saved.'), 500
+    except SQLAlchemyError as e:
+        db.session.rollback()
+        current_app.logger.exception(e)
+        return jsonify(error='An unexpected database error occurred while queuing the import.'), 500
+
+    return jsonify(job_status(get_job(job_id))), 202, {'Location': url_for('job_status_view', job_id=job_id)}
+
+
+def export_books():
+    """Download the whole catalogue as CSV or JSON Lines.
+
+    Query parameters:
+        format: 'csv' (default) or 'jsonl'.
+        gzip: '1' to receive a gzip-compressed file.
+
+    Returns:
+        A streamed attachment, rows are read from the database and sent in batches as the
+        client downloads them.
+    """
+    file_format = request.args.get('format', 'csv')
+    compress = request.args.get('gzip') == '1'
+    if file_format not in CONTENT_TYPES:
+        return render_template('error.html', error_code=400, error_message='Unsupported export format.'), 400
+
+    filename = f'library.{file_format}' + ('.gz' if compress else '')
+    mimetype = 'application/gzip' if compress else CONTENT_TYPES[file_format]
+    return Response(stream_with_context(iter_export(file_format, compress)), mimetype=mimetype,
+                    headers={'Content-Disposition': f'attachment; filename={filename}'})
+
+
+def catalogue_stats():
+    """Show the size of the catalogue, its most prolific authors and its books per decade and year."""
+    return render_template('stats.html', stats=get_catalogue_stats())
+
+
+def cover(book_id):
+    """Serve the thumbnail of a book's cover from the local cover cache.
+
+    The 'v' query parameter is the key of the cover URL (see cover_url()), a cached thumbnail
+    is served for it without touching the database, and browsers may keep it for a year. A
+    cover that is not cached yet is fetched by a background job, meanwhile (and for broken
+    covers) a placeholder is served.
+
+    Args:
+        book_id (int): The ID of the book.
+
+    Returns:
+        The thumbnail, or the placeholder image.
+    """
+    key = request.args.get('v')
+    cached = cached_cover(key)
+    if cached is None:
+        cover_source = book_cover(book_id)
+        if cover_source is not None:
+            key = cover_key(cover_source)
+            cached = cached_cover(key)
+            if cached is None:
+                queue_cover_fetch(cover_source)
+
+    if cached is None or not cached[0]:
+        response = current_app.send_static_file(PLACEHOLDER)
+        if cached is None:
+            # Shown until the cover is fetched, the browser has to ask again next time
+            response.cache_control.no_store = True
+        else:
+            response.cache_control.no_cache = None
+            response.cache_control.public = True
+            response.cache_control.max_age = BROKEN_MAX_AGE
+        return response
+
+    path, mimetype = cached
+    if key != request.args.get('v'):
+        # An outdated URL of the book's cover, browsers check with the ETag before reusing it
+        return send_file(path, mimetype=mimetype, max_age=0)
+    response = send_file(path, mimetype=mimetype, max_age=CACHE_MAX_AGE)
+    # The URL names this very cover, it can never show anything else
+    response.cache_control.public = True
+    response.cache_control.immutable = True
+    return response
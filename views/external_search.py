@@ -0,0 +1,133 @@
+import json
+
+from flask import render_template, request, redirect, url_for, flash, jsonify, current_app
+from sqlalchemy.exc import SQLAlchemyError
+
+from data_models import db, Book
+from helpers.api_endpoint import queue_lookup
+from helpers.author_names import split_author_names
+from helpers.enrichment import get_status as get_enrichment_status, start_enrichment
+from helpers.helper_functions import find_book_by_isbn, find_or_create_authors
+from helpers.job_queue import find_latest_job, get_job, job_status
+from helpers.read_replicas import use_primary
+
+
+@use_primary
+def search():
+    """
+        Search for books using the API interface based on user input.
+
+        The lookup runs in a background job, so the request never waits on the external APIs:
+        the form is redirected to a page showing the job, which reloads itself until the job
+        has finished.
+
+        Returns:
+            GET: Renders the 'search_new_book.html' template with the search form, and the
+                 books found by the lookup job given by the 'job' query parameter, if any.
+            POST: Queues the lookup and redirects to its page.
+        """
+    if request.method == 'POST':
+        try:
+            job_id = queue_lookup(request.form['search_query'])
+            return redirect(url_for('external_search.search', job=job_id))
+        except SQLAlchemyError as e:
+            db.session.rollback()
+            current_app.logger.exception(e)
+            flash('An unexpected error occurred while processing your request.', 'error')
+            return render_template('search_new_book.html')
+
+    job_id = request.args.get('job', type=int)
+    job = get_job(job_id) if job_id else None
+    if job is None or job.kind != 'lookup_book':
+        if job_id:
+            flash('This search has expired, please search again.', 'error')
+        return render_template('search_new_book.html')
+
+    if job.state == 'failed':
+        flash(job.error, 'error')
+    # The results are in the job's progress before the ISBNs are all resolved
+    found = json.loads(job.result or job.progress or '{}')
+    books = found.get('books', [])
+    for book in books:
+        book['authors'] = split_author_names(book['authors'] or [])
+
+    # Pass the retrieved data to the template
+    return render_template('search_new_book.html', books=books, pending=job.state in ('queued', 'running'),
+                           search_query=json.loads(job.payload).get('search'))
+
+
+@use_primary
+def add_searched_data():
+    """
+       Add a new book to the library based on searched data.
+
+       Returns:
+           POST: Redirects to the 'home' page on success or error.
+       """
+    if request.method == 'POST':
+        try:
+            isbn = request.form['isbn']
+            title = request.form['title']
+            publication_year = request.form['publication_year']
+            # One field per author, older forms sent a single field with all the names
+            author_names = split_author_names(request.form.getlist('authors'))
+            cover = request.form['cover']
+            additional_info = request.form['additional_info']
+
+            if find_book_by_isbn(isbn):
+                flash(f'The book "{title}" is already in the library.', 'error')
+                return redirect(url_for('catalogue.home'))
+
+            if not author_names:
+                flash(f'The book "{title}" has no author.', 'error')
+                return redirect(url_for('catalogue.home'))
+
+            # Existing authors are matched whatever the spelling of their name, missing ones are
+            # created along with the book
+            author, *co_authors = find_or_create_authors(author_names)
+
+            # Create a new Book record in the database, authors and book are committed together
+            new_book = Book(isbn=isbn, title=title, publication_year=publication_year,
+                            author=author, cover=cover, additional_info=additional_info)
+            new_book.co_authors.extend(co_authors)
+            db.session.add(new_book)
+            db.session.commit()
+
+            message = f'The book "{title}" has been successfully added to the library'
+            flash(message, 'success')
+            return redirect(url_for('catalogue.home'))
+
+        except SQLAlchemyError as e:
+            # Handle SQLAlchemy-related database errors
+            current_app.logger.exception(e)
+            flash('An unexpected database error occurred while adding the book to the library.', 'error')
+
+    return redirect(url_for('catalogue.home'))
+
+
+@use_primary
+def start_book_enrichment():
+    """Queue a background run filling in missing book metadata.
+
+    Query parameters:
+        workers: Concurrent lookups (2 by default, capped at 8).
+        batch_size: Books written back per commit (20 by default, capped at 200).
+
+    Returns:
+        202 with the status of the enrichment job, or 409 with the status of the job already
+        queued or running.
+    """
+    job_id, queued = start_enrichment(workers=request.args.get('workers', 2, type=int),
+                                      batch_size=request.args.get('batch_size', 20, type=int))
+    return (jsonify(job_status(get_job(job_id))), 202 if queued else 409,
+            {'Location': url_for('job_status_view', job_id=job_id)})
+
+
+@use_primary
+def book_enrichment_status():
+    """Report the progress of the current or last enrichment run as JSON."""
+    status = get_enrichment_status()
+    job = find_latest_job('enrich_books')
+    # The run may be handled by another process, its job holds the progress they all see
+    status['job'] = job_status(job) if job else None
+    return jsonify(status)